@@ -1,12 +1,32 @@
 """
 Flask backend API for MarocRail-Optimizer
 """
-from flask import Flask, jsonify, request, render_template
+from flask import Flask, Response, jsonify, request, render_template
 import sqlite3
 import os
-from datetime import datetime
+import json
+import gzip
+import hashlib
+import queue
+import time
+from datetime import datetime, timedelta
 from scripts.optimizer import ScheduleOptimizer
-import joblib
+from scripts.features import transform_one, route_stats_for
+from scripts.delay_quantiles import predict_quantiles, quantile_labels
+from scripts.model_store import load_models, preload_models
+from scripts.partitions import MIN_TIME, MAX_TIME, fetch_newest, partition_union
+from scripts.delay_ingest import InvalidEvent, parse_event, get_writer
+from scripts.snapshots import delay_breakdowns
+from scripts.timecodes import HOUR_SQL, minute_of_day
+from scripts.delay_sketch import DIMENSIONS as SKETCH_DIMENSIONS, DEFAULT_QUANTILES, SKETCH_ALPHA, sketch_quantiles
+from scripts.live_feed import get_live_feed
+from scripts.journey_planner import get_journey_planner
+from scripts.network_matrix import METRICS, get_network_matrix
+from scripts.station_index import DEFAULT_K, MAX_K, get_station_index
+from scripts.search_index import DEFAULT_LIMIT, MAX_LIMIT, TYPES, get_search_index
+from scripts.synthetic import DAYS_OF_WEEK
+from scripts.occupancy import DIMENSIONS, get_occupancy_cube
+from scripts.timeseries import BUCKETS, DEFAULT_MAX_POINTS, MAX_POINTS_LIMIT, delay_timeseries
 
 app = Flask(__name__)
 app.config['JSON_AS_ASCII'] = False
@@ -14,12 +34,426 @@ app.config['JSON_AS_ASCII'] = False
 DB_PATH = os.path.join(os.path.dirname(__file__), 'database', 'marocrail.db')
 MODEL_DIR = os.path.join(os.path.dirname(__file__), 'models')
 
+# Seconds an ingestion request waits for its events to be committed
+# before answering 202 Accepted instead of 201 Created
+INGEST_ACK_TIMEOUT = 1.0
+
+# Hot statements live here so scripts/check_query_plans.py can check the
+# exact SQL the endpoints run. {source} is the delays table or one of its
+# monthly partitions (see scripts/partitions.py).
+
+STATIONS_QUERY = """
+    SELECT station_id, name, city, latitude, longitude, 
+           platform_count, capacity, is_major
+    FROM stations
+    ORDER BY name
+"""
+
+ROUTES_QUERY = """
+    SELECT 
+        r.route_id,
+        r.distance_km,
+        r.typical_duration_minutes,
+        s1.name as origin_name,
+        s1.city as origin_city,
+        s2.name as destination_name,
+        s2.city as destination_city
+    FROM routes r
+    JOIN stations s1 ON r.origin_station_id = s1.station_id
+    JOIN stations s2 ON r.destination_station_id = s2.station_id
+    ORDER BY s1.name, s2.name
+"""
+
+SCHEDULES_QUERY = """
+    SELECT 
+        s.schedule_id,
+        s.departure_time,
+        s.arrival_time,
+        s.platform,
+        s.day_of_week,
+        s.status,
+        t.train_number,
+        t.train_type,
+        t.capacity,
+        st1.name as origin_station,
+        st2.name as destination_station,
+        r.distance_km
+    FROM schedules s
+    JOIN trains t ON s.train_id = t.train_id
+    JOIN routes r ON s.route_id = r.route_id
+    JOIN stations st1 ON r.origin_station_id = st1.station_id
+    JOIN stations st2 ON r.destination_station_id = st2.station_id
+    WHERE s.day_of_week = ?
+"""
+
+SCHEDULE_DETAIL_QUERY = """
+    SELECT 
+        s.schedule_id,
+        s.departure_time,
+        s.arrival_time,
+        s.platform,
+        s.day_of_week,
+        s.status,
+        t.train_id,
+        t.train_number,
+        t.train_type,
+        t.capacity,
+        t.speed_kmh,
+        r.route_id,
+        r.distance_km,
+        r.typical_duration_minutes,
+        st1.station_id as origin_station_id,
+        st1.name as origin_station,
+        st1.city as origin_city,
+        st2.station_id as destination_station_id,
+        st2.name as destination_station,
+        st2.city as destination_city
+    FROM schedules s
+    JOIN trains t ON s.train_id = t.train_id
+    JOIN routes r ON s.route_id = r.route_id
+    JOIN stations st1 ON r.origin_station_id = st1.station_id
+    JOIN stations st2 ON r.destination_station_id = st2.station_id
+    WHERE s.schedule_id = ?
+"""
+
+RECENT_DELAYS_QUERY = """
+    SELECT delay_minutes, delay_reason, weather_condition, timestamp
+    FROM {source}
+    WHERE timestamp >= ? AND timestamp < ? AND schedule_id = ?
+    ORDER BY timestamp DESC
+    LIMIT ?
+"""
+
+DELAYS_QUERY = """
+    SELECT 
+        d.delay_id,
+        d.delay_minutes,
+        d.delay_reason,
+        d.weather_condition,
+        d.timestamp,
+        s.departure_time,
+        t.train_number,
+        st1.name as origin_station,
+        st2.name as destination_station
+    FROM {source} d
+    JOIN schedules s ON d.schedule_id = s.schedule_id
+    JOIN trains t ON s.train_id = t.train_id
+    JOIN routes r ON s.route_id = r.route_id
+    JOIN stations st1 ON r.origin_station_id = st1.station_id
+    JOIN stations st2 ON r.destination_station_id = st2.station_id
+    WHERE d.timestamp >= ? AND d.timestamp < ?
+"""
+
+# Per-partition partial aggregates, merged by DELAY_GROUP_QUERY
+DELAY_GROUP_PARTIAL = """
+    SELECT 
+        {expression} as {name},
+        COUNT(*) as count,
+        SUM(delay_minutes) as total_minutes,
+        MAX(delay_minutes) as max_delay
+    FROM {{source}}
+    WHERE timestamp >= ? AND timestamp < ?
+    GROUP BY {expression}
+"""
+
+DELAY_GROUP_QUERY = """
+    SELECT 
+        {name},
+        SUM(count) as count,
+        SUM(total_minutes) * 1.0 / SUM(count) as avg_delay,
+        MAX(max_delay) as max_delay
+    FROM ({partials})
+    GROUP BY {name}
+    ORDER BY {order}
+"""
+
+# Analytics group -> (grouping expression, output column, sort order)
+DELAY_GROUPS = {
+    'by_reason': ('delay_reason', 'delay_reason', 'count DESC'),
+    'by_hour': (HOUR_SQL, 'hour', 'hour'),
+    'by_weather': ('weather_condition', 'weather_condition', 'count DESC'),
+}
+
+DELAY_TOTALS_PARTIAL = """
+    SELECT COUNT(*) as count, SUM(delay_minutes) as total_minutes
+    FROM {source}
+    WHERE timestamp >= ? AND timestamp < ?
+"""
+
+DELAY_TOTALS_QUERY = """
+    SELECT SUM(count), SUM(total_minutes)
+    FROM (
+        {partials}
+        UNION ALL
+        SELECT SUM(delay_count), SUM(total_delay_minutes) FROM delay_monthly_stats
+    )
+"""
+
+# Per-day totals for /api/analytics/timeseries, read from the trigger-kept
+# daily aggregates (which also cover partitioned and rolled-up months)
+TIMESERIES_QUERY = """
+    SELECT 
+        day,
+        SUM(delay_count) as delay_count,
+        SUM(total_delay_minutes) as total_delay_minutes,
+        MAX(max_delay_minutes) as max_delay
+    FROM delay_daily_stats
+    WHERE day >= ? AND day < ?
+"""
+
+# Route KPIs from the trigger-kept route_kpis / route_delay_histogram tables
+# and delay_daily_stats, so no request reads raw delays
+ROUTE_KPIS_QUERY = """
+    SELECT 
+        k.route_id,
+        s1.name as origin_station,
+        s2.name as destination_station,
+        r.distance_km,
+        k.schedule_count as total_schedules,
+        k.delay_count as total_delays,
+        ROUND(k.total_delay_minutes * 1.0 / NULLIF(k.delay_count, 0), 2) as avg_delay_minutes,
+        k.max_delay_minutes
+    FROM route_kpis k
+    JOIN routes r ON k.route_id = r.route_id
+    JOIN stations s1 ON r.origin_station_id = s1.station_id
+    JOIN stations s2 ON r.destination_station_id = s2.station_id
+"""
+
+# Nearest-rank median and p95 of each route's delay histogram
+ROUTE_PERCENTILES_QUERY = """
+    SELECT 
+        route_id,
+        MIN(CASE WHEN running >= 0.5 * total THEN delay_minutes END) as p50_delay_minutes,
+        MIN(CASE WHEN running >= 0.95 * total THEN delay_minutes END) as p95_delay_minutes
+    FROM (
+        SELECT 
+            route_id,
+            delay_minutes,
+            SUM(delay_count) OVER (PARTITION BY route_id ORDER BY delay_minutes) as running,
+            SUM(delay_count) OVER (PARTITION BY route_id) as total
+        FROM route_delay_histogram
+        {where}
+    )
+    GROUP BY route_id
+"""
+
+ROUTE_WINDOW_QUERY = """
+    SELECT 
+        route_id,
+        SUM(delay_count) as delays,
+        SUM(total_delay_minutes) as total_minutes,
+        MAX(max_delay_minutes) as max_delay_minutes
+    FROM delay_daily_stats
+    WHERE day >= ? AND day < ?
+"""
+
+# First and last day with delays (two lookups on the primary key)
+STATS_DAYS_QUERY = """
+    SELECT (SELECT MIN(day) FROM delay_daily_stats), (SELECT MAX(day) FROM delay_daily_stats)
+"""
+
+# Rolling windows of /api/analytics/routes, in days
+ROUTE_KPI_WINDOWS = (7, 30)
+
+# Merged delay sketches (see scripts/delay_sketch.py), optionally per group
+SKETCH_QUERY = """
+    SELECT {columns}bucket, SUM(delay_count) as delay_count
+    FROM delay_sketches
+    {where}
+    GROUP BY {columns}bucket
+    ORDER BY {columns}bucket
+"""
+
+# Rows of each table on the dashboard, and how long its bootstrap payload
+# is reused (seconds)
+DASHBOARD_ROWS = 10
+BOOTSTRAP_MAX_AGE = 5
+_bootstrap_cache = {}
+
+# Load models at import time, i.e. in the gunicorn master when preload_app
+# is on, so forked workers share them (see gunicorn.conf.py)
+if os.environ.get('PRELOAD_MODELS') == '1':
+    get_occupancy_cube(DB_PATH)
+    get_journey_planner(DB_PATH)
+    get_network_matrix(DB_PATH)
+    get_station_index(DB_PATH)
+    get_search_index(DB_PATH)
+    preload_models(MODEL_DIR)
+
 def get_db():
     """Get database connection"""
     conn = sqlite3.connect(DB_PATH)
     conn.row_factory = sqlite3.Row
     return conn
 
+def date_range_args():
+    """Optional ?start=YYYY-MM-DD&end=YYYY-MM-DD bounds (end exclusive)
+
+    Raises ValueError on a malformed date.
+    """
+    bounds = []
+    for name in ('start', 'end'):
+        value = request.args.get(name)
+        if value:
+            datetime.strptime(value, '%Y-%m-%d')
+        bounds.append(value or None)
+    return bounds
+
+def int_arg(name, low=None, high=None):
+    """Optional integer query argument, None when absent
+
+    Raises ValueError on a value that is not an integer or lies outside
+    [low, high].
+    """
+    value = request.args.get(name)
+    if value is None or value == '':
+        return None
+    value = int(value)
+    if (low is not None and value < low) or (high is not None and value > high):
+        raise ValueError
+    return value
+
+def schedules_query(day, route_id=None, status=None, limit=100):
+    """SQL and parameters for the filtered schedule listing"""
+    query = SCHEDULES_QUERY
+    params = [day]
+    
+    if route_id:
+        query += " AND s.route_id = ?"
+        params.append(route_id)
+    
+    if status:
+        query += " AND s.status = ?"
+        params.append(status)
+    
+    query += " ORDER BY s.departure_minute LIMIT ?"
+    params.append(limit)
+    return query, params
+
+def delays_query(reason=None):
+    """Newest-first delay listing for one partition (see fetch_newest)"""
+    query = DELAYS_QUERY
+    if reason:
+        query += " AND d.delay_reason = ?"
+    return query + " ORDER BY d.timestamp DESC LIMIT ?"
+
+def delay_group_query(conn, group, start=None, end=None):
+    """SQL and parameters for one delay analytics breakdown"""
+    expression, name, order = DELAY_GROUPS[group]
+    partial = DELAY_GROUP_PARTIAL.format(expression=expression, name=name)
+    partials, params = partition_union(conn, 'delays', partial, start, end)
+    return DELAY_GROUP_QUERY.format(partials=partials, name=name, order=order), params
+
+def delay_totals_query(conn):
+    """SQL and parameters for the delay count and total minutes of all history"""
+    partials, params = partition_union(conn, 'delays', DELAY_TOTALS_PARTIAL)
+    return DELAY_TOTALS_QUERY.format(partials=partials), params
+
+def timeseries_query(start=None, end=None, route_id=None, reason=None, station_id=None):
+    """SQL and parameters for the filtered per-day delay totals"""
+    query = TIMESERIES_QUERY
+    params = [start or MIN_TIME, end or MAX_TIME]
+    
+    if route_id:
+        query += " AND route_id = ?"
+        params.append(route_id)
+    
+    if reason:
+        query += " AND delay_reason = ?"
+        params.append(reason)
+    
+    if station_id:
+        query += """ AND route_id IN (
+            SELECT route_id FROM routes WHERE origin_station_id = ?
+            UNION SELECT route_id FROM routes WHERE destination_station_id = ?)"""
+        params += [station_id, station_id]
+    
+    query += " GROUP BY day ORDER BY day"
+    return query, params
+
+def route_kpis_query(route_id=None):
+    """SQL and parameters for the route KPI totals, optionally of one route"""
+    if route_id:
+        return ROUTE_KPIS_QUERY + " WHERE k.route_id = ?", [route_id]
+    return ROUTE_KPIS_QUERY + " ORDER BY k.route_id", []
+
+def route_percentiles_query(route_id=None):
+    """SQL and parameters for the route delay percentiles"""
+    if route_id:
+        return ROUTE_PERCENTILES_QUERY.format(where="WHERE route_id = ?"), [route_id]
+    return ROUTE_PERCENTILES_QUERY.format(where=""), []
+
+def route_window_query(start, end, route_id=None):
+    """SQL and parameters for per-route delay totals of days in [start, end)"""
+    query = ROUTE_WINDOW_QUERY
+    params = [start, end]
+    
+    if route_id:
+        query += " AND route_id = ?"
+        params.append(route_id)
+    
+    return query + " GROUP BY route_id", params
+
+def delay_rate(delays, schedule_count, days):
+    """Delays per 100 departures of a weekly timetable over a number of days"""
+    departures = schedule_count * days / 7
+    return round(delays * 100.0 / departures, 2) if departures else None
+
+def sketch_query(group_by=None, route_id=None, hour=None, reason=None):
+    """SQL and parameters merging the delay sketches of a slice, per group_by value"""
+    conditions, params = [], []
+    for column, value in (('route_id', route_id), ('hour', hour), ('delay_reason', reason)):
+        if value is not None:
+            conditions.append(f"{column} = ?")
+            params.append(value)
+    
+    columns = f"{SKETCH_DIMENSIONS[group_by]}, " if group_by else ""
+    where = "WHERE " + " AND ".join(conditions) if conditions else ""
+    return SKETCH_QUERY.format(columns=columns, where=where), params
+
+def overview_data(conn):
+    """Network totals, delay count and on-time rate for the overview"""
+    cursor = conn.cursor()
+    
+    cursor.execute("SELECT COUNT(*) FROM stations")
+    total_stations = cursor.fetchone()[0]
+    
+    cursor.execute("SELECT COUNT(*) FROM routes")
+    total_routes = cursor.fetchone()[0]
+    
+    cursor.execute("SELECT COUNT(*) FROM trains")
+    total_trains = cursor.fetchone()[0]
+    
+    cursor.execute("SELECT COUNT(*) FROM schedules")
+    total_schedules = cursor.fetchone()[0]
+    
+    # Retained delay rows plus months already rolled up by the retention policy
+    cursor.execute(*delay_totals_query(conn))
+    total_delays, total_minutes = cursor.fetchone()
+    avg_delay = total_minutes / total_delays if total_delays else None
+    
+    on_time_rate = ((total_schedules * 7 - total_delays) / (total_schedules * 7)) * 100
+    
+    return {
+        'total_stations': total_stations,
+        'total_routes': total_routes,
+        'total_trains': total_trains,
+        'total_schedules': total_schedules,
+        'total_delays': total_delays,
+        'avg_delay_minutes': round(avg_delay, 2) if avg_delay else 0,
+        'on_time_rate': round(on_time_rate, 2)
+    }
+
+def window_kpis(row, schedule_count, days):
+    """Delay figures of one rolling window"""
+    delays = row['delays'] if row else 0
+    return {
+        'delays': delays,
+        'delay_rate': delay_rate(delays, schedule_count, days),
+        'avg_delay_minutes': round(row['total_minutes'] / delays, 2) if delays else None,
+        'max_delay_minutes': row['max_delay_minutes'] if row else None
+    }
+
 @app.route('/')
 def index():
     """Home page"""
@@ -51,12 +485,7 @@ def get_stations():
     conn = get_db()
     cursor = conn.cursor()
     
-    cursor.execute("""
-        SELECT station_id, name, city, latitude, longitude, 
-               platform_count, capacity, is_major
-        FROM stations
-        ORDER BY name
-    """)
+    cursor.execute(STATIONS_QUERY)
     
     stations = [dict(row) for row in cursor.fetchall()]
     conn.close()
@@ -67,26 +496,63 @@ def get_stations():
         'data': stations
     })
 
+@app.route('/api/stations/nearby', methods=['GET'])
+def get_nearby_stations():
+    """Get the k stations nearest to a point, optionally within radius_km"""
+    try:
+        lat = float(request.args['lat'])
+        lon = float(request.args['lon'])
+    except (KeyError, ValueError):
+        return jsonify({'success': False, 'error': 'lat and lon are required numbers'}), 400
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        return jsonify({'success': False, 'error': 'lat must be within [-90, 90] and lon within [-180, 180]'}), 400
+    
+    try:
+        k = int(request.args.get('k', DEFAULT_K))
+        radius_km = request.args.get('radius_km')
+        radius_km = float(radius_km) if radius_km else None
+    except ValueError:
+        return jsonify({'success': False, 'error': 'k must be an integer and radius_km a number'}), 400
+    if not 1 <= k <= MAX_K or (radius_km is not None and radius_km <= 0):
+        return jsonify({'success': False, 'error': f'k must be between 1 and {MAX_K} and radius_km positive'}), 400
+    
+    stations = get_station_index(DB_PATH).nearest(lat, lon, k, radius_km)
+    return jsonify({
+        'success': True,
+        'count': len(stations),
+        'data': stations
+    })
+
+@app.route('/api/search', methods=['GET'])
+def search():
+    """Autocomplete stations, cities, routes and train numbers; matching
+    ignores case and accents and tolerates typos"""
+    query = request.args.get('q', '')
+    types = [t for t in request.args.get('types', ','.join(TYPES)).split(',') if t]
+    if not types or any(t not in TYPES for t in types):
+        return jsonify({'success': False, 'error': f"types must be among {', '.join(TYPES)}"}), 400
+    try:
+        limit = int(request.args.get('limit', DEFAULT_LIMIT))
+    except ValueError:
+        limit = 0
+    if not 1 <= limit <= MAX_LIMIT:
+        return jsonify({'success': False, 'error': f'limit must be between 1 and {MAX_LIMIT}'}), 400
+    
+    results = get_search_index(DB_PATH).search(query, limit, types)
+    return jsonify({
+        'success': True,
+        'query': query,
+        'count': len(results),
+        'data': results
+    })
+
 @app.route('/api/routes', methods=['GET'])
 def get_routes():
     """Get all routes"""
     conn = get_db()
     cursor = conn.cursor()
     
-    cursor.execute("""
-        SELECT 
-            r.route_id,
-            r.distance_km,
-            r.typical_duration_minutes,
-            s1.name as origin_name,
-            s1.city as origin_city,
-            s2.name as destination_name,
-            s2.city as destination_city
-        FROM routes r
-        JOIN stations s1 ON r.origin_station_id = s1.station_id
-        JOIN stations s2 ON r.destination_station_id = s2.station_id
-        ORDER BY s1.name, s2.name
-    """)
+    cursor.execute(ROUTES_QUERY)
     
     routes = [dict(row) for row in cursor.fetchall()]
     conn.close()
@@ -97,6 +563,62 @@ def get_routes():
         'data': routes
     })
 
+@app.route('/api/network/matrix', methods=['GET'])
+def get_network_matrix_data():
+    """Get all-pairs shortest distance and duration between stations,
+    optionally for some origins (from) and destinations (to)"""
+    metrics = [m for m in request.args.get('metric', ','.join(METRICS)).split(',') if m]
+    unknown = [m for m in metrics if m not in METRICS]
+    if unknown or not metrics:
+        return jsonify({'success': False, 'error': f"metric must be one of {', '.join(METRICS)}"}), 400
+    
+    selection = {}
+    for name in ('from', 'to'):
+        value = request.args.get(name)
+        if value:
+            try:
+                selection[name] = [int(v) for v in value.split(',')]
+            except ValueError:
+                return jsonify({'success': False, 'error': f'{name} must be comma-separated station ids'}), 400
+    
+    matrix = get_network_matrix(DB_PATH)
+    cached = None if selection else matrix.payloads.get(tuple(metrics))
+    if cached is None:
+        try:
+            rows = matrix.positions(selection['from']) if 'from' in selection else None
+            columns = matrix.positions(selection['to']) if 'to' in selection else None
+        except KeyError as e:
+            return jsonify({'success': False, 'error': f'Station not found: {e.args[0]}'}), 404
+        
+        def stations(positions):
+            positions = range(len(matrix.names)) if positions is None else positions
+            return [{'station_id': int(matrix.station_ids[i]), 'name': matrix.names[i]} for i in positions]
+        
+        payload = {
+            'success': True,
+            'method': matrix.method,
+            'built_at': matrix.built_at,
+            'origins': stations(rows),
+            'destinations': stations(columns)
+        }
+        for metric in metrics:
+            _, unit = METRICS[metric]
+            payload[f'{metric}_{unit}'] = matrix.submatrix(metric, rows, columns)
+        # One origin and one destination: also spell out the shortest paths
+        if rows and columns and len(rows) == len(columns) == 1:
+            payload['paths'] = {metric: stations(matrix.path(metric, rows[0], columns[0]) or [])
+                                for metric in metrics}
+        
+        body = app.json.dumps(payload).encode('utf-8')
+        cached = {'etag': hashlib.sha1(body).hexdigest(), 'body': body}
+        # Full matrices are kept until the next rebuild
+        if not selection:
+            matrix.payloads[tuple(metrics)] = cached
+    
+    response = app.response_class(cached['body'], mimetype='application/json')
+    response.set_etag(cached['etag'])
+    return response.make_conditional(request)
+
 @app.route('/api/schedules', methods=['GET'])
 def get_schedules():
     """Get schedules with filters"""
@@ -107,41 +629,7 @@ def get_schedules():
     conn = get_db()
     cursor = conn.cursor()
     
-    query = """
-        SELECT 
-            s.schedule_id,
-            s.departure_time,
-            s.arrival_time,
-            s.platform,
-            s.day_of_week,
-            s.status,
-            t.train_number,
-            t.train_type,
-            t.capacity,
-            st1.name as origin_station,
-            st2.name as destination_station,
-            r.distance_km
-        FROM schedules s
-        JOIN trains t ON s.train_id = t.train_id
-        JOIN routes r ON s.route_id = r.route_id
-        JOIN stations st1 ON r.origin_station_id = st1.station_id
-        JOIN stations st2 ON r.destination_station_id = st2.station_id
-        WHERE s.day_of_week = ?
-    """
-    
-    params = [day]
-    
-    if route_id:
-        query += " AND s.route_id = ?"
-        params.append(route_id)
-    
-    if status:
-        query += " AND s.status = ?"
-        params.append(status)
-    
-    query += " ORDER BY s.departure_time LIMIT 100"
-    
-    cursor.execute(query, params)
+    cursor.execute(*schedules_query(day, route_id, status))
     schedules = [dict(row) for row in cursor.fetchall()]
     conn.close()
     
@@ -158,35 +646,7 @@ def get_schedule_detail(schedule_id):
     conn = get_db()
     cursor = conn.cursor()
     
-    cursor.execute("""
-        SELECT 
-            s.schedule_id,
-            s.departure_time,
-            s.arrival_time,
-            s.platform,
-            s.day_of_week,
-            s.status,
-            t.train_id,
-            t.train_number,
-            t.train_type,
-            t.capacity,
-            t.speed_kmh,
-            r.route_id,
-            r.distance_km,
-            r.typical_duration_minutes,
-            st1.station_id as origin_station_id,
-            st1.name as origin_station,
-            st1.city as origin_city,
-            st2.station_id as destination_station_id,
-            st2.name as destination_station,
-            st2.city as destination_city
-        FROM schedules s
-        JOIN trains t ON s.train_id = t.train_id
-        JOIN routes r ON s.route_id = r.route_id
-        JOIN stations st1 ON r.origin_station_id = st1.station_id
-        JOIN stations st2 ON r.destination_station_id = st2.station_id
-        WHERE s.schedule_id = ?
-    """, (schedule_id,))
+    cursor.execute(SCHEDULE_DETAIL_QUERY, (schedule_id,))
     
     schedule = cursor.fetchone()
     
@@ -196,15 +656,8 @@ def get_schedule_detail(schedule_id):
     
     schedule_data = dict(schedule)
     
-    cursor.execute("""
-        SELECT delay_minutes, delay_reason, weather_condition, timestamp
-        FROM delays
-        WHERE schedule_id = ?
-        ORDER BY timestamp DESC
-        LIMIT 10
-    """, (schedule_id,))
-    
-    delays = [dict(row) for row in cursor.fetchall()]
+    rows = fetch_newest(conn, 'delays', RECENT_DELAYS_QUERY, [schedule_id], 10)
+    delays = [dict(row) for row in rows]
     schedule_data['recent_delays'] = delays
     
     conn.close()
@@ -214,44 +667,70 @@ def get_schedule_detail(schedule_id):
         'data': schedule_data
     })
 
+@app.route('/api/journeys', methods=['GET'])
+def plan_journey():
+    """Plan a journey between stations (ids, names or cities), changing
+    trains where needed; profile=1 lists every worthwhile departure"""
+    day = request.args.get('day', datetime.now().strftime('%A'))
+    if day not in DAYS_OF_WEEK:
+        return jsonify({'success': False, 'error': f"day must be one of {', '.join(DAYS_OF_WEEK)}"}), 400
+    
+    times = {}
+    for name, default in (('depart_after', '00:00'), ('depart_before', '23:59')):
+        value = request.args.get(name, default)
+        try:
+            datetime.strptime(value, '%H:%M')
+        except ValueError:
+            return jsonify({'success': False, 'error': f'{name} must be HH:MM'}), 400
+        times[name] = minute_of_day(value)
+    
+    if not request.args.get('from') or not request.args.get('to'):
+        return jsonify({'success': False, 'error': 'from and to are required'}), 400
+    
+    planner = get_journey_planner(DB_PATH)
+    try:
+        sources = planner.resolve(request.args['from'])
+        targets = planner.resolve(request.args['to'])
+        # Alternatives: via=Fès,Rabat changes at Fès or at Rabat
+        via = [planner.resolve(v) for v in request.args.get('via', '').split(',') if v.strip()]
+    except KeyError as e:
+        return jsonify({'success': False, 'error': f'Station not found: {e.args[0]}'}), 404
+    if set(sources) & set(targets):
+        return jsonify({'success': False, 'error': 'from and to are the same station'}), 400
+    
+    if request.args.get('profile') == '1':
+        if via:
+            return jsonify({'success': False, 'error': 'via is not supported with profile=1'}), 400
+        found = planner.profile(day, sources, targets, times['depart_after'], times['depart_before'])
+        return jsonify({
+            'success': True,
+            'count': len(found),
+            'data': [planner.describe(day, legs) for _, _, legs in found]
+        })
+    
+    legs = planner.journey(day, sources, targets, times['depart_after'], via)
+    return jsonify({
+        'success': True,
+        'data': planner.describe(day, legs) if legs else None
+    })
+
 @app.route('/api/delays', methods=['GET'])
 def get_delays():
     """Get delay statistics"""
     reason = request.args.get('reason')
     limit = int(request.args.get('limit', 50))
     
-    conn = get_db()
-    cursor = conn.cursor()
-    
-    query = """
-        SELECT 
-            d.delay_id,
-            d.delay_minutes,
-            d.delay_reason,
-            d.weather_condition,
-            d.timestamp,
-            s.departure_time,
-            t.train_number,
-            st1.name as origin_station,
-            st2.name as destination_station
-        FROM delays d
-        JOIN schedules s ON d.schedule_id = s.schedule_id
-        JOIN trains t ON s.train_id = t.train_id
-        JOIN routes r ON s.route_id = r.route_id
-        JOIN stations st1 ON r.origin_station_id = st1.station_id
-        JOIN stations st2 ON r.destination_station_id = st2.station_id
-    """
-    
-    params = []
-    if reason:
-        query += " WHERE d.delay_reason = ?"
-        params.append(reason)
+    try:
+        start, end = date_range_args()
+    except ValueError:
+        return jsonify({'success': False, 'error': 'Dates must be YYYY-MM-DD'}), 400
     
-    query += " ORDER BY d.timestamp DESC LIMIT ?"
-    params.append(limit)
+    conn = get_db()
     
-    cursor.execute(query, params)
-    delays = [dict(row) for row in cursor.fetchall()]
+    # Newest partitions first; older months are only read if still short of `limit`
+    rows = fetch_newest(conn, 'delays', delays_query(reason), [reason] if reason else [],
+                        limit, start, end)
+    delays = [dict(row) for row in rows]
     conn.close()
     
     return jsonify({
@@ -260,101 +739,342 @@ def get_delays():
         'data': delays
     })
 
+def read_delay_events():
+    """Delay events from the request body: a JSON object, a JSON list or NDJSON lines"""
+    if request.mimetype == 'application/x-ndjson':
+        events = []
+        for number, line in enumerate(request.get_data(as_text=True).splitlines(), 1):
+            if not line.strip():
+                continue
+            try:
+                events.append(json.loads(line))
+            except ValueError:
+                raise InvalidEvent(f"line {number}: invalid JSON")
+        return events
+    
+    data = request.get_json(silent=True)
+    if data is None:
+        raise InvalidEvent("body must be JSON or NDJSON (application/x-ndjson)")
+    return data if isinstance(data, list) else [data]
+
+@app.route('/api/delays', methods=['POST'])
+def ingest_delays():
+    """Record delay events through the batched writer"""
+    try:
+        events = read_delay_events()
+        rows = []
+        for number, event in enumerate(events, 1):
+            try:
+                rows.append(parse_event(event))
+            except InvalidEvent as e:
+                raise InvalidEvent(f"event {number}: {e}")
+        if not rows:
+            raise InvalidEvent("no delay events")
+        submission = get_writer(DB_PATH).submit(rows)
+    except InvalidEvent as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except queue.Full:
+        response = jsonify({'success': False, 'error': 'Ingestion queue is full, retry later'})
+        response.headers['Retry-After'] = '1'
+        return response, 503
+    
+    if not submission.wait(INGEST_ACK_TIMEOUT):
+        return jsonify({'success': True, 'status': 'queued', 'count': len(rows)}), 202
+    
+    if submission.write_failed:
+        response = jsonify({'success': False, 'error': submission.error})
+        response.headers['Retry-After'] = '1'
+        return response, 503
+    if submission.error:
+        return jsonify({'success': False, 'error': submission.error}), 400
+    
+    return jsonify({
+        'success': True,
+        'status': 'stored',
+        'count': len(rows),
+        'delay_ids': submission.delay_ids
+    }), 201
+
 @app.route('/api/analytics/delays', methods=['GET'])
 def get_delay_analytics():
     """Get delay analytics"""
+    try:
+        start, end = date_range_args()
+    except ValueError:
+        return jsonify({'success': False, 'error': 'Dates must be YYYY-MM-DD'}), 400
+    
+    # ?source=snapshot scans the memory-mapped columnar snapshot instead of SQL
+    if request.args.get('source') == 'snapshot':
+        try:
+            data, snapshot_time = delay_breakdowns(start, end)
+        except FileNotFoundError as e:
+            return jsonify({'success': False, 'error': str(e)}), 404
+        return jsonify({
+            'success': True,
+            'data': data,
+            'snapshot_time': snapshot_time
+        })
+    
     conn = get_db()
     cursor = conn.cursor()
     
-    cursor.execute("""
-        SELECT 
-            delay_reason,
-            COUNT(*) as count,
-            AVG(delay_minutes) as avg_delay,
-            MAX(delay_minutes) as max_delay
-        FROM delays
-        GROUP BY delay_reason
-        ORDER BY count DESC
-    """)
-    
-    by_reason = [dict(row) for row in cursor.fetchall()]
-    
-    cursor.execute("""
-        SELECT 
-            strftime('%H', timestamp) as hour,
-            COUNT(*) as count,
-            AVG(delay_minutes) as avg_delay
-        FROM delays
-        GROUP BY hour
-        ORDER BY hour
-    """)
+    data = {}
+    for group in DELAY_GROUPS:
+        cursor.execute(*delay_group_query(conn, group, start, end))
+        data[group] = [dict(row) for row in cursor.fetchall()]
     
-    by_hour = [dict(row) for row in cursor.fetchall()]
+    conn.close()
     
-    cursor.execute("""
-        SELECT 
-            weather_condition,
-            COUNT(*) as count,
-            AVG(delay_minutes) as avg_delay
-        FROM delays
-        GROUP BY weather_condition
-        ORDER BY count DESC
-    """)
+    return jsonify({
+        'success': True,
+        'data': data
+    })
+
+@app.route('/api/analytics/delays/percentiles', methods=['GET'])
+def get_delay_percentiles():
+    """Get approximate delay percentiles from the mergeable delay sketches"""
+    group_by = request.args.get('group_by') or None
+    if group_by and group_by not in SKETCH_DIMENSIONS:
+        return jsonify({'success': False,
+                        'error': f"group_by must be one of: {', '.join(SKETCH_DIMENSIONS)}"}), 400
     
-    by_weather = [dict(row) for row in cursor.fetchall()]
+    try:
+        quantiles = [float(q) for q in request.args.get('q', '').split(',') if q] or DEFAULT_QUANTILES
+        if not all(0 <= q <= 1 for q in quantiles):
+            raise ValueError
+    except ValueError:
+        return jsonify({'success': False, 'error': 'q must be comma-separated numbers between 0 and 1'}), 400
+    
+    try:
+        route_id = int_arg('route_id')
+        hour = int_arg('hour', 0, 23)
+    except ValueError:
+        return jsonify({'success': False, 'error': 'route_id must be an integer and hour an integer from 0 to 23'}), 400
     
+    conn = get_db()
+    rows = conn.execute(*sketch_query(group_by, route_id, hour, request.args.get('reason'))).fetchall()
     conn.close()
     
+    # Rows come ordered by group, then bucket
+    groups = {}
+    for row in rows:
+        key = row[0] if group_by else None
+        groups.setdefault(key, []).append((row['bucket'], row['delay_count']))
+    
+    data = []
+    for key, buckets in groups.items():
+        item = {group_by: key} if group_by else {}
+        item['delay_count'] = sum(count for _, count in buckets)
+        for q, value in sketch_quantiles(buckets, quantiles).items():
+            item[f"p{q * 100:g}"] = value
+        data.append(item)
+    
     return jsonify({
         'success': True,
-        'data': {
-            'by_reason': by_reason,
-            'by_hour': by_hour,
-            'by_weather': by_weather
-        }
+        'relative_error': SKETCH_ALPHA,
+        'data': data
     })
 
-@app.route('/api/analytics/overview', methods=['GET'])
-def get_overview():
-    """Get overview statistics"""
+@app.route('/api/analytics/timeseries', methods=['GET'])
+def get_delay_timeseries():
+    """Get delay totals over time in day, week or month buckets"""
+    bucket = request.args.get('bucket', 'day')
+    if bucket not in BUCKETS:
+        return jsonify({'success': False, 'error': f"bucket must be one of: {', '.join(BUCKETS)}"}), 400
+    
+    try:
+        start, end = date_range_args()
+    except ValueError:
+        return jsonify({'success': False, 'error': 'Dates must be YYYY-MM-DD'}), 400
+    
+    max_points = request.args.get('max_points', DEFAULT_MAX_POINTS, type=int)
+    if not max_points or not 1 <= max_points <= MAX_POINTS_LIMIT:
+        return jsonify({'success': False, 'error': f'max_points must be between 1 and {MAX_POINTS_LIMIT}'}), 400
+    
     conn = get_db()
-    cursor = conn.cursor()
+    rows = conn.execute(*timeseries_query(
+        start, end,
+        request.args.get('route_id', type=int),
+        request.args.get('reason'),
+        request.args.get('station_id', type=int)
+    )).fetchall()
+    conn.close()
     
-    cursor.execute("SELECT COUNT(*) FROM stations")
-    total_stations = cursor.fetchone()[0]
+    points, span = delay_timeseries(rows, bucket, max_points)
     
-    cursor.execute("SELECT COUNT(*) FROM routes")
-    total_routes = cursor.fetchone()[0]
+    return jsonify({
+        'success': True,
+        'bucket': bucket,
+        'span': span,
+        'count': len(points),
+        'data': points
+    })
+
+@app.route('/api/analytics/routes', methods=['GET'])
+def get_route_kpis():
+    """Get per-route delay KPIs with rolling 7- and 30-day windows"""
+    route_id = request.args.get('route_id', type=int)
+    as_of = request.args.get('as_of')
+    if as_of:
+        try:
+            datetime.strptime(as_of, '%Y-%m-%d')
+        except ValueError:
+            return jsonify({'success': False, 'error': 'as_of must be YYYY-MM-DD'}), 400
     
-    cursor.execute("SELECT COUNT(*) FROM trains")
-    total_trains = cursor.fetchone()[0]
+    conn = get_db()
+    kpis = [dict(row) for row in conn.execute(*route_kpis_query(route_id))]
+    if route_id and not kpis:
+        conn.close()
+        return jsonify({'success': False, 'error': 'Route not found'}), 404
     
-    cursor.execute("SELECT COUNT(*) FROM schedules")
-    total_schedules = cursor.fetchone()[0]
+    percentiles = {row['route_id']: row for row in
+                   conn.execute(*route_percentiles_query(route_id))}
     
-    cursor.execute("SELECT COUNT(*) FROM delays")
-    total_delays = cursor.fetchone()[0]
+    # Windows end with the latest day that has delays unless as_of is given
+    first_day, last_day = conn.execute(STATS_DAYS_QUERY).fetchone()
+    history_days = (datetime.strptime(last_day, '%Y-%m-%d') -
+                    datetime.strptime(first_day, '%Y-%m-%d')).days + 1 if first_day else 0
+    as_of = as_of or last_day
+    windows = {}
+    if as_of:
+        end = (datetime.strptime(as_of, '%Y-%m-%d') + timedelta(days=1)).strftime('%Y-%m-%d')
+        for days in ROUTE_KPI_WINDOWS:
+            start = (datetime.strptime(end, '%Y-%m-%d') - timedelta(days=days)).strftime('%Y-%m-%d')
+            windows[days] = {row['route_id']: row for row in
+                             conn.execute(*route_window_query(start, end, route_id))}
+    conn.close()
     
-    cursor.execute("SELECT AVG(delay_minutes) FROM delays")
-    avg_delay = cursor.fetchone()[0]
+    for route in kpis:
+        route['delay_rate'] = delay_rate(route['total_delays'], route['total_schedules'], history_days)
+        quantiles = percentiles.get(route['route_id'])
+        route['p50_delay_minutes'] = quantiles['p50_delay_minutes'] if quantiles else None
+        route['p95_delay_minutes'] = quantiles['p95_delay_minutes'] if quantiles else None
+        for days, rows in windows.items():
+            route[f'last_{days}_days'] = window_kpis(rows.get(route['route_id']),
+                                                     route['total_schedules'], days)
     
-    on_time_rate = ((total_schedules * 7 - total_delays) / (total_schedules * 7)) * 100
+    return jsonify({
+        'success': True,
+        'as_of': as_of,
+        'count': len(kpis),
+        'data': kpis
+    })
+
+@app.route('/api/analytics/occupancy', methods=['GET'])
+def get_occupancy():
+    """Get passengers, trips and load factor, grouped and filtered by
+    route, hour, day of week (Sunday=0) and month"""
+    group_by = [d for d in request.args.get('group_by', '').split(',') if d]
+    
+    filters = {}
+    for dimension in DIMENSIONS:
+        name = 'route_id' if dimension == 'route' else dimension
+        value = request.args.get(name)
+        if value:
+            try:
+                filters[dimension] = [int(v) for v in value.split(',')]
+            except ValueError:
+                return jsonify({'success': False, 'error': f'{name} must be comma-separated integers'}), 400
     
+    cube = get_occupancy_cube(DB_PATH)
+    try:
+        data = cube.query(group_by, filters)
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    
+    return jsonify({
+        'success': True,
+        'group_by': group_by,
+        'records': cube.records,
+        'updated_at': cube.updated_at,
+        'data': data
+    })
+
+@app.route('/api/stream/dashboard', methods=['GET'])
+def stream_dashboard():
+    """Server-sent events with dashboard deltas: new delays, changed KPIs
+    and schedule status changes"""
+    feed = get_live_feed(DB_PATH)
+    try:
+        subscriber, first = feed.subscribe()
+    except queue.Full:
+        response = jsonify({'success': False, 'error': 'Too many open streams, retry later'})
+        response.headers['Retry-After'] = '30'
+        return response, 503
+    
+    def events():
+        try:
+            yield from subscriber.messages(first)
+        finally:
+            feed.unsubscribe(subscriber)
+    
+    return Response(events(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
+@app.route('/api/analytics/overview', methods=['GET'])
+def get_overview():
+    """Get overview statistics"""
+    conn = get_db()
+    data = overview_data(conn)
     conn.close()
     
     return jsonify({
         'success': True,
-        'data': {
-            'total_stations': total_stations,
-            'total_routes': total_routes,
-            'total_trains': total_trains,
-            'total_schedules': total_schedules,
-            'total_delays': total_delays,
-            'avg_delay_minutes': round(avg_delay, 2) if avg_delay else 0,
-            'on_time_rate': round(on_time_rate, 2)
-        }
+        'data': data
     })
 
+@app.route('/api/dashboard/bootstrap', methods=['GET'])
+def get_dashboard_bootstrap():
+    """Overview, latest delays and first departures for the dashboard in one response
+
+    The payload is read in one transaction, so its parts agree with each
+    other, and kept for BOOTSTRAP_MAX_AGE seconds as ready-to-send JSON and
+    gzip bytes. Clients revalidate with the ETag.
+    """
+    day = request.args.get('day', 'Monday')
+    # Checked before the cache, which would otherwise grow with every value sent
+    if day not in DAYS_OF_WEEK:
+        return jsonify({'success': False, 'error': f"day must be one of {', '.join(DAYS_OF_WEEK)}"}), 400
+    
+    cached = _bootstrap_cache.get(day)
+    if cached is None or time.monotonic() > cached['expires']:
+        conn = get_db()
+        try:
+            # One read transaction: every query sees the same snapshot
+            conn.execute("BEGIN")
+            payload = {
+                'success': True,
+                'day': day,
+                'overview': overview_data(conn),
+                'delays': [dict(row) for row in fetch_newest(
+                    conn, 'delays', delays_query(), [], DASHBOARD_ROWS)],
+                'schedules': [dict(row) for row in conn.execute(
+                    *schedules_query(day, limit=DASHBOARD_ROWS))]
+            }
+            conn.commit()
+        finally:
+            conn.close()
+        
+        body = app.json.dumps(payload).encode('utf-8')
+        cached = _bootstrap_cache[day] = {
+            'expires': time.monotonic() + BOOTSTRAP_MAX_AGE,
+            'etag': hashlib.sha1(body).hexdigest(),
+            'body': body,
+            'gzip': gzip.compress(body, compresslevel=6)
+        }
+    
+    use_gzip = 'gzip' in request.accept_encodings
+    response = app.response_class(cached['gzip'] if use_gzip else cached['body'],
+                                  mimetype='application/json')
+    if use_gzip:
+        response.headers['Content-Encoding'] = 'gzip'
+    response.set_etag(cached['etag'] + ('-gz' if use_gzip else ''))
+    response.headers['Vary'] = 'Accept-Encoding'
+    response.cache_control.max_age = BOOTSTRAP_MAX_AGE
+    return response.make_conditional(request)
+
 @app.route('/api/predict', methods=['POST'])
 def predict_delay():
     """Predict delay for given parameters"""
@@ -365,35 +1085,33 @@ def predict_delay():
         return jsonify({'success': False, 'error': 'Missing required parameters'}), 400
     
     try:
-        classifier = joblib.load(os.path.join(MODEL_DIR, 'delay_classifier.pkl'))
-        regressor = joblib.load(os.path.join(MODEL_DIR, 'delay_regressor.pkl'))
-        feature_cols = joblib.load(os.path.join(MODEL_DIR, 'feature_columns.pkl'))
-        
-        import pandas as pd
-        
-        features = {}
-        features['hour'] = int(data['hour'])
-        features['day_of_week'] = int(data['day_of_week'])
-        features['month'] = int(data.get('month', 6))
-        features['is_peak_hour'] = (6 <= features['hour'] <= 9) or (17 <= features['hour'] <= 20)
-        features['is_weekend'] = features['day_of_week'] in [0, 6]
-        
-        for weather in ['cloudy', 'foggy', 'hot', 'rainy', 'sunny']:
-            features[f'weather_{weather}'] = 1 if data['weather'] == weather else 0
-        
-        features['train_type_code'] = int(data.get('train_type_code', 2))
-        features['capacity'] = int(data.get('capacity', 400))
-        features['distance_km'] = float(data.get('distance_km', 100))
-        features['typical_duration_minutes'] = int(data.get('duration', 90))
-        features['route_avg_delay'] = 15.0
-        features['route_std_delay'] = 5.0
+        month = int(data.get('month', 6))
+    except (TypeError, ValueError):
+        month = None
+    if month is None or not 1 <= month <= 12:
+        return jsonify({'success': False, 'error': 'month must be between 1 and 12'}), 400
+    
+    try:
+        models = load_models(MODEL_DIR)
+        classifier = models['classifier']
+        regressor = models['regressor']
+        route_stats = models['route_stats']
+        quantile_model = models['quantiles']
         
-        season = 'summer' if features['month'] in [6, 7, 8] else 'winter'
-        for s in ['autumn', 'spring', 'summer', 'winter']:
-            features[f'season_{s}'] = 1 if s == season else 0
+        route_avg_delay, route_std_delay = route_stats_for(route_stats, data['route_id'])
         
-        df = pd.DataFrame([features])
-        X = df[feature_cols].fillna(0)
+        X = transform_one({
+            'hour': data['hour'],
+            'day_of_week': data['day_of_week'],
+            'month': month,
+            'weather_condition': data['weather'],
+            'train_type_code': data.get('train_type_code', 2),
+            'capacity': data.get('capacity', 400),
+            'distance_km': data.get('distance_km', 100),
+            'typical_duration_minutes': data.get('duration', 90),
+            'route_avg_delay': route_avg_delay,
+            'route_std_delay': route_std_delay
+        })
         
         delay_prob = classifier.predict_proba(X)[0][1]
         
@@ -403,8 +1121,18 @@ def predict_delay():
             'will_delay': bool(delay_prob > 0.5)
         }
         
-        if delay_prob > 0.5:
+        if quantile_model is not None:
+            # Mean and quantiles of the delay duration, given a delay occurs
+            values = predict_quantiles(regressor, quantile_model, X)[0]
+            delay_minutes = values[0]
+            result['delay_minutes_quantiles'] = {
+                label: round(float(v), 1)
+                for label, v in zip(quantile_labels(quantile_model), values[1:])
+            }
+        else:
             delay_minutes = regressor.predict(X)[0]
+        
+        if delay_prob > 0.5:
             result['estimated_delay_minutes'] = round(float(delay_minutes), 1)
         
         return jsonify({
@@ -422,10 +1150,10 @@ def optimize_schedule():
     day = data.get('day', 'Monday')
     
     try:
-        optimizer = ScheduleOptimizer()
+        optimizer = ScheduleOptimizer(models=load_models(MODEL_DIR))
         
         schedules = optimizer.load_schedules(day)
-        schedules = optimizer.predict_delays(schedules)
+        schedules = optimizer.predict_delays(schedules, data.get('month'), data.get('weather'))
         conflicts = optimizer.detect_conflicts(schedules)
         optimized, changes = optimizer.optimize_schedule(schedules, conflicts)
         metrics = optimizer.calculate_metrics(schedules, optimized, changes)
@@ -453,5 +1181,6 @@ def internal_error(error):
     return jsonify({'success': False, 'error': 'Internal server error'}), 500
 
 if __name__ == '__main__':
+    get_occupancy_cube(DB_PATH)
     port = int(os.environ.get("PORT", 5000))
     app.run(host="0.0.0.0", port=port, debug=False)
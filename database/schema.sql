@@ -53,13 +53,19 @@ CREATE TABLE IF NOT EXISTS schedules (
     day_of_week TEXT NOT NULL CHECK(day_of_week IN ('Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday')),
     status TEXT NOT NULL DEFAULT 'scheduled' CHECK(status IN ('scheduled', 'on-time', 'delayed', 'cancelled')),
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    -- Minutes since midnight, derived from the HH:MM text (see scripts/timecodes.py)
+    departure_minute INTEGER GENERATED ALWAYS AS
+        (CAST(substr(departure_time, 1, 2) AS INTEGER) * 60 + CAST(substr(departure_time, 4, 2) AS INTEGER)) STORED,
+    arrival_minute INTEGER GENERATED ALWAYS AS
+        (CAST(substr(arrival_time, 1, 2) AS INTEGER) * 60 + CAST(substr(arrival_time, 4, 2) AS INTEGER)) STORED,
     FOREIGN KEY (train_id) REFERENCES trains(train_id),
     FOREIGN KEY (route_id) REFERENCES routes(route_id)
 );
 
 -- Delays Table
+-- AUTOINCREMENT keeps ids unique after old rows move to monthly partitions
 CREATE TABLE IF NOT EXISTS delays (
-    delay_id INTEGER PRIMARY KEY,
+    delay_id INTEGER PRIMARY KEY AUTOINCREMENT,
     schedule_id INTEGER NOT NULL,
     delay_minutes INTEGER NOT NULL,
     delay_reason TEXT NOT NULL CHECK(delay_reason IN ('weather', 'technical', 'passenger', 'maintenance', 'cascade')),
@@ -67,12 +73,14 @@ CREATE TABLE IF NOT EXISTS delays (
     timestamp TEXT NOT NULL,
     resolved BOOLEAN NOT NULL DEFAULT 0,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    -- Epoch seconds of the timestamp read as UTC, so hour and day bucketing is integer math
+    timestamp_epoch INTEGER GENERATED ALWAYS AS (CAST(strftime('%s', timestamp) AS INTEGER)) STORED,
     FOREIGN KEY (schedule_id) REFERENCES schedules(schedule_id)
 );
 
 -- Passengers Table
 CREATE TABLE IF NOT EXISTS passengers (
-    record_id INTEGER PRIMARY KEY,
+    record_id INTEGER PRIMARY KEY AUTOINCREMENT,
     schedule_id INTEGER NOT NULL,
     passenger_count INTEGER NOT NULL,
     booking_date TEXT NOT NULL,
@@ -81,16 +89,136 @@ CREATE TABLE IF NOT EXISTS passengers (
     FOREIGN KEY (schedule_id) REFERENCES schedules(schedule_id)
 );
 
+-- Daily delay aggregates, kept current by trg_delays_daily_stats below
+CREATE TABLE IF NOT EXISTS delay_daily_stats (
+    day TEXT NOT NULL,
+    route_id INTEGER NOT NULL,
+    delay_reason TEXT NOT NULL,
+    weather_condition TEXT NOT NULL,
+    delay_count INTEGER NOT NULL,
+    total_delay_minutes INTEGER NOT NULL,
+    max_delay_minutes INTEGER NOT NULL,
+    PRIMARY KEY (day, route_id, delay_reason, weather_condition),
+    FOREIGN KEY (route_id) REFERENCES routes(route_id)
+);
+
+-- Per-route totals, kept current by the trg_*_route_kpis triggers below
+CREATE TABLE IF NOT EXISTS route_kpis (
+    route_id INTEGER PRIMARY KEY,
+    schedule_count INTEGER NOT NULL DEFAULT 0,
+    delay_count INTEGER NOT NULL DEFAULT 0,
+    total_delay_minutes INTEGER NOT NULL DEFAULT 0,
+    max_delay_minutes INTEGER NOT NULL DEFAULT 0,
+    FOREIGN KEY (route_id) REFERENCES routes(route_id)
+);
+
+-- Delays per route and length in minutes, for exact percentiles
+CREATE TABLE IF NOT EXISTS route_delay_histogram (
+    route_id INTEGER NOT NULL,
+    delay_minutes INTEGER NOT NULL,
+    delay_count INTEGER NOT NULL,
+    PRIMARY KEY (route_id, delay_minutes),
+    FOREIGN KEY (route_id) REFERENCES routes(route_id)
+);
+
+-- Upper bounds of the logarithmic sketch buckets, bucket i ending at
+-- (51/49)^i minutes. The bounds are built by repeated multiplication, which
+-- gives the same doubles as scripts/delay_sketch.py and needs no SQL math
+-- functions (ln/ceil are missing from many SQLite builds).
+CREATE TABLE IF NOT EXISTS delay_sketch_buckets (
+    upper_minutes REAL PRIMARY KEY,
+    bucket INTEGER NOT NULL
+) WITHOUT ROWID;
+
+WITH RECURSIVE bounds (bucket, upper_minutes) AS (
+    SELECT 0, 1.0
+    UNION ALL
+    SELECT bucket + 1, upper_minutes * (51.0 / 49.0) FROM bounds WHERE upper_minutes < 1000000
+)
+INSERT OR IGNORE INTO delay_sketch_buckets (upper_minutes, bucket)
+SELECT upper_minutes, bucket FROM bounds;
+
+-- Delay counts per route, hour, reason and logarithmic bucket: mergeable
+-- quantile sketches kept by trg_delays_sketches (see scripts/delay_sketch.py)
+CREATE TABLE IF NOT EXISTS delay_sketches (
+    route_id INTEGER NOT NULL,
+    hour INTEGER NOT NULL,
+    delay_reason TEXT NOT NULL,
+    bucket INTEGER NOT NULL,
+    delay_count INTEGER NOT NULL,
+    PRIMARY KEY (route_id, hour, delay_reason, bucket),
+    FOREIGN KEY (route_id) REFERENCES routes(route_id)
+);
+
+-- Schedule status changes, appended by trg_schedules_status_changes below
+-- and streamed to dashboards by scripts/live_feed.py
+CREATE TABLE IF NOT EXISTS schedule_status_changes (
+    change_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    schedule_id INTEGER NOT NULL,
+    old_status TEXT,
+    new_status TEXT,
+    changed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (schedule_id) REFERENCES schedules(schedule_id)
+);
+
+-- Change counters of tables that caches compile into memory, bumped by the
+-- trg_*_version triggers below (see scripts/network_matrix.py,
+-- scripts/station_index.py and scripts/search_index.py). changed_at
+-- also moves when the database is rebuilt, so a rebuild is never mistaken
+-- for the version a cache already holds.
+CREATE TABLE IF NOT EXISTS table_versions (
+    table_name TEXT PRIMARY KEY,
+    version INTEGER NOT NULL DEFAULT 0,
+    changed_at TEXT NOT NULL DEFAULT (strftime('%Y-%m-%d %H:%M:%f', 'now'))
+);
+
+-- Monthly rollups of partitions past the retention window (see scripts/partitions.py)
+CREATE TABLE IF NOT EXISTS delay_monthly_stats (
+    month TEXT NOT NULL,
+    route_id INTEGER NOT NULL,
+    delay_reason TEXT NOT NULL,
+    weather_condition TEXT NOT NULL,
+    delay_count INTEGER NOT NULL,
+    total_delay_minutes INTEGER NOT NULL,
+    max_delay_minutes INTEGER NOT NULL,
+    PRIMARY KEY (month, route_id, delay_reason, weather_condition),
+    FOREIGN KEY (route_id) REFERENCES routes(route_id)
+);
+
+CREATE TABLE IF NOT EXISTS passenger_monthly_stats (
+    month TEXT NOT NULL,
+    route_id INTEGER NOT NULL,
+    trip_count INTEGER NOT NULL,
+    total_passengers INTEGER NOT NULL,
+    max_passengers INTEGER NOT NULL,
+    PRIMARY KEY (month, route_id),
+    FOREIGN KEY (route_id) REFERENCES routes(route_id)
+);
+
 -- Indexes for performance optimization
 CREATE INDEX IF NOT EXISTS idx_routes_origin ON routes(origin_station_id);
 CREATE INDEX IF NOT EXISTS idx_routes_destination ON routes(destination_station_id);
 CREATE INDEX IF NOT EXISTS idx_schedules_train ON schedules(train_id);
-CREATE INDEX IF NOT EXISTS idx_schedules_route ON schedules(route_id);
-CREATE INDEX IF NOT EXISTS idx_schedules_day ON schedules(day_of_week);
-CREATE INDEX IF NOT EXISTS idx_schedules_departure ON schedules(departure_time);
-CREATE INDEX IF NOT EXISTS idx_delays_schedule ON delays(schedule_id);
-CREATE INDEX IF NOT EXISTS idx_delays_reason ON delays(delay_reason);
+CREATE INDEX IF NOT EXISTS idx_schedules_departure ON schedules(departure_minute);
 CREATE INDEX IF NOT EXISTS idx_delays_timestamp ON delays(timestamp);
+
+-- Composite indexes shaped by the statements in app.py and optimizer.py:
+-- scripts/check_query_plans.py fails if those fall back to scans or sorts.
+-- Day listing in departure order, covering the columns the optimizer reads
+CREATE INDEX IF NOT EXISTS idx_schedules_day_departure
+    ON schedules(day_of_week, departure_minute, departure_time, train_id, route_id,
+                 arrival_minute, arrival_time, platform, status);
+-- Route filter within a day, in departure order
+CREATE INDEX IF NOT EXISTS idx_schedules_route_day ON schedules(route_id, day_of_week, departure_minute);
+-- Latest delays of a schedule
+CREATE INDEX IF NOT EXISTS idx_delays_schedule_timestamp ON delays(schedule_id, timestamp);
+-- Latest delays by reason, also covering the per-reason aggregates
+CREATE INDEX IF NOT EXISTS idx_delays_reason_timestamp ON delays(delay_reason, timestamp, delay_minutes);
+-- Covering indexes for the per-weather and per-hour aggregates
+CREATE INDEX IF NOT EXISTS idx_delays_weather_timestamp ON delays(weather_condition, timestamp, delay_minutes);
+CREATE INDEX IF NOT EXISTS idx_delays_hour_timestamp ON delays(timestamp_epoch / 3600 % 24, timestamp, delay_minutes);
+-- Per-route delay time series (the primary key serves the unfiltered one)
+CREATE INDEX IF NOT EXISTS idx_delay_daily_stats_route_day ON delay_daily_stats(route_id, day);
 CREATE INDEX IF NOT EXISTS idx_passengers_schedule ON passengers(schedule_id);
 CREATE INDEX IF NOT EXISTS idx_passengers_travel_date ON passengers(travel_date);
 
@@ -141,13 +269,147 @@ SELECT
     st_origin.name as origin_station,
     st_dest.name as destination_station,
     r.distance_km,
-    COUNT(DISTINCT s.schedule_id) as total_schedules,
-    COUNT(d.delay_id) as total_delays,
-    ROUND(COUNT(d.delay_id) * 100.0 / COUNT(DISTINCT s.schedule_id), 2) as delay_rate,
-    AVG(d.delay_minutes) as avg_delay_minutes
-FROM routes r
+    k.schedule_count as total_schedules,
+    k.delay_count as total_delays,
+    ROUND(k.delay_count * 100.0 / NULLIF(k.schedule_count, 0), 2) as delay_rate,
+    k.total_delay_minutes * 1.0 / NULLIF(k.delay_count, 0) as avg_delay_minutes
+FROM route_kpis k
+JOIN routes r ON k.route_id = r.route_id
 JOIN stations st_origin ON r.origin_station_id = st_origin.station_id
-JOIN stations st_dest ON r.destination_station_id = st_dest.station_id
-LEFT JOIN schedules s ON r.route_id = s.route_id
-LEFT JOIN delays d ON s.schedule_id = d.schedule_id
-GROUP BY r.route_id;
+JOIN stations st_dest ON r.destination_station_id = st_dest.station_id;
+
+-- Triggers keeping derived aggregates in the same transaction as each insert
+-- (rows moved into monthly partitions were already counted, so there is no
+-- delete trigger)
+CREATE TRIGGER IF NOT EXISTS trg_delays_daily_stats AFTER INSERT ON delays
+BEGIN
+    INSERT INTO delay_daily_stats (day, route_id, delay_reason, weather_condition,
+                                   delay_count, total_delay_minutes, max_delay_minutes)
+    SELECT substr(NEW.timestamp, 1, 10), s.route_id, NEW.delay_reason, NEW.weather_condition,
+           1, NEW.delay_minutes, NEW.delay_minutes
+    FROM schedules s
+    WHERE s.schedule_id = NEW.schedule_id
+    ON CONFLICT (day, route_id, delay_reason, weather_condition) DO UPDATE SET
+        delay_count = delay_count + 1,
+        total_delay_minutes = total_delay_minutes + excluded.total_delay_minutes,
+        max_delay_minutes = MAX(max_delay_minutes, excluded.max_delay_minutes);
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_delays_route_kpis AFTER INSERT ON delays
+BEGIN
+    INSERT INTO route_kpis (route_id, delay_count, total_delay_minutes, max_delay_minutes)
+    SELECT s.route_id, 1, NEW.delay_minutes, NEW.delay_minutes
+    FROM schedules s
+    WHERE s.schedule_id = NEW.schedule_id
+    ON CONFLICT (route_id) DO UPDATE SET
+        delay_count = delay_count + 1,
+        total_delay_minutes = total_delay_minutes + excluded.total_delay_minutes,
+        max_delay_minutes = MAX(max_delay_minutes, excluded.max_delay_minutes);
+    INSERT INTO route_delay_histogram (route_id, delay_minutes, delay_count)
+    SELECT s.route_id, NEW.delay_minutes, 1
+    FROM schedules s
+    WHERE s.schedule_id = NEW.schedule_id
+    ON CONFLICT (route_id, delay_minutes) DO UPDATE SET
+        delay_count = delay_count + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_delays_sketches AFTER INSERT ON delays
+BEGIN
+    INSERT INTO delay_sketches (route_id, hour, delay_reason, bucket, delay_count)
+    SELECT s.route_id, NEW.timestamp_epoch / 3600 % 24, NEW.delay_reason,
+           CASE WHEN NEW.delay_minutes < 1 THEN -1
+                ELSE COALESCE((SELECT bucket FROM delay_sketch_buckets
+                               WHERE upper_minutes >= NEW.delay_minutes
+                               ORDER BY upper_minutes LIMIT 1),
+                              (SELECT MAX(bucket) FROM delay_sketch_buckets)) END,
+           1
+    FROM schedules s
+    WHERE s.schedule_id = NEW.schedule_id
+    ON CONFLICT (route_id, hour, delay_reason, bucket) DO UPDATE SET
+        delay_count = delay_count + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_routes_route_kpis AFTER INSERT ON routes
+BEGIN
+    INSERT OR IGNORE INTO route_kpis (route_id) VALUES (NEW.route_id);
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_schedules_insert_route_kpis AFTER INSERT ON schedules
+BEGIN
+    INSERT INTO route_kpis (route_id, schedule_count) VALUES (NEW.route_id, 1)
+    ON CONFLICT (route_id) DO UPDATE SET schedule_count = schedule_count + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_schedules_delete_route_kpis AFTER DELETE ON schedules
+BEGIN
+    UPDATE route_kpis SET schedule_count = schedule_count - 1 WHERE route_id = OLD.route_id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_schedules_update_route_kpis AFTER UPDATE OF route_id ON schedules
+WHEN NEW.route_id != OLD.route_id
+BEGIN
+    UPDATE route_kpis SET schedule_count = schedule_count - 1 WHERE route_id = OLD.route_id;
+    INSERT INTO route_kpis (route_id, schedule_count) VALUES (NEW.route_id, 1)
+    ON CONFLICT (route_id) DO UPDATE SET schedule_count = schedule_count + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_schedules_status_changes AFTER UPDATE OF status ON schedules
+WHEN NEW.status IS NOT OLD.status
+BEGIN
+    INSERT INTO schedule_status_changes (schedule_id, old_status, new_status)
+    VALUES (NEW.schedule_id, OLD.status, NEW.status);
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_routes_insert_version AFTER INSERT ON routes
+BEGIN
+    INSERT INTO table_versions (table_name, version) VALUES ('routes', 1)
+    ON CONFLICT (table_name) DO UPDATE SET version = version + 1, changed_at = excluded.changed_at;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_routes_update_version AFTER UPDATE ON routes
+BEGIN
+    INSERT INTO table_versions (table_name, version) VALUES ('routes', 1)
+    ON CONFLICT (table_name) DO UPDATE SET version = version + 1, changed_at = excluded.changed_at;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_routes_delete_version AFTER DELETE ON routes
+BEGIN
+    INSERT INTO table_versions (table_name, version) VALUES ('routes', 1)
+    ON CONFLICT (table_name) DO UPDATE SET version = version + 1, changed_at = excluded.changed_at;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_stations_insert_version AFTER INSERT ON stations
+BEGIN
+    INSERT INTO table_versions (table_name, version) VALUES ('stations', 1)
+    ON CONFLICT (table_name) DO UPDATE SET version = version + 1, changed_at = excluded.changed_at;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_stations_update_version AFTER UPDATE ON stations
+BEGIN
+    INSERT INTO table_versions (table_name, version) VALUES ('stations', 1)
+    ON CONFLICT (table_name) DO UPDATE SET version = version + 1, changed_at = excluded.changed_at;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_stations_delete_version AFTER DELETE ON stations
+BEGIN
+    INSERT INTO table_versions (table_name, version) VALUES ('stations', 1)
+    ON CONFLICT (table_name) DO UPDATE SET version = version + 1, changed_at = excluded.changed_at;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_trains_insert_version AFTER INSERT ON trains
+BEGIN
+    INSERT INTO table_versions (table_name, version) VALUES ('trains', 1)
+    ON CONFLICT (table_name) DO UPDATE SET version = version + 1, changed_at = excluded.changed_at;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_trains_update_version AFTER UPDATE ON trains
+BEGIN
+    INSERT INTO table_versions (table_name, version) VALUES ('trains', 1)
+    ON CONFLICT (table_name) DO UPDATE SET version = version + 1, changed_at = excluded.changed_at;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_trains_delete_version AFTER DELETE ON trains
+BEGIN
+    INSERT INTO table_versions (table_name, version) VALUES ('trains', 1)
+    ON CONFLICT (table_name) DO UPDATE SET version = version + 1, changed_at = excluded.changed_at;
+END;
@@ -0,0 +1,20 @@
+"""
+Gunicorn settings for MarocRail-Optimizer
+"""
+import os
+
+# Import the app (and load the ML models) once in the master process.
+# Workers are forked afterwards and share the model memory copy-on-write,
+# so they start in milliseconds and don't each hold their own copy.
+preload_app = True
+os.environ.setdefault('PRELOAD_MODELS', '1')
+
+# Dashboard streams (/api/stream/dashboard) hold a connection open, so each
+# worker serves requests from a thread pool; an idle stream costs a thread
+# blocked on its queue, and all streams of a worker share one producer.
+# Streams are capped at half the threads (503 beyond that), so API requests
+# always find a free thread; add workers to serve more dashboards.
+workers = int(os.environ.get('GUNICORN_WORKERS', (os.cpu_count() or 1) + 1))
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', 64))
+os.environ.setdefault('MAX_STREAMS', str(threads // 2))
@@ -0,0 +1,217 @@
+"""
+Benchmark serving cost of the trained delay models
+"""
+import json
+import os
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+import joblib
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scripts.delay_quantiles import predict_quantiles
+from scripts.model_store import MODEL_FILES as STORE_FILES
+
+MODEL_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'models')
+RESULTS_FILE = 'benchmark.json'
+
+# model_store artifact -> artifacts its predictions need, the first one
+# being benchmarked (quantiles are served through the regressor's leaves)
+PREDICTORS = {
+    'classifier': ('classifier',),
+    'regressor': ('regressor',),
+    'quantiles': ('quantiles', 'regressor'),
+}
+BATCH_SIZES = [1, 100, 10_000, 1_000_000]
+
+# Plausible (low, high) ranges used to synthesize rows when no sample is given
+FEATURE_RANGES = {
+    'hour': (5, 23),
+    'day_of_week': (0, 6),
+    'month': (1, 12),
+    'is_peak_hour': (0, 1),
+    'is_weekend': (0, 1),
+    'train_type_code': (1, 3),
+    'capacity': (300, 533),
+    'distance_km': (20, 500),
+    'typical_duration_minutes': (25, 270),
+    'route_avg_delay': (5, 25),
+    'route_std_delay': (0, 15),
+}
+
+def synthetic_rows(feature_cols, n_rows, seed=42):
+    """Build a feature matrix with values in realistic ranges"""
+    rng = np.random.default_rng(seed)
+    X = np.empty((n_rows, len(feature_cols)), dtype=np.float64)
+
+    for j, col in enumerate(feature_cols):
+        low, high = FEATURE_RANGES.get(col, (0, 1))
+        X[:, j] = rng.integers(low, high + 1, size=n_rows)
+
+    return X
+
+def tile_rows(sample, n_rows):
+    """Repeat sample rows until the matrix has n_rows rows"""
+    reps = -(-n_rows // len(sample))
+    return np.tile(sample, (reps, 1))[:n_rows]
+
+def _read_rss_mb():
+    """Current resident set size of this process in MB"""
+    try:
+        with open('/proc/self/status', 'r') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def _probe_load(path):
+    """Load a model in this (fresh) process and report time and memory"""
+    rss_before = _read_rss_mb()
+    start = time.perf_counter()
+    joblib.load(path)
+    load_seconds = time.perf_counter() - start
+    rss_after = _read_rss_mb()
+
+    print(json.dumps({
+        'load_seconds': load_seconds,
+        'rss_mb': rss_after - rss_before
+    }))
+
+def measure_cold_load(path):
+    """Time a model load in a separate interpreter so caches are cold"""
+    output = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), '--probe', path],
+        capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+def _predict_fn(model, forest=None):
+    """predict_proba for classifiers, predict for regressors, and the forest
+    pass of predict_quantiles for a quantile table"""
+    if forest is not None:
+        return lambda X: predict_quantiles(forest, model, X)
+    return model.predict_proba if hasattr(model, 'predict_proba') else model.predict
+
+def measure_single_row_latency(predict, sample, repeats=200):
+    """Median and p95 latency of one-row predictions in milliseconds"""
+    row = sample[:1]
+    predict(row)  # warm up
+
+    timings = []
+    for i in range(repeats):
+        row = sample[i % len(sample)].reshape(1, -1)
+        start = time.perf_counter()
+        predict(row)
+        timings.append((time.perf_counter() - start) * 1000)
+
+    return {
+        'p50_ms': round(float(np.percentile(timings, 50)), 3),
+        'p95_ms': round(float(np.percentile(timings, 95)), 3)
+    }
+
+def measure_throughput(predict, sample, batch_sizes=BATCH_SIZES, min_seconds=0.2):
+    """Rows per second for each batch size"""
+    results = []
+
+    for n_rows in batch_sizes:
+        X = tile_rows(sample, n_rows)
+        runs = 0
+        start = time.perf_counter()
+        while True:
+            predict(X)
+            runs += 1
+            elapsed = time.perf_counter() - start
+            if elapsed >= min_seconds or runs >= 50:
+                break
+
+        seconds_per_batch = elapsed / runs
+        results.append({
+            'batch_size': n_rows,
+            'seconds_per_batch': round(seconds_per_batch, 6),
+            'rows_per_second': round(n_rows / seconds_per_batch, 1)
+        })
+
+    return results
+
+def benchmark_model(path, sample, batch_sizes=BATCH_SIZES, forest_path=None):
+    """Collect all serving metrics for one model artifact"""
+    cold = measure_cold_load(path)
+    forest = joblib.load(forest_path) if forest_path else None
+    predict = _predict_fn(joblib.load(path), forest)
+
+    return {
+        'model': os.path.basename(path),
+        'artifact_size_mb': round(os.path.getsize(path) / 1024 / 1024, 3),
+        'cold_load_seconds': round(cold['load_seconds'], 4),
+        'resident_memory_mb': round(cold['rss_mb'], 2),
+        'single_row_latency': measure_single_row_latency(predict, sample),
+        'throughput': measure_throughput(predict, sample, batch_sizes)
+    }
+
+def run_benchmark(sample=None, model_dir=MODEL_DIR, batch_sizes=BATCH_SIZES):
+    """Benchmark every saved model and write results next to the models"""
+    feature_cols = joblib.load(os.path.join(model_dir, 'feature_columns.pkl'))
+    if sample is None:
+        sample = synthetic_rows(feature_cols, 1000)
+    sample = np.asarray(sample, dtype=np.float64)
+
+    results = []
+    for name, needed in PREDICTORS.items():
+        paths = [os.path.join(model_dir, STORE_FILES[n][0]) for n in needed]
+        missing = [os.path.basename(p) for p in paths if not os.path.exists(p)]
+        if missing:
+            print(f"[WARNING] {', '.join(missing)} not found, skipping {name}")
+            continue
+        print(f"[INFO] Benchmarking {os.path.basename(paths[0])}...")
+        forest_path = paths[1] if len(paths) > 1 else None
+        results.append(benchmark_model(paths[0], sample, batch_sizes, forest_path))
+
+    report = {
+        'generated_at': datetime.now().isoformat(timespec='seconds'),
+        'python': sys.version.split()[0],
+        'cpu_count': os.cpu_count(),
+        'models': results
+    }
+
+    output_file = os.path.join(model_dir, RESULTS_FILE)
+    with open(output_file, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+
+    print_report(report)
+    print(f"\n[OK] Benchmark saved to: {output_file}")
+    return report
+
+def print_report(report):
+    """Print a compact summary table"""
+    print("\n" + "="*60)
+    print("  Model Serving Benchmark")
+    print("="*60)
+    for result in report['models']:
+        latency = result['single_row_latency']
+        print(f"\n  {result['model']}")
+        print(f"    Artifact size:      {result['artifact_size_mb']:.2f} MB")
+        print(f"    Cold load:          {result['cold_load_seconds'] * 1000:.1f} ms")
+        print(f"    Resident memory:    {result['resident_memory_mb']:.1f} MB")
+        print(f"    Single-row latency: p50 {latency['p50_ms']:.2f} ms, p95 {latency['p95_ms']:.2f} ms")
+        for batch in result['throughput']:
+            print(f"    Batch {batch['batch_size']:>9,}:    {batch['rows_per_second']:>12,.0f} rows/s")
+
+def main():
+    print("="*60)
+    print("  MarocRail-Optimizer - Model Benchmark")
+    print("="*60)
+    run_benchmark()
+    print()
+
+if __name__ == "__main__":
+    if len(sys.argv) == 3 and sys.argv[1] == '--probe':
+        _probe_load(sys.argv[2])
+    else:
+        main()
@@ -0,0 +1,184 @@
+"""
+Check that the hot queries of the API and optimizer stay on their indexes
+
+Runs EXPLAIN QUERY PLAN on every statement below and fails on full table
+scans and temporary B-tree sorts, unless a check explicitly allows one
+(e.g. listing every station, or merging a few partial aggregates).
+"""
+import argparse
+import os
+import re
+import sqlite3
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import (STATIONS_QUERY, ROUTES_QUERY, SCHEDULE_DETAIL_QUERY, RECENT_DELAYS_QUERY,
+                 DELAY_GROUPS, DELAY_GROUP_PARTIAL, DELAY_TOTALS_PARTIAL,
+                 schedules_query, delays_query, delay_group_query, delay_totals_query,
+                 timeseries_query, STATS_DAYS_QUERY, route_kpis_query,
+                 route_percentiles_query, route_window_query, sketch_query)
+from scripts.live_feed import NEW_DELAYS_QUERY, STATUS_CHANGES_QUERY, KPIS_QUERY, HIGH_WATER_QUERY
+from scripts.network_matrix import VERSIONS_QUERY
+from scripts.occupancy import CUBE_QUERY
+from scripts.search_index import SEARCH_VERSIONS_QUERY
+from scripts.station_index import STATIONS_VERSION_QUERY
+from scripts.optimizer import DAY_SCHEDULES_QUERY
+from scripts.partitions import MIN_TIME, MAX_TIME, partition_tables
+
+DB_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'database', 'marocrail.db')
+
+_SUBQUERY = re.compile(r'^(?:CO-ROUTINE|MATERIALIZE) (.+)$')
+_SCAN = re.compile(r'^SCAN (.+?)(?: USING .*)?$')
+
+def build_checks(conn):
+    """(name, sql, params, allowed plan line prefixes) for every hot query"""
+    bounds = [MIN_TIME, MAX_TIME]
+
+    checks = [
+        ('stations list', STATIONS_QUERY, [], ['SCAN stations']),
+        ('routes list', ROUTES_QUERY, [], ['SCAN s1', 'USE TEMP B-TREE FOR RIGHT PART OF ORDER BY']),
+        ('schedules by day', *schedules_query('Monday'), []),
+        ('schedules by day and route', *schedules_query('Monday', 1), []),
+        ('schedules by day and status', *schedules_query('Monday', None, 'delayed'), []),
+        ('schedule detail', SCHEDULE_DETAIL_QUERY, [1], []),
+        ('optimizer day load', DAY_SCHEDULES_QUERY, ['Monday'], []),
+        ('delay time series', *timeseries_query(), []),
+        ('delay time series by route', *timeseries_query(None, None, 1), []),
+        ('delay time series by reason', *timeseries_query('2026-01-01', None, None, 'weather'), []),
+        # Deduplicating the routes of one station
+        ('delay time series by station', *timeseries_query(None, None, None, None, 1),
+         ['UNION USING TEMP B-TREE']),
+        ('route KPIs', *route_kpis_query(), ['SCAN k']),
+        ('route KPIs of one route', *route_kpis_query(1), []),
+        ('route window', *route_window_query('2026-05-01', '2026-06-01'), []),
+        ('route window of one route', *route_window_query('2026-05-01', '2026-06-01', 1), []),
+        ('delay history bounds', STATS_DAYS_QUERY, [], []),
+        ('live feed new delays', NEW_DELAYS_QUERY, [0, 500], []),
+        ('live feed status changes', STATUS_CHANGES_QUERY, [0, 500], []),
+        ('live feed high-water marks', HIGH_WATER_QUERY, [], []),
+        ('live feed KPIs', KPIS_QUERY, [], ['SCAN route_kpis']),
+        ('network matrix versions', VERSIONS_QUERY, [], []),
+        ('station index version', STATIONS_VERSION_QUERY, [], []),
+        ('search index versions', SEARCH_VERSIONS_QUERY, [], []),
+    ]
+
+    # Window sums over the histogram sort at most routes x distinct delay lengths
+    histogram = ['SCAN route_delay_histogram', 'USE TEMP B-TREE FOR ORDER BY',
+                 'USE TEMP B-TREE FOR GROUP BY']
+    # Merging sketches reads the sketch table, whose size depends on the
+    # number of distinct delay values, not on the length of history
+    sketch = ['SCAN delay_sketches', 'USE TEMP B-TREE FOR GROUP BY']
+    checks += [
+        ('delay sketch merge', *sketch_query(), sketch),
+        ('delay sketch merge by route', *sketch_query('route'), sketch),
+        ('delay sketch merge by hour for a reason', *sketch_query('hour', None, None, 'weather'), sketch),
+        ('delay sketch merge of one route', *sketch_query('reason', 1), sketch),
+    ]
+    checks += [
+        ('route percentiles', *route_percentiles_query(), histogram),
+        ('route percentiles of one route', *route_percentiles_query(1), histogram),
+    ]
+
+    # Statements run once per partition must be clean on every partition
+    for table in partition_tables(conn, 'delays'):
+        checks += [
+            (f'recent delays of schedule [{table}]',
+             RECENT_DELAYS_QUERY.format(source=table), bounds + [1, 10], []),
+            (f'latest delays [{table}]',
+             delays_query().format(source=table), bounds + [50], []),
+            (f'latest delays by reason [{table}]',
+             delays_query('weather').format(source=table), bounds + ['weather', 50], []),
+            (f'delay totals [{table}]',
+             DELAY_TOTALS_PARTIAL.format(source=table), bounds, []),
+        ]
+        for group, (expression, name, _) in DELAY_GROUPS.items():
+            partial = DELAY_GROUP_PARTIAL.format(expression=expression, name=name)
+            checks.append((f'delays {group} [{table}]', partial.format(source=table), bounds, []))
+
+    # The occupancy cube reads partitions once in full, then only new records
+    # of the hot table
+    for table in partition_tables(conn, 'passengers'):
+        allowed = [] if table == 'passengers' else ['SCAN p']
+        checks.append((f'occupancy cube scan [{table}]', CUBE_QUERY.format(source=table), [0], allowed))
+
+    # Merging the partials sorts at most one row per group and partition
+    merge = ['USE TEMP B-TREE FOR GROUP BY', 'USE TEMP B-TREE FOR ORDER BY']
+    for group in DELAY_GROUPS:
+        checks.append((f'delays {group} merged', *delay_group_query(conn, group), merge))
+    checks.append(('delay totals merged', *delay_totals_query(conn), ['SCAN delay_monthly_stats']))
+
+    return checks
+
+def query_plan(conn, sql, params):
+    """Detail lines of EXPLAIN QUERY PLAN"""
+    return [row[3] for row in conn.execute('EXPLAIN QUERY PLAN ' + sql, params).fetchall()]
+
+def plan_problems(plan, allowed=()):
+    """Plan lines that are full scans or temp B-tree sorts and not allowed"""
+    subqueries = {match.group(1) for match in map(_SUBQUERY.match, plan) if match}
+    problems = []
+
+    for detail in plan:
+        if any(detail.startswith(prefix) for prefix in allowed):
+            continue
+        if detail.startswith('USE TEMP B-TREE'):
+            problems.append(detail)
+            continue
+        match = _SCAN.match(detail)
+        if match:
+            source = match.group(1)
+            if source in subqueries or source.startswith('(') or source == 'CONSTANT ROW':
+                continue
+            problems.append(detail)
+
+    return problems
+
+def check_query_plans(db_path=DB_PATH, verbose=False):
+    """Check every hot query, return the number of failing ones"""
+    conn = sqlite3.connect(db_path)
+    failures = 0
+
+    try:
+        for name, sql, params, allowed in build_checks(conn):
+            plan = query_plan(conn, sql, params)
+            problems = plan_problems(plan, allowed)
+            if problems:
+                failures += 1
+                print(f"[FAIL] {name}")
+                for detail in problems:
+                    print(f"    {detail}")
+            else:
+                print(f"[OK] {name}")
+            if verbose or problems:
+                for detail in plan:
+                    print(f"      | {detail}")
+    finally:
+        conn.close()
+
+    return failures
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Fail if hot queries use full scans or temp sorts")
+    parser.add_argument('--db', default=DB_PATH, help="database to check")
+    parser.add_argument('-v', '--verbose', action='store_true', help="print every query plan")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    print("="*60)
+    print("  MarocRail-Optimizer - Query Plan Check")
+    print("="*60)
+
+    failures = check_query_plans(args.db, args.verbose)
+
+    print()
+    if failures:
+        print(f"[FAIL] {failures} queries fall back to scans or temp sorts")
+    else:
+        print("[OK] All hot queries use indexes")
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -4,14 +4,96 @@ Create SQLite database and load all synthetic data
 import sqlite3
 import json
 import os
+import re
+import argparse
+import sys
+from itertools import islice
+from operator import itemgetter
 from datetime import datetime
 
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scripts.delay_sketch import BUCKET_SQL
+from scripts.partitions import PARTITIONED, list_partitions, maintain_partitions, print_summary
+from scripts.timecodes import HOUR_SQL
+
+BATCH_SIZE = 50000
+CHUNK_SIZE = 1 << 20  # characters read per JSON chunk
+
+STATION_COLUMNS = ['station_id', 'name', 'city', 'latitude', 'longitude',
+                   'platform_count', 'capacity', 'is_major']
+ROUTE_COLUMNS = ['route_id', 'origin_station_id', 'destination_station_id',
+                 'distance_km', 'typical_duration_minutes']
+TRAIN_COLUMNS = ['train_id', 'train_number', 'train_type', 'speed_kmh',
+                 'capacity', 'pricing_tier', 'operational_status']
+SCHEDULE_COLUMNS = ['schedule_id', 'train_id', 'route_id', 'departure_time',
+                    'arrival_time', 'platform', 'day_of_week', 'status']
+DELAY_COLUMNS = ['delay_id', 'schedule_id', 'delay_minutes', 'delay_reason',
+                 'weather_condition', 'timestamp', 'resolved']
+PASSENGER_COLUMNS = ['record_id', 'schedule_id', 'passenger_count',
+                     'booking_date', 'travel_date']
+
+# Same aggregation as trg_delays_daily_stats in schema.sql, for bulk loads
+DAILY_STATS_SQL = """
+    INSERT INTO delay_daily_stats (day, route_id, delay_reason, weather_condition,
+                                   delay_count, total_delay_minutes, max_delay_minutes)
+    SELECT substr(d.timestamp, 1, 10), s.route_id, d.delay_reason, d.weather_condition,
+           COUNT(*), SUM(d.delay_minutes), MAX(d.delay_minutes)
+    FROM delays d
+    JOIN schedules s ON d.schedule_id = s.schedule_id
+    GROUP BY 1, 2, 3, 4
+"""
+
+# Same totals as the trg_*_route_kpis triggers, for bulk loads
+ROUTE_KPIS_SQL = """
+    INSERT INTO route_kpis (route_id, schedule_count, delay_count,
+                            total_delay_minutes, max_delay_minutes)
+    SELECT r.route_id, COALESCE(sc.schedule_count, 0), COALESCE(dl.delay_count, 0),
+           COALESCE(dl.total_delay_minutes, 0), COALESCE(dl.max_delay_minutes, 0)
+    FROM routes r
+    LEFT JOIN (SELECT route_id, COUNT(*) as schedule_count
+               FROM schedules GROUP BY route_id) sc ON sc.route_id = r.route_id
+    LEFT JOIN (SELECT s.route_id, COUNT(*) as delay_count,
+                      SUM(d.delay_minutes) as total_delay_minutes,
+                      MAX(d.delay_minutes) as max_delay_minutes
+               FROM delays d
+               JOIN schedules s ON d.schedule_id = s.schedule_id
+               GROUP BY s.route_id) dl ON dl.route_id = r.route_id
+"""
+
+ROUTE_HISTOGRAM_SQL = """
+    INSERT INTO route_delay_histogram (route_id, delay_minutes, delay_count)
+    SELECT s.route_id, d.delay_minutes, COUNT(*)
+    FROM delays d
+    JOIN schedules s ON d.schedule_id = s.schedule_id
+    GROUP BY 1, 2
+"""
+
+# Same sketches as trg_delays_sketches, for bulk loads
+SKETCHES_SQL = f"""
+    INSERT INTO delay_sketches (route_id, hour, delay_reason, bucket, delay_count)
+    SELECT s.route_id, {HOUR_SQL}, d.delay_reason, {BUCKET_SQL.format(value='d.delay_minutes')},
+           COUNT(*)
+    FROM delays d
+    JOIN schedules s ON d.schedule_id = s.schedule_id
+    GROUP BY 1, 2, 3, 4
+"""
+
+# Starting rows of table_versions, whose triggers only exist after a bulk load
+TABLE_VERSIONS_SQL = "INSERT INTO table_versions (table_name) VALUES ('routes'), ('stations'), ('trains')"
+
+_SEPARATORS = re.compile(r'[\s,]*')
+
 def get_db_path():
     """Get database file path"""
     db_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'database')
     os.makedirs(db_dir, exist_ok=True)
     return os.path.join(db_dir, 'marocrail.db')
 
+def get_build_path():
+    """Side file the new database is built in before being swapped in"""
+    return get_db_path() + '.building'
+
 def get_data_path(filename):
     """Get data file path"""
     data_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data')
@@ -22,179 +104,247 @@ def load_json(filename):
     with open(get_data_path(filename), 'r', encoding='utf-8') as f:
         return json.load(f)
 
-def create_database():
-    """Create database with schema"""
-    db_path = get_db_path()
-    
-    # Remove existing database
-    if os.path.exists(db_path):
-        os.remove(db_path)
-        print(f"[INFO] Removed existing database")
-    
+def iter_json_array(filename, chunk_size=CHUNK_SIZE):
+    """Yield the elements of a top-level JSON array without loading the whole file"""
+    decoder = json.JSONDecoder()
+
+    with open(get_data_path(filename), 'r', encoding='utf-8') as f:
+        buffer = f.read(chunk_size).lstrip()
+        if not buffer.startswith('['):
+            raise ValueError(f"{filename} does not contain a JSON array")
+        pos = 1
+        eof = False
+
+        while True:
+            pos = _SEPARATORS.match(buffer, pos).end()
+
+            if pos < len(buffer) and buffer[pos] == ']':
+                return
+
+            try:
+                item, end = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                item, end = None, None
+
+            # Element cut off at the chunk boundary: read more and retry
+            if end is None or (end == len(buffer) and not eof):
+                if eof:
+                    raise ValueError(f"Truncated JSON array in {filename}")
+                more = f.read(chunk_size)
+                eof = not more
+                buffer = buffer[pos:] + more
+                pos = 0
+                continue
+
+            yield item
+            pos = end
+
+def iter_rows(filename, columns):
+    """Stream a JSON data file as tuples in column order"""
+    getter = itemgetter(*columns)
+    return (getter(record) for record in iter_json_array(filename))
+
+def insert_rows(cursor, table, columns, rows, batch_size=BATCH_SIZE, progress=False):
+    """Insert rows with executemany in large batches, return the row count"""
+    sql = f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})"
+    total = 0
+
+    while True:
+        batch = list(islice(rows, batch_size))
+        if not batch:
+            break
+        cursor.executemany(sql, batch)
+        total += len(batch)
+        if progress:
+            print(f"  Progress: {total} records...")
+
+    return total
+
+def split_schema(schema_sql):
+    """Split schema.sql into table statements and index/view/trigger statements"""
+    tables, deferred = [], []
+    statement = ''
+
+    for line in schema_sql.splitlines():
+        if line.strip().startswith('--'):
+            continue
+        statement += line + '\n'
+        # Triggers contain ';' inside BEGIN ... END, so split on complete statements
+        if not sqlite3.complete_statement(statement):
+            continue
+
+        body = statement.strip().rstrip(';').strip()
+        statement = ''
+        if not body or body.upper().startswith('PRAGMA'):
+            continue
+        if re.match(r'CREATE\s+(UNIQUE\s+)?INDEX|CREATE\s+VIEW|CREATE\s+TRIGGER', body, re.IGNORECASE):
+            deferred.append(body)
+        else:
+            tables.append(body)
+
+    return tables, deferred
+
+def read_schema(db_path):
+    """Read schema.sql next to the database file"""
+    schema_path = os.path.join(os.path.dirname(db_path), 'schema.sql')
+    with open(schema_path, 'r', encoding='utf-8') as f:
+        return f.read()
+
+def create_database(bulk=True, db_path=None):
+    """Create database with schema
+
+    The database is built in a side file (see get_build_path) so the live
+    one stays untouched until swap_database() replaces it. In bulk mode
+    only the tables are created here; indexes and views are built by
+    finish_bulk_load() once the data is in.
+    """
+    if db_path is None:
+        db_path = get_build_path()
+
+    # Remove a leftover build from an interrupted run
+    for path in [db_path, db_path + '-journal', db_path + '-wal', db_path + '-shm']:
+        if os.path.exists(path):
+            os.remove(path)
+            print(f"[INFO] Removed stale build file: {os.path.basename(path)}")
+
     # Create connection
     conn = sqlite3.connect(db_path)
     cursor = conn.cursor()
-    
-    # Enable foreign keys
-    cursor.execute("PRAGMA foreign_keys = ON")
-    
-    # Read and execute schema
-    schema_path = os.path.join(os.path.dirname(db_path), 'schema.sql')
-    with open(schema_path, 'r', encoding='utf-8') as f:
-        schema_sql = f.read()
-    
-    # Execute schema (split by semicolon to handle multiple statements)
-    for statement in schema_sql.split(';'):
-        if statement.strip():
-            cursor.execute(statement)
-    
+
+    tables, deferred = split_schema(read_schema(db_path))
+
+    if bulk:
+        # Nothing to protect in a file we are building from scratch
+        cursor.execute("PRAGMA journal_mode = OFF")
+        cursor.execute("PRAGMA synchronous = OFF")
+        cursor.execute("PRAGMA foreign_keys = OFF")
+        cursor.execute("PRAGMA cache_size = -200000")
+        cursor.execute("PRAGMA temp_store = MEMORY")
+        statements = tables
+    else:
+        cursor.execute("PRAGMA foreign_keys = ON")
+        statements = tables + deferred
+
+    for statement in statements:
+        cursor.execute(statement)
+
     conn.commit()
     print(f"[OK] Database created: {db_path}")
-    
+
     return conn, cursor
 
+def build_aggregates(cursor):
+    """Fill the trigger-maintained aggregate tables in one pass over the data"""
+    cursor.execute(DAILY_STATS_SQL)
+    print(f"[OK] Built {cursor.rowcount} daily delay aggregates")
+    cursor.execute(ROUTE_KPIS_SQL)
+    cursor.execute(ROUTE_HISTOGRAM_SQL)
+    print(f"[OK] Built route KPIs ({cursor.rowcount} histogram buckets)")
+    cursor.execute(SKETCHES_SQL)
+    print(f"[OK] Built {cursor.rowcount} delay sketch buckets")
+    cursor.execute(TABLE_VERSIONS_SQL)
+
+def finish_bulk_load(conn, cursor):
+    """Build aggregates, indexes, views and triggers after the data is loaded,
+    restore safe settings"""
+    _, deferred = split_schema(read_schema(get_db_path()))
+
+    # Triggers are created afterwards, so the bulk-loaded rows are aggregated here
+    build_aggregates(cursor)
+
+    for statement in deferred:
+        cursor.execute(statement)
+    conn.commit()
+    print(f"[OK] Built {len(deferred)} indexes, views and triggers")
+
+    cursor.execute("PRAGMA journal_mode = DELETE")
+    cursor.execute("PRAGMA synchronous = FULL")
+    cursor.execute("PRAGMA foreign_keys = ON")
+
+def swap_database(build_path=None, db_path=None):
+    """Atomically replace the live database with the freshly built one
+
+    Uses SQLite's online backup into the live file: it commits as a single
+    write transaction, so connections that are mid-read keep their WAL
+    snapshot and new connections see the complete new data. Replacing the
+    file on disk instead would leave open connections on the old inode and
+    could pair the new file with the old -wal file.
+    """
+    build_path = build_path or get_build_path()
+    db_path = db_path or get_db_path()
+
+    if not os.path.exists(db_path):
+        os.replace(build_path, db_path)
+        return
+
+    source = sqlite3.connect(build_path)
+    target = sqlite3.connect(db_path, timeout=60)
+    try:
+        target.execute("PRAGMA journal_mode = WAL").fetchone()
+        source.backup(target)
+    finally:
+        source.close()
+        target.close()
+
+    os.remove(build_path)
+
 def load_stations(cursor):
     """Load stations data"""
-    stations = load_json('stations.json')
-    
-    for station in stations:
-        cursor.execute("""
-            INSERT INTO stations (station_id, name, city, latitude, longitude, 
-                                 platform_count, capacity, is_major)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-        """, (
-            station['station_id'],
-            station['name'],
-            station['city'],
-            station['latitude'],
-            station['longitude'],
-            station['platform_count'],
-            station['capacity'],
-            station['is_major']
-        ))
-    
-    print(f"[OK] Loaded {len(stations)} stations")
+    count = insert_rows(cursor, 'stations', STATION_COLUMNS,
+                        iter_rows('stations.json', STATION_COLUMNS))
+    print(f"[OK] Loaded {count} stations")
 
 def load_routes(cursor):
     """Load routes data"""
-    routes = load_json('routes.json')
-    
-    for route in routes:
-        cursor.execute("""
-            INSERT INTO routes (route_id, origin_station_id, destination_station_id,
-                               distance_km, typical_duration_minutes)
-            VALUES (?, ?, ?, ?, ?)
-        """, (
-            route['route_id'],
-            route['origin_station_id'],
-            route['destination_station_id'],
-            route['distance_km'],
-            route['typical_duration_minutes']
-        ))
-    
-    print(f"[OK] Loaded {len(routes)} routes")
+    count = insert_rows(cursor, 'routes', ROUTE_COLUMNS,
+                        iter_rows('routes.json', ROUTE_COLUMNS))
+    print(f"[OK] Loaded {count} routes")
 
 def load_trains(cursor):
     """Load trains data"""
-    trains = load_json('trains.json')
-    
-    for train in trains:
-        cursor.execute("""
-            INSERT INTO trains (train_id, train_number, train_type, speed_kmh,
-                               capacity, pricing_tier, operational_status)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-        """, (
-            train['train_id'],
-            train['train_number'],
-            train['train_type'],
-            train['speed_kmh'],
-            train['capacity'],
-            train['pricing_tier'],
-            train['operational_status']
-        ))
-    
-    print(f"[OK] Loaded {len(trains)} trains")
+    count = insert_rows(cursor, 'trains', TRAIN_COLUMNS,
+                        iter_rows('trains.json', TRAIN_COLUMNS))
+    print(f"[OK] Loaded {count} trains")
 
 def load_schedules(cursor):
     """Load schedules data"""
-    schedules = load_json('schedules.json')
-    
-    for schedule in schedules:
-        cursor.execute("""
-            INSERT INTO schedules (schedule_id, train_id, route_id, departure_time,
-                                  arrival_time, platform, day_of_week, status)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-        """, (
-            schedule['schedule_id'],
-            schedule['train_id'],
-            schedule['route_id'],
-            schedule['departure_time'],
-            schedule['arrival_time'],
-            schedule['platform'],
-            schedule['day_of_week'],
-            schedule['status']
-        ))
-    
-    print(f"[OK] Loaded {len(schedules)} schedules")
+    count = insert_rows(cursor, 'schedules', SCHEDULE_COLUMNS,
+                        iter_rows('schedules.json', SCHEDULE_COLUMNS))
+    print(f"[OK] Loaded {count} schedules")
 
 def load_delays(cursor):
     """Load delays data"""
-    delays = load_json('delays.json')
-    
-    for delay in delays:
-        cursor.execute("""
-            INSERT INTO delays (delay_id, schedule_id, delay_minutes, delay_reason,
-                               weather_condition, timestamp, resolved)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-        """, (
-            delay['delay_id'],
-            delay['schedule_id'],
-            delay['delay_minutes'],
-            delay['delay_reason'],
-            delay['weather_condition'],
-            delay['timestamp'],
-            delay['resolved']
-        ))
-    
-    print(f"[OK] Loaded {len(delays)} delay records")
+    count = insert_rows(cursor, 'delays', DELAY_COLUMNS,
+                        iter_rows('delays.json', DELAY_COLUMNS), progress=True)
+    print(f"[OK] Loaded {count} delay records")
 
 def load_passengers(cursor):
     """Load passenger data"""
-    passengers = load_json('passengers.json')
-    
-    # Batch insert for performance
-    batch_size = 1000
-    for i in range(0, len(passengers), batch_size):
-        batch = passengers[i:i+batch_size]
-        cursor.executemany("""
-            INSERT INTO passengers (record_id, schedule_id, passenger_count,
-                                   booking_date, travel_date)
-            VALUES (?, ?, ?, ?, ?)
-        """, [
-            (p['record_id'], p['schedule_id'], p['passenger_count'],
-             p['booking_date'], p['travel_date'])
-            for p in batch
-        ])
-        if (i + batch_size) % 10000 == 0:
-            print(f"  Progress: {min(i + batch_size, len(passengers))}/{len(passengers)} records...")
-    
-    print(f"[OK] Loaded {len(passengers)} passenger records")
+    count = insert_rows(cursor, 'passengers', PASSENGER_COLUMNS,
+                        iter_rows('passengers.json', PASSENGER_COLUMNS), progress=True)
+    print(f"[OK] Loaded {count} passenger records")
 
 def verify_database(cursor):
     """Verify database integrity"""
     print("\n[INFO] Verifying database...")
-    
+
     tables = ['stations', 'routes', 'trains', 'schedules', 'delays', 'passengers']
-    
+
     for table in tables:
         cursor.execute(f"SELECT COUNT(*) FROM {table}")
         count = cursor.fetchone()[0]
-        print(f"  - {table}: {count} records")
-    
+        if table in PARTITIONED:
+            partitions = list_partitions(cursor.connection, table)
+            archived = sum(cursor.execute(f"SELECT COUNT(*) FROM {name}").fetchone()[0]
+                           for _, name in partitions)
+            print(f"  - {table}: {count} records (+{archived} in {len(partitions)} monthly partitions)")
+        else:
+            print(f"  - {table}: {count} records")
+
     # Check foreign key constraints
     cursor.execute("PRAGMA foreign_key_check")
     fk_violations = cursor.fetchall()
-    
+
     if fk_violations:
         print(f"\n[WARNING] Foreign key violations found: {len(fk_violations)}")
         for violation in fk_violations[:5]:
@@ -202,62 +352,97 @@ def verify_database(cursor):
     else:
         print("\n[OK] No foreign key violations")
 
-def main():
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Create the MarocRail SQLite database")
+    parser.add_argument('--no-bulk', dest='bulk', action='store_false',
+                        help="create indexes up front and enforce foreign keys on every insert")
+    return parser.parse_args(argv)
+
+def main(argv=None):
     """Main database creation process"""
+    args = parse_args(argv)
+
     print("=" * 60)
     print("  MarocRail-Optimizer - Database Creation")
     print("=" * 60)
     print()
-    
+
+    start = datetime.now()
+
     # Create database
-    conn, cursor = create_database()
-    
+    conn, cursor = create_database(bulk=args.bulk)
+
     try:
         # Load all data
         print("\n[1/6] Loading stations...")
         load_stations(cursor)
-        
+
         print("\n[2/6] Loading routes...")
         load_routes(cursor)
-        
+
         print("\n[3/6] Loading trains...")
         load_trains(cursor)
-        
+
         print("\n[4/6] Loading schedules...")
         load_schedules(cursor)
-        
+
         print("\n[5/6] Loading delays...")
         load_delays(cursor)
-        
+
         print("\n[6/6] Loading passenger data...")
         load_passengers(cursor)
-        
+
         # Commit all changes
         conn.commit()
-        
-        # Verify
+
+        if args.bulk:
+            print("\n[INFO] Building aggregates and indexes...")
+            finish_bulk_load(conn, cursor)
+
+        # Move months outside the hot window into their partitions
+        print("\n[INFO] Partitioning history by month...")
+        print_summary(maintain_partitions(conn))
+
+        # Verify (foreign keys are checked once here)
         verify_database(cursor)
-        
+
         # Optimize database
         print("\n[INFO] Optimizing database...")
         cursor.execute("ANALYZE")
-        cursor.execute("VACUUM")
+        if not args.bulk:
+            # A bulk-built file is written sequentially and needs no compaction
+            cursor.execute("VACUUM")
         conn.commit()
-        
+
+        # WAL lets readers keep going while the new data is swapped in
+        cursor.execute("PRAGMA journal_mode = WAL").fetchone()
+        # A cursor with a pending statement keeps the file locked after close()
+        cursor.close()
+        conn.close()
+
+        print("\n[INFO] Swapping new database into place...")
+        swap_database()
+        print("[OK] Live database replaced")
+
+        elapsed = (datetime.now() - start).total_seconds()
+
         print("\n" + "=" * 60)
         print("  [SUCCESS] Database created and populated!")
         print("=" * 60)
         print(f"\n  Database: {get_db_path()}")
         print(f"  Size: {os.path.getsize(get_db_path()) / 1024 / 1024:.2f} MB")
+        print(f"  Time: {elapsed:.1f} s")
         print()
-        
+
     except Exception as e:
+        # Nothing to roll back: the unfinished build file is removed below
         print(f"\n[ERROR] Database creation failed: {e}")
-        conn.rollback()
         raise
-    
+
     finally:
         conn.close()
+        if os.path.exists(get_build_path()):
+            os.remove(get_build_path())
 
 if __name__ == "__main__":
     main()
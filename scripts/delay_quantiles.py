@@ -0,0 +1,73 @@
+"""
+Quantile delay-duration prediction from the random forest regressor
+
+For every tree, the training targets that fall in each leaf are summarized
+into a few quantiles. At prediction time a single `apply` pass finds the
+leaf of every tree, and the per-leaf quantiles are averaged across trees
+(the "averaged leaf quantiles" approximation of a quantile regression
+forest). The first column of the table holds the leaf means, so the point
+estimate comes out of the same pass and matches `regressor.predict`.
+"""
+import numpy as np
+
+QUANTILES = [0.5, 0.9, 0.95]
+
+def _leaf_quantiles(leaves, y, quantiles):
+    """Quantiles of y grouped by leaf id (linear interpolation)"""
+    order = np.lexsort((y, leaves))
+    sorted_leaves = leaves[order]
+    sorted_y = y[order]
+
+    starts = np.flatnonzero(np.r_[True, sorted_leaves[1:] != sorted_leaves[:-1]])
+    counts = np.diff(np.r_[starts, len(sorted_y)])
+
+    values = np.empty((len(starts), len(quantiles)), dtype=np.float64)
+    for j, q in enumerate(quantiles):
+        pos = q * (counts - 1)
+        low = np.floor(pos).astype(np.int64)
+        high = np.ceil(pos).astype(np.int64)
+        frac = pos - low
+        y_low = sorted_y[starts + low]
+        y_high = sorted_y[starts + high]
+        values[:, j] = y_low + (y_high - y_low) * frac
+
+    return sorted_leaves[starts], values
+
+def fit_leaf_quantiles(forest, X, y, quantiles=QUANTILES):
+    """Build the (n_trees, max_nodes, 1 + n_quantiles) leaf value table"""
+    y = np.asarray(y, dtype=np.float64)
+    leaves = forest.apply(X)
+    n_trees = len(forest.estimators_)
+    max_nodes = max(est.tree_.node_count for est in forest.estimators_)
+
+    table = np.zeros((n_trees, max_nodes, 1 + len(quantiles)), dtype=np.float64)
+
+    for t, est in enumerate(forest.estimators_):
+        leaf_means = est.tree_.value[:, 0, 0]
+        table[t, :len(leaf_means), 0] = leaf_means
+        # Leaves that see no training row fall back to the leaf mean
+        table[t, :len(leaf_means), 1:] = leaf_means[:, None]
+
+        leaf_ids, values = _leaf_quantiles(leaves[:, t], y, quantiles)
+        table[t, leaf_ids, 1:] = values
+
+    return {'quantiles': list(quantiles), 'table': table}
+
+def predict_quantiles(forest, quantile_model, X):
+    """Mean and quantiles for each row of X in one forest pass
+
+    Returns an (n_rows, 1 + n_quantiles) array: mean first, then quantiles
+    in the order of quantile_model['quantiles'].
+    """
+    table = quantile_model['table']
+    leaves = forest.apply(X)
+
+    # Accumulate tree by tree to avoid an (n_rows, n_trees, k) intermediate
+    values = np.zeros((leaves.shape[0], table.shape[2]), dtype=np.float64)
+    for t in range(table.shape[0]):
+        values += table[t, leaves[:, t]]
+    return values / table.shape[0]
+
+def quantile_labels(quantile_model):
+    """Response keys for each quantile, e.g. 0.9 -> 'p90'"""
+    return [f"p{round(q * 100):d}" for q in quantile_model['quantiles']]
@@ -0,0 +1,78 @@
+"""
+Mergeable quantile sketches of delay minutes per route, hour and reason
+
+Each delay falls into a logarithmic bucket: bucket i >= 0 holds values in
+(GAMMA^(i-1), GAMMA^i] and ZERO_BUCKET holds delays of 0 minutes. The bucket
+bounds are built by repeated multiplication, in Python (BUCKET_UPPERS) and
+in the delay_sketch_buckets table of schema.sql alike, so SQL finds a
+bucket with one index lookup instead of ln(), which many SQLite builds lack. Reporting
+the bucket's midpoint 2*GAMMA^i/(GAMMA+1) puts every quantile within
+SKETCH_ALPHA relative error of the true value (the DDSketch construction).
+Sketches merge by adding bucket counts, so the delay_sketches table (one
+count per route, hour, reason and bucket, kept by trg_delays_sketches in
+schema.sql) can be summed over any slice at query time. The table size
+depends on the number of distinct values, not on the length of history.
+"""
+from bisect import bisect_left
+
+SKETCH_ALPHA = 0.02
+# (1 + SKETCH_ALPHA) / (1 - SKETCH_ALPHA) as a ratio of integers, so that
+# schema.sql computes the same double (51.0 / 49.0)
+GAMMA = 51 / 49
+ZERO_BUCKET = -1
+SKETCH_MAX_MINUTES = 1000000   # longer delays share the last bucket
+
+DEFAULT_QUANTILES = (0.5, 0.9, 0.99)
+
+def bucket_uppers():
+    """Upper bound of each bucket, as in delay_sketch_buckets"""
+    uppers = [1.0]
+    while uppers[-1] < SKETCH_MAX_MINUTES:
+        uppers.append(uppers[-1] * GAMMA)
+    return uppers
+
+BUCKET_UPPERS = bucket_uppers()
+
+# Bucket of a delay in SQL; trg_delays_sketches in schema.sql spells out the
+# same expression
+BUCKET_SQL = (f"CASE WHEN {{value}} < 1 THEN {ZERO_BUCKET} "
+              "ELSE COALESCE((SELECT bucket FROM delay_sketch_buckets "
+              "WHERE upper_minutes >= {value} ORDER BY upper_minutes LIMIT 1), "
+              "(SELECT MAX(bucket) FROM delay_sketch_buckets)) END")
+
+# Sketch dimension -> delay_sketches column
+DIMENSIONS = {
+    'route': 'route_id',
+    'hour': 'hour',
+    'reason': 'delay_reason',
+}
+
+def bucket_of(value):
+    """Bucket index of a delay (same as BUCKET_SQL)"""
+    if value < 1:
+        return ZERO_BUCKET
+    return min(bisect_left(BUCKET_UPPERS, value), len(BUCKET_UPPERS) - 1)
+
+def bucket_value(bucket):
+    """Representative value of a bucket, within SKETCH_ALPHA of anything in it"""
+    if bucket == ZERO_BUCKET:
+        return 0.0
+    return 2 * GAMMA ** bucket / (GAMMA + 1)
+
+def sketch_quantiles(buckets, quantiles=DEFAULT_QUANTILES):
+    """Quantile estimates of a merged sketch given (bucket, count) pairs in bucket order"""
+    buckets = [(bucket, count) for bucket, count in buckets if count]
+    total = sum(count for _, count in buckets)
+    if not total:
+        return {q: None for q in quantiles}
+
+    result = {}
+    for q in quantiles:
+        rank = q * (total - 1)
+        seen = 0
+        for bucket, count in buckets:
+            seen += count
+            if seen > rank:
+                result[q] = round(bucket_value(bucket), 2)
+                break
+    return result
@@ -0,0 +1,150 @@
+"""
+Shared feature transformer for delay prediction
+
+Used by training, the prediction API and the optimizer so all three build
+exactly the same feature matrix. `transform_batch` is the vectorized numpy
+path, `transform_one` builds a single row from a dict without pandas.
+"""
+import math
+
+import numpy as np
+
+FEATURE_COLUMNS = [
+    'hour', 'day_of_week', 'month', 'is_peak_hour', 'is_weekend',
+    'weather_cloudy', 'weather_foggy', 'weather_hot', 'weather_rainy', 'weather_sunny',
+    'train_type_code', 'capacity', 'distance_km', 'typical_duration_minutes',
+    'route_avg_delay', 'route_std_delay',
+    'season_autumn', 'season_spring', 'season_summer', 'season_winter'
+]
+
+# Raw inputs expected by both transform paths
+RAW_FIELDS = [
+    'hour', 'day_of_week', 'month', 'weather_condition', 'train_type_code',
+    'capacity', 'distance_km', 'typical_duration_minutes',
+    'route_avg_delay', 'route_std_delay'
+]
+
+WEATHER_CONDITIONS = ['cloudy', 'foggy', 'hot', 'rainy', 'sunny']
+SEASONS = ['autumn', 'spring', 'summer', 'winter']
+TRAIN_TYPE_CODES = {'Al Boraq': 3, 'TNR': 2, 'Regular': 1}
+
+# Day numbers follow SQLite strftime('%w'): Sunday=0 ... Saturday=6
+DAY_NUMBERS = {
+    'Sunday': 0, 'Monday': 1, 'Tuesday': 2, 'Wednesday': 3,
+    'Thursday': 4, 'Friday': 5, 'Saturday': 6
+}
+
+# Season by month number (index 0 unused)
+SEASON_BY_MONTH = ['winter', 'winter', 'winter', 'spring', 'spring', 'spring',
+                   'summer', 'summer', 'summer', 'autumn', 'autumn', 'autumn', 'winter']
+
+# Most frequent weather per season in the delay history
+TYPICAL_WEATHER = {'winter': 'rainy', 'spring': 'sunny', 'summer': 'sunny', 'autumn': 'rainy'}
+
+# Used when no route statistics were saved with the models
+DEFAULT_ROUTE_STATS = (15.0, 5.0)
+
+_COLUMN_INDEX = {col: i for i, col in enumerate(FEATURE_COLUMNS)}
+_SEASON_CODES = np.array([SEASONS.index(s) for s in SEASON_BY_MONTH])
+
+def season_for_month(month):
+    """Season name for a month number (1-12)"""
+    return SEASON_BY_MONTH[int(month)]
+
+def is_peak_hour(hour):
+    """Check if hour is during peak time"""
+    return (6 <= hour <= 9) or (17 <= hour <= 20)
+
+def _number(value):
+    """Float value with missing entries mapped to 0 (training uses fillna(0))"""
+    if value is None:
+        return 0.0
+    value = float(value)
+    return 0.0 if math.isnan(value) else value
+
+def transform_one(record):
+    """Build a (1, n_features) matrix from a dict of raw fields
+
+    Raises ValueError on a month outside 1-12.
+    """
+    hour = int(record['hour'])
+    day_of_week = int(record['day_of_week'])
+    month = int(record['month'])
+    if not 1 <= month <= 12:
+        raise ValueError("month must be between 1 and 12")
+    weather = record.get('weather_condition')
+    season = SEASON_BY_MONTH[month]
+
+    values = {
+        'hour': hour,
+        'day_of_week': day_of_week,
+        'month': month,
+        'is_peak_hour': 1.0 if is_peak_hour(hour) else 0.0,
+        'is_weekend': 1.0 if day_of_week in (0, 6) else 0.0,
+        'train_type_code': _number(record.get('train_type_code')),
+        'capacity': _number(record.get('capacity')),
+        'distance_km': _number(record.get('distance_km')),
+        'typical_duration_minutes': _number(record.get('typical_duration_minutes')),
+        'route_avg_delay': _number(record.get('route_avg_delay')),
+        'route_std_delay': _number(record.get('route_std_delay')),
+    }
+    for w in WEATHER_CONDITIONS:
+        values[f'weather_{w}'] = 1.0 if weather == w else 0.0
+    for s in SEASONS:
+        values[f'season_{s}'] = 1.0 if season == s else 0.0
+
+    return np.array([[values[col] for col in FEATURE_COLUMNS]], dtype=np.float64)
+
+def _column(raw, name, n_rows, dtype=np.float64):
+    """Raw column as an array of n_rows values (scalars are broadcast)"""
+    values = np.asarray(raw[name], dtype=dtype)
+    return np.broadcast_to(values, (n_rows,))
+
+def transform_batch(raw):
+    """Build an (n, n_features) matrix from columns of raw fields
+
+    `raw` is any mapping of column name to array-like, including a DataFrame.
+    Scalar values are broadcast to every row.
+    """
+    n_rows = len(raw['hour'])
+    X = np.zeros((n_rows, len(FEATURE_COLUMNS)), dtype=np.float64)
+
+    hour = _column(raw, 'hour', n_rows, np.int64)
+    day_of_week = _column(raw, 'day_of_week', n_rows, np.int64)
+    month = _column(raw, 'month', n_rows, np.int64)
+    weather = _column(raw, 'weather_condition', n_rows, object)
+
+    X[:, _COLUMN_INDEX['hour']] = hour
+    X[:, _COLUMN_INDEX['day_of_week']] = day_of_week
+    X[:, _COLUMN_INDEX['month']] = month
+    X[:, _COLUMN_INDEX['is_peak_hour']] = ((hour >= 6) & (hour <= 9)) | ((hour >= 17) & (hour <= 20))
+    X[:, _COLUMN_INDEX['is_weekend']] = (day_of_week == 0) | (day_of_week == 6)
+
+    for w in WEATHER_CONDITIONS:
+        X[:, _COLUMN_INDEX[f'weather_{w}']] = weather == w
+
+    for name in ['train_type_code', 'capacity', 'distance_km', 'typical_duration_minutes',
+                 'route_avg_delay', 'route_std_delay']:
+        X[:, _COLUMN_INDEX[name]] = _column(raw, name, n_rows)
+
+    season_codes = _SEASON_CODES[month]
+    for i, s in enumerate(SEASONS):
+        X[:, _COLUMN_INDEX[f'season_{s}']] = season_codes == i
+
+    return np.nan_to_num(X, nan=0.0, copy=False)
+
+def train_type_codes(train_types):
+    """Vectorized train type name to code mapping (unknown types map to NaN)"""
+    return np.array([TRAIN_TYPE_CODES.get(t, np.nan) for t in train_types], dtype=np.float64)
+
+def route_stats_for(route_stats, route_id):
+    """(avg, std) historical delay for a route, falling back to the default"""
+    if not route_stats:
+        return DEFAULT_ROUTE_STATS
+    return route_stats['routes'].get(int(route_id), route_stats['default'])
+
+def route_stats_columns(route_stats, route_ids):
+    """Arrays of (avg, std) historical delay for each route id"""
+    pairs = [route_stats_for(route_stats, route_id) for route_id in route_ids]
+    stats = np.array(pairs, dtype=np.float64).reshape(-1, 2)
+    return stats[:, 0], stats[:, 1]
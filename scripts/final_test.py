@@ -13,7 +13,7 @@ def test_system():
     errors = []
     
     # Test 1: Database
-    print("\n[1/5] Testing database...")
+    print("\n[1/6] Testing database...")
     try:
         import sqlite3
         db_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'database', 'marocrail.db')
@@ -31,7 +31,7 @@ def test_system():
         print(f"[FAIL] {e}")
     
     # Test 2: ML Models
-    print("\n[2/5] Testing ML models...")
+    print("\n[2/6] Testing ML models...")
     try:
         import joblib
         model_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'models')
@@ -43,7 +43,7 @@ def test_system():
         print(f"[FAIL] {e}")
     
     # Test 3: Flask app
-    print("\n[3/5] Testing Flask app...")
+    print("\n[3/6] Testing Flask app...")
     try:
         from app import app
         client = app.test_client()
@@ -57,7 +57,7 @@ def test_system():
         print(f"[FAIL] {e}")
     
     # Test 4: API endpoints
-    print("\n[4/5] Testing API endpoints...")
+    print("\n[4/6] Testing API endpoints...")
     try:
         from app import app
         client = app.test_client()
@@ -66,7 +66,16 @@ def test_system():
             '/api/stations',
             '/api/routes',
             '/api/schedules',
-            '/api/analytics/overview'
+            '/api/analytics/overview',
+            '/api/analytics/timeseries',
+            '/api/analytics/routes',
+            '/api/analytics/occupancy?group_by=hour',
+            '/api/dashboard/bootstrap',
+            '/api/analytics/delays/percentiles?group_by=reason',
+            '/api/journeys?from=Marrakech&to=Fes&day=Monday&depart_after=08:00',
+            '/api/network/matrix',
+            '/api/stations/nearby?lat=33.59&lon=-7.61&k=3',
+            '/api/search?q=mekn'
         ]
         
         all_ok = True
@@ -83,7 +92,7 @@ def test_system():
         print(f"[FAIL] {e}")
     
     # Test 5: Data files
-    print("\n[5/5] Testing data files...")
+    print("\n[5/6] Testing data files...")
     try:
         data_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data')
         required_files = [
@@ -105,6 +114,17 @@ def test_system():
         errors.append(f"Data files error: {e}")
         print(f"[FAIL] {e}")
     
+    # Test 6: Query plans
+    print("\n[6/6] Checking query plans...")
+    try:
+        from scripts.check_query_plans import check_query_plans
+        failures = check_query_plans()
+        if failures:
+            errors.append(f"{failures} queries fall back to scans or temp sorts")
+    except Exception as e:
+        errors.append(f"Query plan error: {e}")
+        print(f"[FAIL] {e}")
+    
     # Summary
     print("\n" + "="*60)
     if errors:
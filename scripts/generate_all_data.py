@@ -2,18 +2,22 @@
 Master script to generate all synthetic data
 Run this to create the complete dataset
 """
+import argparse
+import random
 import sys
 import os
 
 # Add parent directory to path
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from scripts.generate_stations import generate_stations
+from scripts.generate_stations import generate_stations, save_stations
 from scripts.generate_routes import generate_routes, save_routes
 from scripts.generate_trains import generate_trains, save_trains
 from scripts.generate_schedules import generate_schedules, save_schedules
 from scripts.generate_delays import generate_delays_for_period, save_delays
 from scripts.generate_passengers import generate_passengers_for_period, save_passengers
+from scripts.generate_network import generate_network
+from scripts.synthetic import DEFAULT_SEED, history_days
 from datetime import datetime, timedelta
 import json
 
@@ -24,27 +28,47 @@ def load_json(filename):
     with open(filepath, 'r', encoding='utf-8') as f:
         return json.load(f)
 
-def main():
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Generate the complete synthetic dataset")
+    parser.add_argument('--seed', type=int, default=DEFAULT_SEED, help="random seed")
+    parser.add_argument('--scale', type=float, default=1.0,
+                        help="history length as a multiple of 180 days")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help="processes generating days in parallel (output does not depend on it)")
+    parser.add_argument('--stations', type=int,
+                        help="generate a synthetic network of this many stations (scripts/generate_network.py)")
+    return parser.parse_args(argv)
+
+def main(argv=None):
     """Generate all synthetic data"""
+    args = parse_args(argv)
+    days = history_days(args.scale)
+    
+    # Schedules draw from the random module
+    random.seed(args.seed)
+    
     print("=" * 60)
     print("  MarocRail-Optimizer - Data Generation")
     print("=" * 60)
     print()
     
+    if args.stations:
+        network = generate_network(args.stations, args.seed)
+    
     # Step 1: Generate stations
     print("[1/6] Generating stations...")
-    stations = generate_stations()
+    stations = save_stations(network[0]) if args.stations else generate_stations()
     print()
     
     # Step 2: Generate routes
     print("[2/6] Generating routes...")
-    routes = generate_routes(stations)
+    routes = network[1] if args.stations else generate_routes(stations)
     save_routes(routes)
     print()
     
     # Step 3: Generate trains
     print("[3/6] Generating trains...")
-    trains = generate_trains()
+    trains = network[2] if args.stations else generate_trains()
     save_trains(trains)
     print()
     
@@ -54,17 +78,19 @@ def main():
     save_schedules(schedules)
     print()
     
-    # Step 5: Generate delays (6 months history)
-    print("[5/6] Generating delay history...")
-    start_date = datetime.now() - timedelta(days=180)
-    delays = generate_delays_for_period(schedules, start_date, days=180)
-    save_delays(delays)
+    # Step 5: Generate delays (history ending today)
+    print(f"[5/6] Generating delay history ({days} days)...")
+    start_date = datetime.now() - timedelta(days=days)
+    delays = generate_delays_for_period(schedules, start_date, days, args.seed, args.workers)
+    delay_count = save_delays(delays, days)
+    del delays
     print()
     
     # Step 6: Generate passenger flow
     print("[6/6] Generating passenger flow data...")
-    passengers = generate_passengers_for_period(schedules, start_date, days=180)
-    save_passengers(passengers)
+    passengers = generate_passengers_for_period(schedules, start_date, days, args.seed, args.workers)
+    passenger_count = save_passengers(passengers, days)
+    del passengers
     print()
     
     # Summary
@@ -75,8 +101,8 @@ def main():
     print(f"  Routes: {len(routes)}")
     print(f"  Trains: {len(trains)}")
     print(f"  Weekly Schedules: {len(schedules)}")
-    print(f"  Delay Records (6 months): {len(delays)}")
-    print(f"  Passenger Records (6 months): {len(passengers)}")
+    print(f"  Delay Records ({days} days): {delay_count}")
+    print(f"  Passenger Records ({days} days): {passenger_count}")
     print("=" * 60)
     print()
     print("Next steps:")
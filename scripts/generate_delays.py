@@ -1,11 +1,22 @@
 """
 Generate synthetic historical delay data with realistic patterns
+
+Each day is generated with numpy for all of that day's trains at once (see
+scripts/synthetic.py for seeding and multi-process generation).
 """
+import argparse
 import json
 import os
-import random
+import sys
 from datetime import datetime, timedelta
 
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scripts.synthetic import (DEFAULT_SEED, DAYS_OF_WEEK, history_days, history_dates,
+                               schedule_table, run_days, write_records)
+
 # Delay reasons and their characteristics
 DELAY_REASONS = {
     "weather": {
@@ -40,7 +51,26 @@ DELAY_REASONS = {
     }
 }
 
+REASON_NAMES = list(DELAY_REASONS)
+MIN_DELAY = np.array([spec['min_delay'] for spec in DELAY_REASONS.values()])
+MAX_DELAY = np.array([spec['max_delay'] for spec in DELAY_REASONS.values()])
+CASCADE = REASON_NAMES.index("cascade")
+
 WEATHER_CONDITIONS = ["sunny", "cloudy", "rainy", "foggy", "hot"]
+
+# Daily weather distribution per season
+SEASON_WEATHER = {
+    "winter": (["rainy", "cloudy", "foggy", "sunny"], [0.4, 0.3, 0.2, 0.1]),
+    "summer": (["sunny", "hot", "cloudy"], [0.5, 0.4, 0.1]),
+    "autumn": (["rainy", "cloudy", "sunny"], [0.35, 0.35, 0.3]),
+    "spring": (["sunny", "cloudy", "rainy"], [0.5, 0.3, 0.2]),
+}
+
+RESOLVED_PROBABILITY = 0.75
+
+# Stream number of the delay generator in scripts/synthetic.py
+DELAY_STREAM = 0
+
 SEASON_MONTHS = {
     "winter": [12, 1, 2],
     "spring": [3, 4, 5],
@@ -56,159 +86,130 @@ def get_season(month):
     return "spring"
 
 def is_peak_hour(hour):
-    """Check if hour is during peak time"""
-    return (6 <= hour <= 9) or (17 <= hour <= 20)
+    """Check if hour is during peak time (works on arrays)"""
+    return ((6 <= hour) & (hour <= 9)) | ((17 <= hour) & (hour <= 20))
 
-def get_weather_for_season(season):
+def get_weather_for_season(season, rng):
     """Get realistic weather for season"""
-    if season == "winter":
-        return random.choices(["rainy", "cloudy", "foggy", "sunny"], weights=[0.4, 0.3, 0.2, 0.1])[0]
-    elif season == "summer":
-        return random.choices(["sunny", "hot", "cloudy"], weights=[0.5, 0.4, 0.1])[0]
-    elif season == "autumn":
-        return random.choices(["rainy", "cloudy", "sunny"], weights=[0.35, 0.35, 0.3])[0]
-    else:  # spring
-        return random.choices(["sunny", "cloudy", "rainy"], weights=[0.5, 0.3, 0.2])[0]
-
-def should_delay_occur(schedule, weather, season, is_weekend, previous_delays):
-    """Determine if a delay should occur and what type"""
-    hour = int(schedule['departure_time'].split(':')[0])
-    
-    # Check each delay reason
-    for reason, specs in DELAY_REASONS.items():
-        prob = specs['probability']
-        
-        # Adjust probability based on conditions
-        if reason == "weather":
-            if season in specs.get('seasons', []) and weather in ["rainy", "foggy"]:
-                prob *= 2.5
-            elif weather == "hot":
-                prob *= 1.3
-            else:
-                prob *= 0.3
-        
-        elif reason == "passenger":
-            if is_peak_hour(hour):
-                prob *= 2.0
-        
-        elif reason == "maintenance":
-            if is_weekend:
-                prob *= 2.0
-            else:
-                prob *= 0.5
-        
-        elif reason == "cascade":
-            # Cascade delays happen when previous trains on same route are delayed
-            if previous_delays > 0:
-                prob *= (1 + previous_delays * 0.5)
-        
-        # Roll for delay
-        if random.random() < prob:
-            delay_minutes = random.randint(specs['min_delay'], specs['max_delay'])
-            return reason, delay_minutes
-    
-    return None, 0
+    options, weights = SEASON_WEATHER[season]
+    return options[rng.choice(len(options), p=weights)]
 
-def generate_delays_for_period(schedules, start_date, days=180):
-    """Generate 6 months of delay history"""
-    delays = []
-    delay_id = 1
-    
-    # Track delays by route for cascade effect
-    route_delays = {}
-    
-    for day_offset in range(days):
-        current_date = start_date + timedelta(days=day_offset)
-        day_name = current_date.strftime("%A")
-        is_weekend = day_name in ["Saturday", "Sunday"]
-        month = current_date.month
-        season = get_season(month)
-        
-        # Daily weather
-        weather = get_weather_for_season(season)
-        
-        # Reset route delays at start of day
-        route_delays = {}
-        
-        # Get schedules for this day
-        day_schedules = [s for s in schedules if s['day_of_week'] == day_name]
-        
-        # Sort by departure time to handle cascade effects
-        day_schedules.sort(key=lambda x: x['departure_time'])
-        
-        for schedule in day_schedules:
-            route_id = schedule['route_id']
-            previous_route_delays = route_delays.get(route_id, 0)
-            
-            # Check if delay occurs
-            reason, delay_minutes = should_delay_occur(
-                schedule, weather, season, is_weekend, previous_route_delays
-            )
-            
-            if reason:
-                # Create delay record
-                timestamp = datetime.combine(current_date, 
-                    datetime.strptime(schedule['departure_time'], "%H:%M").time())
-                
-                delay = {
-                    "delay_id": delay_id,
-                    "schedule_id": schedule['schedule_id'],
-                    "train_number": schedule['train_number'],
-                    "route_id": route_id,
-                    "origin_name": schedule['origin_name'],
-                    "destination_name": schedule['destination_name'],
-                    "delay_minutes": delay_minutes,
-                    "delay_reason": reason,
-                    "weather_condition": weather,
-                    "timestamp": timestamp.isoformat(),
-                    "date": current_date.strftime("%Y-%m-%d"),
-                    "day_of_week": day_name,
-                    "hour": int(schedule['departure_time'].split(':')[0]),
-                    "season": season,
-                    "resolved": random.choice([True, True, True, False])  # 75% resolved
-                }
-                
-                delays.append(delay)
-                delay_id += 1
-                
-                # Track for cascade effect
-                route_delays[route_id] = route_delays.get(route_id, 0) + 1
-    
-    return delays
+def reason_probabilities(hour, weather, season, is_weekend):
+    """(n, 4) probabilities of the non-cascade reasons, in DELAY_REASONS order"""
+    probs = np.empty((len(hour), CASCADE))
+
+    weather_factor = 0.3
+    if season in DELAY_REASONS["weather"]["seasons"] and weather in ["rainy", "foggy"]:
+        weather_factor = 2.5
+    elif weather == "hot":
+        weather_factor = 1.3
+
+    probs[:, 0] = DELAY_REASONS["weather"]["probability"] * weather_factor
+    probs[:, 1] = DELAY_REASONS["technical"]["probability"]
+    # More passenger delays during peak hours
+    probs[:, 2] = DELAY_REASONS["passenger"]["probability"] * np.where(is_peak_hour(hour), 2.0, 1.0)
+    # More maintenance on weekends
+    probs[:, 3] = DELAY_REASONS["maintenance"]["probability"] * (2.0 if is_weekend else 0.5)
+    return probs
 
-def save_delays(delays):
+def route_ranks(route_id):
+    """Position of each trip among the earlier trips of its route (input in departure order)"""
+    routes, codes = np.unique(route_id, return_inverse=True)
+    order = np.argsort(codes, kind='stable')
+    starts = np.searchsorted(codes[order], np.arange(len(routes)))
+    ranks = np.empty(len(codes), dtype=np.int64)
+    ranks[order] = np.arange(len(codes)) - starts[codes[order]]
+    return codes, ranks, len(routes)
+
+def delays_for_day(table, day, rng):
+    """JSON bodies and per-reason counts of one day's delays
+
+    A trip gets the first reason whose roll succeeds, in DELAY_REASONS
+    order. Cascade delays become likelier with every earlier delay on the
+    same route that day, so they are resolved trip rank by trip rank.
+    """
+    day_name = DAYS_OF_WEEK[day.weekday()]
+    is_weekend = day_name in ["Saturday", "Sunday"]
+    season = get_season(day.month)
+    weather = get_weather_for_season(season, rng)
+
+    idx = table['by_departure'][day.weekday()]
+    hour = table['departure_minute'][idx] // 60
+
+    rolls = rng.random((len(idx), len(REASON_NAMES)))
+    hits = rolls[:, :CASCADE] < reason_probabilities(hour, weather, season, is_weekend)
+    reason = np.where(hits.any(axis=1), hits.argmax(axis=1), -1)
+
+    # Cascade: each route's trips in departure order, all routes at once
+    codes, ranks, n_routes = route_ranks(table['route_id'][idx])
+    route_delays = np.zeros(n_routes, dtype=np.int64)
+    cascade_prob = DELAY_REASONS["cascade"]["probability"]
+    for rank in range(ranks.max() + 1 if len(ranks) else 0):
+        trips = np.flatnonzero(ranks == rank)
+        previous = route_delays[codes[trips]]
+        free = reason[trips] < 0
+        cascade = free & (rolls[trips, CASCADE] < cascade_prob * (1 + previous * 0.5))
+        reason[trips[cascade]] = CASCADE
+        route_delays[codes[trips]] += reason[trips] >= 0
+
+    delayed = np.flatnonzero(reason >= 0)
+    reasons = reason[delayed]
+    minutes = rng.integers(MIN_DELAY[reasons], MAX_DELAY[reasons] + 1)
+    resolved = rng.random(len(delayed)) < RESOLVED_PROBABILITY
+
+    date = day.isoformat()
+    trip_json, departure_time = table['trip_json'], table['departure_time']
+    rows = [
+        f'{trip_json[i]}, "delay_minutes": {m}, "delay_reason": "{REASON_NAMES[r]}", '
+        f'"weather_condition": "{weather}", "timestamp": "{date}T{departure_time[i]}:00", '
+        f'"date": "{date}", "day_of_week": "{day_name}", "hour": {h}, "season": "{season}", '
+        f'"resolved": {"true" if done else "false"}}}'
+        for i, m, r, h, done in zip(idx[delayed].tolist(), minutes.tolist(), reasons.tolist(),
+                                    hour[delayed].tolist(), resolved.tolist())
+    ]
+    return rows, np.bincount(reasons, minlength=len(REASON_NAMES))
+
+def generate_delays_for_period(schedules, start_date, days=180, seed=DEFAULT_SEED, workers=1):
+    """Generate delay history, as per-day (JSON bodies, reason counts) results"""
+    return run_days(delays_for_day, DELAY_STREAM, schedule_table(schedules),
+                    history_dates(start_date, days), seed, workers)
+
+def save_delays(day_results, days=180):
     """Save delays to JSON file"""
-    output_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data')
-    os.makedirs(output_dir, exist_ok=True)
-    
-    output_file = os.path.join(output_dir, 'delays.json')
-    
-    with open(output_file, 'w', encoding='utf-8') as f:
-        json.dump(delays, f, indent=2, ensure_ascii=False)
-    
+    output_file, total_delays = write_records('delays.json', 'delay_id',
+                                              (rows for rows, _ in day_results))
+
     # Statistics
-    total_delays = len(delays)
-    by_reason = {}
-    for delay in delays:
-        reason = delay['delay_reason']
-        by_reason[reason] = by_reason.get(reason, 0) + 1
-    
-    print(f"[OK] Generated {total_delays} delay records (6 months)")
+    by_reason = sum((counts for _, counts in day_results), np.zeros(len(REASON_NAMES), dtype=np.int64))
+
+    print(f"[OK] Generated {total_delays} delay records ({days} days)")
     print(f"  Breakdown by reason:")
-    for reason, count in sorted(by_reason.items(), key=lambda x: x[1], reverse=True):
-        pct = (count / total_delays) * 100
+    for reason, count in sorted(zip(REASON_NAMES, by_reason.tolist()), key=lambda x: x[1], reverse=True):
+        pct = (count / total_delays) * 100 if total_delays else 0.0
         print(f"    - {reason}: {count} ({pct:.1f}%)")
     print(f"[OK] Saved to: {output_file}")
-    return delays
+    return total_delays
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Generate synthetic delay history")
+    parser.add_argument('--seed', type=int, default=DEFAULT_SEED, help="random seed")
+    parser.add_argument('--scale', type=float, default=1.0,
+                        help="history length as a multiple of 180 days")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help="processes generating days in parallel (output does not depend on it)")
+    return parser.parse_args(argv)
 
 if __name__ == "__main__":
+    args = parse_args()
+    
     # Load schedules
     data_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data')
     
     with open(os.path.join(data_dir, 'schedules.json'), 'r', encoding='utf-8') as f:
         schedules = json.load(f)
     
-    # Generate 6 months of delay history (starting 6 months ago)
-    start_date = datetime.now() - timedelta(days=180)
-    delays = generate_delays_for_period(schedules, start_date, days=180)
-    save_delays(delays)
+    # History ending today
+    days = history_days(args.scale)
+    start_date = datetime.now() - timedelta(days=days)
+    results = generate_delays_for_period(schedules, start_date, days, args.seed, args.workers)
+    save_delays(results, days)
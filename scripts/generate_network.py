@@ -0,0 +1,210 @@
+"""
+Generate a large synthetic railway network for scale testing
+
+Keeps the 10 real stations and their routes, then adds synthetic towns
+across Morocco. Every station is linked to its nearest neighbours, a
+minimum spanning tree over those links (plus bridges between any
+remaining components) makes the network connected, and a share of the
+other neighbour links adds alternative paths. Routes run in both
+directions with haversine distances from calculate_distance.
+
+The output has the same format as generate_stations.py /
+generate_routes.py / generate_trains.py, so the schedule, delay and
+passenger generators run on it unchanged.
+"""
+import argparse
+import os
+import sys
+
+import numpy as np
+from sklearn.neighbors import NearestNeighbors
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scripts.generate_stations import STATIONS, save_stations
+from scripts.generate_routes import calculate_distance, generate_routes, save_routes
+from scripts.generate_trains import generate_trains, save_trains
+from scripts.synthetic import DEFAULT_SEED
+
+EARTH_RADIUS_KM = 6371
+
+# Area synthetic towns are placed in (roughly northern and central Morocco)
+LATITUDE_RANGE = (29.5, 35.8)
+LONGITUDE_RANGE = (-10.0, -1.9)
+TOWN_SPREAD_DEG = 0.03      # spread of a town's stations (~3 km)
+STATIONS_PER_TOWN = 2.5     # average
+
+NEIGHBOURS = 4              # nearest stations considered for links
+EXTRA_LINK_SHARE = 0.35     # share of non-tree neighbour links kept
+AVERAGE_SPEED_KMH = 95      # for typical route durations
+BASE_ROUTES = 25            # routes of the real network, the fleet is scaled from this
+
+def generate_towns(rng, station_count):
+    """Synthetic stations grouped into towns"""
+    town_count = max(1, int(np.ceil(station_count / STATIONS_PER_TOWN)))
+    centers = np.column_stack([rng.uniform(*LATITUDE_RANGE, town_count),
+                               rng.uniform(*LONGITUDE_RANGE, town_count)])
+    town = np.sort(rng.integers(0, town_count, station_count))
+    coords = centers[town] + rng.normal(0, TOWN_SPREAD_DEG, (station_count, 2))
+    platforms_minor = rng.integers(2, 7, station_count)
+    platforms_major = rng.integers(6, 13, station_count)
+    capacity_per_platform = rng.integers(4, 8, station_count) * 100
+
+    town_sizes = np.bincount(town, minlength=town_count)
+    stations = []
+    station_id = len(STATIONS) + 1
+    seen = {}
+    for i in range(station_count):
+        t = int(town[i])
+        city = f"Ville-{t + 1:04d}"
+        number = seen[t] = seen.get(t, 0) + 1
+        is_major = bool(number == 1 and town_sizes[t] >= 3)
+        platform_count = int(platforms_major[i] if is_major else platforms_minor[i])
+
+        stations.append({
+            "station_id": station_id,
+            "name": city if number == 1 else f"{city} {number}",
+            "city": city,
+            "latitude": round(float(coords[i, 0]), 4),
+            "longitude": round(float(coords[i, 1]), 4),
+            "platform_count": platform_count,
+            "capacity": platform_count * int(capacity_per_platform[i]),
+            "is_major": is_major
+        })
+        station_id += 1
+
+    return stations
+
+def find(parent, i):
+    """Union-find root with path halving"""
+    while parent[i] != i:
+        parent[i] = parent[parent[i]]
+        i = parent[i]
+    return i
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """Vectorized haversine distance in km (inputs in radians)"""
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(a))
+
+def link_stations(rng, stations, fixed_links, neighbours=NEIGHBOURS, extra_share=EXTRA_LINK_SHARE):
+    """Undirected (index, index) links making the stations one connected network"""
+    points = np.radians([[s['latitude'], s['longitude']] for s in stations])
+    n = len(points)
+    parent = list(range(n))
+    links = set()
+
+    for a, b in fixed_links:
+        links.add((min(a, b), max(a, b)))
+        parent[find(parent, a)] = find(parent, b)
+
+    # Candidate links: each station's nearest neighbours, shortest first
+    k = min(neighbours + 1, n)
+    distances, indices = NearestNeighbors(n_neighbors=k, metric='haversine').fit(points).kneighbors(points)
+    candidates = {}
+    for i in range(n):
+        for d, j in zip(distances[i, 1:], indices[i, 1:]):
+            candidates[(min(i, j), max(i, j))] = d
+
+    extra = []
+    for (a, b), _ in sorted(candidates.items(), key=lambda item: item[1]):
+        if (a, b) in links:
+            continue
+        ra, rb = find(parent, a), find(parent, b)
+        if ra != rb:
+            parent[ra] = rb
+            links.add((a, b))
+        else:
+            extra.append((a, b))
+
+    # Bridge components the neighbour links left apart, nearest pair first
+    roots = np.array([find(parent, i) for i in range(n)])
+    components = sorted(np.unique(roots), key=lambda r: -(roots == r).sum())
+    connected = roots == components[0]
+    for root in components[1:]:
+        members = np.flatnonzero(roots == root)
+        others = np.flatnonzero(connected)
+        d = haversine_km(points[members, 0, None], points[members, 1, None],
+                         points[others, 0], points[others, 1])
+        i, j = np.unravel_index(np.argmin(d), d.shape)
+        a, b = int(members[i]), int(others[j])
+        links.add((min(a, b), max(a, b)))
+        connected[members] = True
+
+    # Keep some of the remaining neighbour links as alternative paths
+    keep = rng.random(len(extra)) < extra_share
+    links.update(link for link, kept in zip(extra, keep) if kept)
+
+    return sorted(links)
+
+def typical_duration(distance_km):
+    """Typical travel time in minutes, rounded to 5 minutes"""
+    return max(10, int(round(distance_km / AVERAGE_SPEED_KMH * 60 / 5)) * 5)
+
+def generate_network(station_count=1000, seed=DEFAULT_SEED, neighbours=NEIGHBOURS,
+                     extra_share=EXTRA_LINK_SHARE):
+    """Stations, routes and a proportionally sized fleet for a large network"""
+    rng = np.random.default_rng(seed)
+
+    stations = [dict(s) for s in STATIONS]
+    stations += generate_towns(rng, max(0, station_count - len(STATIONS)))
+    routes = generate_routes(stations)
+
+    index = {s['station_id']: i for i, s in enumerate(stations)}
+    fixed = [(index[r['origin_station_id']], index[r['destination_station_id']]) for r in routes]
+    existing = {(r['origin_station_id'], r['destination_station_id']) for r in routes}
+
+    route_id = len(routes) + 1
+    for a, b in link_stations(rng, stations, fixed, neighbours, extra_share):
+        origin, dest = stations[a], stations[b]
+        distance = calculate_distance(origin['latitude'], origin['longitude'],
+                                      dest['latitude'], dest['longitude'])
+        for o, d in ((origin, dest), (dest, origin)):
+            if (o['station_id'], d['station_id']) in existing:
+                continue
+            routes.append({
+                "route_id": route_id,
+                "origin_station_id": o['station_id'],
+                "origin_name": o['name'],
+                "destination_station_id": d['station_id'],
+                "destination_name": d['name'],
+                "distance_km": distance,
+                "typical_duration_minutes": typical_duration(distance)
+            })
+            existing.add((o['station_id'], d['station_id']))
+            route_id += 1
+
+    trains = generate_trains(scale=max(1.0, len(routes) / BASE_ROUTES))
+    return stations, routes, trains
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Generate a large synthetic network for scale testing")
+    parser.add_argument('--stations', type=int, default=1000, help="total number of stations")
+    parser.add_argument('--seed', type=int, default=DEFAULT_SEED, help="random seed")
+    parser.add_argument('--neighbours', type=int, default=NEIGHBOURS,
+                        help="nearest stations each station may link to")
+    parser.add_argument('--extra-links', type=float, default=EXTRA_LINK_SHARE,
+                        help="share of non-tree neighbour links kept as alternative paths")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    print("="*60)
+    print("  MarocRail-Optimizer - Network Generation")
+    print("="*60)
+
+    stations, routes, trains = generate_network(args.stations, args.seed, args.neighbours,
+                                                args.extra_links)
+    save_stations(stations)
+    save_routes(routes)
+    save_trains(trains)
+
+    print("\nNext steps:")
+    print("  python scripts/generate_schedules.py")
+    print(f"  python scripts/generate_delays.py --seed {args.seed}")
+    print(f"  python scripts/generate_passengers.py --seed {args.seed}")
+    print("  python scripts/create_database.py")
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,22 @@
 """
 Generate synthetic passenger flow data
+
+Each day is generated with numpy for all of that day's trains at once (see
+scripts/synthetic.py for seeding and multi-process generation).
 """
+import argparse
 import json
 import os
-import random
+import sys
 from datetime import datetime, timedelta
 
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scripts.synthetic import (DEFAULT_SEED, DAYS_OF_WEEK, history_days, history_dates,
+                               schedule_table, run_days, write_records)
+
 # Busy routes have higher passenger counts
 BUSY_ROUTES = {
     (1, 3): 1.5,  # Casa-Port to Rabat
@@ -16,25 +27,42 @@ BUSY_ROUTES = {
     (8, 2): 1.3,  # Marrakech to Casa
 }
 
-def get_route_key(schedule):
-    """Get route key for passenger multiplier"""
-    return (schedule['origin_station_id'], schedule['destination_station_id'])
+# Moroccan fixed-date public holidays (month, day), approximate
+HOLIDAYS = {
+    (1, 1),    # New Year
+    (5, 1),    # Labor Day
+    (7, 30),   # Throne Day
+    (8, 14),   # Oued Dahab
+}
+
+# Days booked in advance and their probabilities
+BOOKING_ADVANCE_DAYS = np.array([1, 2, 3, 7, 14, 21, 30])
+BOOKING_ADVANCE_WEIGHTS = np.array([0.15, 0.15, 0.15, 0.20, 0.15, 0.10, 0.10])
+
+# Stream number of the passenger generator in scripts/synthetic.py
+PASSENGER_STREAM = 1
 
 def is_peak_hour(hour):
-    """Check if hour is during peak time"""
-    return (6 <= hour <= 9) or (17 <= hour <= 20)
+    """Check if hour is during peak time (works on arrays)"""
+    return ((6 <= hour) & (hour <= 9)) | ((17 <= hour) & (hour <= 20))
 
-def calculate_passenger_count(schedule, day_name, is_holiday=False):
-    """Calculate realistic passenger count"""
-    base_capacity = schedule['capacity']
-    hour = int(schedule['departure_time'].split(':')[0])
-    
-    # Base occupancy: 50-70% on average
-    occupancy_rate = random.uniform(0.5, 0.7)
+def route_multipliers(table):
+    """Busy route multiplier of every schedule"""
+    multiplier = np.ones(len(table['route_id']))
+    for (origin, destination), factor in BUSY_ROUTES.items():
+        busy = (table['origin_station_id'] == origin) & (table['destination_station_id'] == destination)
+        multiplier[busy] = factor
+    return multiplier
+
+def calculate_passenger_counts(table, idx, day_name, is_holiday, rng):
+    """Realistic passenger counts for the schedules idx on one day"""
+    capacity = table['capacity'][idx]
+    hour = table['departure_minute'][idx] // 60
     
-    # Peak hours: 80-95% occupancy
-    if is_peak_hour(hour):
-        occupancy_rate = random.uniform(0.8, 0.95)
+    # Base occupancy: 50-70% on average, 80-95% during peak hours
+    base_rate = rng.uniform(0.5, 0.7, len(idx))
+    peak_rate = rng.uniform(0.8, 0.95, len(idx))
+    occupancy_rate = np.where(is_peak_hour(hour), peak_rate, base_rate)
     
     # Weekend patterns
     if day_name in ['Friday', 'Saturday']:
@@ -47,109 +75,86 @@ def calculate_passenger_count(schedule, day_name, is_holiday=False):
         occupancy_rate *= 1.3
     
     # Busy route multiplier
-    route_key = get_route_key(schedule)
-    route_multiplier = BUSY_ROUTES.get(route_key, 1.0)
-    occupancy_rate *= route_multiplier
+    occupancy_rate *= table['route_multiplier'][idx]
     
     # Premium trains (Al Boraq) tend to have lower occupancy
-    if schedule['train_type'] == 'Al Boraq':
-        occupancy_rate *= 0.85
+    occupancy_rate *= np.where(table['is_boraq'][idx], 0.85, 1.0)
     
-    # Cap at 100% and add some randomness
-    occupancy_rate = min(occupancy_rate, 1.0)
-    passenger_count = int(base_capacity * occupancy_rate)
+    # Cap at 100% and add some randomness (±10%)
+    occupancy_rate = np.minimum(occupancy_rate, 1.0)
+    passenger_count = (capacity * occupancy_rate).astype(np.int64)
+    variation = np.trunc(passenger_count * rng.uniform(-0.1, 0.1, len(idx))).astype(np.int64)
     
-    # Add randomness (±10%)
-    variation = int(passenger_count * random.uniform(-0.1, 0.1))
-    passenger_count = max(0, passenger_count + variation)
-    
-    return passenger_count
+    return np.maximum(0, passenger_count + variation)
 
-def generate_passengers_for_period(schedules, start_date, days=180):
-    """Generate 6 months of passenger flow data"""
-    passengers = []
-    record_id = 1
-    
-    # Moroccan holidays (approximate)
-    holidays = [
-        datetime(2024, 1, 1),   # New Year
-        datetime(2024, 5, 1),   # Labor Day
-        datetime(2024, 7, 30),  # Throne Day
-        datetime(2024, 8, 14),  # Oued Dahab
-        # Add more as needed
+def passengers_for_day(table, day, rng):
+    """JSON bodies, passenger total and occupancy sum of one day's trips"""
+    day_name = DAYS_OF_WEEK[day.weekday()]
+    is_holiday = (day.month, day.day) in HOLIDAYS
+    idx = table['by_day'][day.weekday()]
+    
+    # Booking date: typically 1-30 days before travel
+    advance = BOOKING_ADVANCE_DAYS[rng.choice(len(BOOKING_ADVANCE_DAYS), size=len(idx),
+                                              p=BOOKING_ADVANCE_WEIGHTS)]
+    booking_dates = (np.datetime64(day) - advance).astype(str)
+    
+    counts = calculate_passenger_counts(table, idx, day_name, is_holiday, rng)
+    capacity = table['capacity'][idx]
+    occupancy = [round(c / cap, 2) for c, cap in zip(counts.tolist(), capacity.tolist())]
+    
+    date = day.isoformat()
+    trip_json, departure_time, train_type = table['trip_json'], table['departure_time'], table['train_type']
+    rows = [
+        f'{trip_json[i]}, "passenger_count": {c}, "capacity": {cap}, "occupancy_rate": {rate}, '
+        f'"booking_date": "{booked}", "travel_date": "{date}", "day_of_week": "{day_name}", '
+        f'"departure_time": "{departure_time[i]}", "train_type": "{train_type[i]}"}}'
+        for i, c, cap, rate, booked in zip(idx.tolist(), counts.tolist(), capacity.tolist(),
+                                           occupancy, booking_dates.tolist())
     ]
-    holiday_dates = {h.date() for h in holidays}
-    
-    for day_offset in range(days):
-        current_date = start_date + timedelta(days=day_offset)
-        day_name = current_date.strftime("%A")
-        is_holiday = current_date.date() in holiday_dates
-        
-        # Get schedules for this day
-        day_schedules = [s for s in schedules if s['day_of_week'] == day_name]
-        
-        for schedule in day_schedules:
-            # Booking date: typically 1-30 days before travel
-            days_advance = random.choices(
-                [1, 2, 3, 7, 14, 21, 30],
-                weights=[0.15, 0.15, 0.15, 0.20, 0.15, 0.10, 0.10]
-            )[0]
-            booking_date = current_date - timedelta(days=days_advance)
-            
-            # Calculate passengers
-            passenger_count = calculate_passenger_count(schedule, day_name, is_holiday)
-            
-            record = {
-                "record_id": record_id,
-                "schedule_id": schedule['schedule_id'],
-                "train_number": schedule['train_number'],
-                "route_id": schedule['route_id'],
-                "origin_name": schedule['origin_name'],
-                "destination_name": schedule['destination_name'],
-                "passenger_count": passenger_count,
-                "capacity": schedule['capacity'],
-                "occupancy_rate": round(passenger_count / schedule['capacity'], 2),
-                "booking_date": booking_date.strftime("%Y-%m-%d"),
-                "travel_date": current_date.strftime("%Y-%m-%d"),
-                "day_of_week": day_name,
-                "departure_time": schedule['departure_time'],
-                "train_type": schedule['train_type']
-            }
-            
-            passengers.append(record)
-            record_id += 1
-    
-    return passengers
+    return rows, int(counts.sum()), sum(occupancy)
+
+def generate_passengers_for_period(schedules, start_date, days=180, seed=DEFAULT_SEED, workers=1):
+    """Generate passenger history, as per-day (JSON bodies, passengers, occupancy sum) results"""
+    table = schedule_table(schedules)
+    table['route_multiplier'] = route_multipliers(table)
+    return run_days(passengers_for_day, PASSENGER_STREAM, table,
+                    history_dates(start_date, days), seed, workers)
 
-def save_passengers(passengers):
+def save_passengers(day_results, days=180):
     """Save passenger data to JSON file"""
-    output_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data')
-    os.makedirs(output_dir, exist_ok=True)
-    
-    output_file = os.path.join(output_dir, 'passengers.json')
-    
-    with open(output_file, 'w', encoding='utf-8') as f:
-        json.dump(passengers, f, indent=2, ensure_ascii=False)
+    output_file, total_records = write_records('passengers.json', 'record_id',
+                                               (rows for rows, _, _ in day_results))
     
     # Statistics
-    total_records = len(passengers)
-    total_passengers = sum(p['passenger_count'] for p in passengers)
-    avg_occupancy = sum(p['occupancy_rate'] for p in passengers) / total_records
+    total_passengers = sum(total for _, total, _ in day_results)
+    avg_occupancy = sum(occupancy for _, _, occupancy in day_results) / max(total_records, 1)
     
-    print(f"[OK] Generated {total_records} passenger flow records (6 months)")
+    print(f"[OK] Generated {total_records} passenger flow records ({days} days)")
     print(f"  - Total passengers: {total_passengers:,}")
     print(f"  - Average occupancy: {avg_occupancy:.1%}")
     print(f"[OK] Saved to: {output_file}")
-    return passengers
+    return total_records
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Generate synthetic passenger flow history")
+    parser.add_argument('--seed', type=int, default=DEFAULT_SEED, help="random seed")
+    parser.add_argument('--scale', type=float, default=1.0,
+                        help="history length as a multiple of 180 days")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help="processes generating days in parallel (output does not depend on it)")
+    return parser.parse_args(argv)
 
 if __name__ == "__main__":
+    args = parse_args()
+    
     # Load schedules
     data_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data')
     
     with open(os.path.join(data_dir, 'schedules.json'), 'r', encoding='utf-8') as f:
         schedules = json.load(f)
     
-    # Generate 6 months of passenger data
-    start_date = datetime.now() - timedelta(days=180)
-    passengers = generate_passengers_for_period(schedules, start_date, days=180)
-    save_passengers(passengers)
+    # History ending today
+    days = history_days(args.scale)
+    start_date = datetime.now() - timedelta(days=days)
+    results = generate_passengers_for_period(schedules, start_date, days, args.seed, args.workers)
+    save_passengers(results, days)
@@ -44,8 +44,11 @@ def generate_departure_times(route, is_busy):
     
     return times
 
-def assign_train_to_schedule(trains, route, departure_time):
-    """Assign appropriate train type based on route and time"""
+def assign_train_to_schedule(trains, route, departure_time, pools=None):
+    """Assign appropriate train type based on route and time
+    
+    `pools` caches the trains of each type combination across calls.
+    """
     hour = int(departure_time.split(':')[0])
     
     # Al Boraq only on major routes (Casa-Rabat, Casa-Tanger)
@@ -59,8 +62,13 @@ def assign_train_to_schedule(trains, route, departure_time):
         train_types = ['TNR', 'Regular']
     
     # Filter trains by type
-    available_trains = [t for t in trains if t['train_type'] in train_types]
-    return random.choice(available_trains)
+    key = tuple(train_types)
+    if pools is None or key not in pools:
+        available_trains = [t for t in trains if t['train_type'] in train_types]
+        if pools is None:
+            return random.choice(available_trains)
+        pools[key] = available_trains
+    return random.choice(pools[key])
 
 def calculate_arrival_time(departure_time, duration_minutes):
     """Calculate arrival time from departure and duration"""
@@ -72,6 +80,8 @@ def generate_schedules(stations, routes, trains):
     """Generate daily schedules"""
     schedules = []
     schedule_id = 1
+    stations_by_id = {s['station_id']: s for s in stations}
+    pools = {}
     
     for route in routes:
         # Check if this is a busy route
@@ -81,11 +91,11 @@ def generate_schedules(stations, routes, trains):
         departure_times = generate_departure_times(route, is_busy)
         
         # Get origin station details
-        origin_station = next(s for s in stations if s['station_id'] == route['origin_station_id'])
+        origin_station = stations_by_id[route['origin_station_id']]
         
         for departure_time in departure_times:
             # Assign train
-            train = assign_train_to_schedule(trains, route, departure_time)
+            train = assign_train_to_schedule(trains, route, departure_time, pools)
             
             # Calculate arrival time
             arrival_time = calculate_arrival_time(departure_time, route['typical_duration_minutes'])
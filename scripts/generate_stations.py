@@ -108,19 +108,23 @@ STATIONS = [
     }
 ]
 
-def generate_stations():
-    """Generate station data and save to JSON"""
+def save_stations(stations):
+    """Save stations to JSON file"""
     output_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data')
     os.makedirs(output_dir, exist_ok=True)
     
     output_file = os.path.join(output_dir, 'stations.json')
     
     with open(output_file, 'w', encoding='utf-8') as f:
-        json.dump(STATIONS, f, indent=2, ensure_ascii=False)
+        json.dump(stations, f, indent=2, ensure_ascii=False)
     
-    print(f"[OK] Generated {len(STATIONS)} stations")
+    print(f"[OK] Generated {len(stations)} stations")
     print(f"[OK] Saved to: {output_file}")
-    return STATIONS
+    return stations
+
+def generate_stations():
+    """Generate station data and save to JSON"""
+    return save_stations(STATIONS)
 
 if __name__ == "__main__":
     generate_stations()
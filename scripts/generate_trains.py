@@ -26,13 +26,13 @@ TRAIN_TYPES = {
     }
 }
 
-def generate_trains():
-    """Generate train fleet data"""
+def generate_trains(scale=1.0):
+    """Generate train fleet data, optionally scaling the fleet size"""
     trains = []
     train_id = 1
     
     for train_type, specs in TRAIN_TYPES.items():
-        for i in range(specs['count']):
+        for i in range(max(1, round(specs['count'] * scale))):
             train = {
                 "train_id": train_id,
                 "train_number": f"{train_type[:3].upper()}{train_id:04d}",
@@ -58,9 +58,10 @@ def save_trains(trains):
         json.dump(trains, f, indent=2, ensure_ascii=False)
     
     print(f"[OK] Generated {len(trains)} trains")
-    print(f"  - Al Boraq (high-speed): {TRAIN_TYPES['Al Boraq']['count']}")
-    print(f"  - TNR (fast): {TRAIN_TYPES['TNR']['count']}")
-    print(f"  - Regular: {TRAIN_TYPES['Regular']['count']}")
+    counts = {train_type: sum(t['train_type'] == train_type for t in trains) for train_type in TRAIN_TYPES}
+    print(f"  - Al Boraq (high-speed): {counts['Al Boraq']}")
+    print(f"  - TNR (fast): {counts['TNR']}")
+    print(f"  - Regular: {counts['Regular']}")
     print(f"[OK] Saved to: {output_file}")
     return trains
 
@@ -0,0 +1,431 @@
+"""
+Journey planning over the weekly timetable with the Connection Scan Algorithm
+
+Every non-cancelled schedule is one connection (origin station, destination
+station, departure and arrival minute). For each day of the week the
+connections are held in arrays sorted by departure. An earliest-arrival
+query is a single forward scan from the first connection departing after
+the requested time, and it stops as soon as departures pass the best arrival
+found. A profile query (every journey worth taking in a departure window) is
+a single backward scan keeping a Pareto list of (departure, arrival) pairs
+per station. Changing trains takes at least MIN_TRANSFER_MINUTES, or
+MAJOR_TRANSFER_MINUTES at major stations. Stations of the same city within
+MAX_WALK_KM are joined by walk links, whose walking time replaces the
+transfer time.
+"""
+import math
+import os
+import sqlite3
+import sys
+import threading
+import time
+import unicodedata
+from bisect import bisect_left, bisect_right
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scripts.synthetic import DAYS_OF_WEEK
+from scripts.timecodes import MINUTES_PER_DAY, format_minute
+
+DB_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'database', 'marocrail.db')
+
+MIN_TRANSFER_MINUTES = 5
+MAJOR_TRANSFER_MINUTES = 10
+MAX_WALK_KM = 6.5  # links both Casablanca and both Rabat stations
+WALK_SPEED_KMH = 4.5
+EARTH_RADIUS_KM = 6371
+REFRESH_INTERVAL = 60  # seconds between checks for timetable changes
+
+PLANNER_STATIONS_QUERY = """
+    SELECT station_id, name, city, latitude, longitude, is_major
+    FROM stations
+    ORDER BY station_id
+"""
+
+CONNECTIONS_QUERY = """
+    SELECT
+        s.schedule_id,
+        s.day_of_week,
+        s.departure_minute,
+        s.arrival_minute,
+        r.origin_station_id,
+        r.destination_station_id,
+        t.train_number,
+        t.train_type
+    FROM schedules s
+    JOIN routes r ON s.route_id = r.route_id
+    JOIN trains t ON s.train_id = t.train_id
+    WHERE s.status != 'cancelled'
+"""
+
+# Changes whenever a schedule is added, removed, retimed or changes status
+TIMETABLE_VERSION_QUERY = """
+    SELECT COUNT(*), MAX(schedule_id), TOTAL(departure_minute), TOTAL(arrival_minute),
+           (SELECT MAX(change_id) FROM schedule_status_changes),
+           (SELECT COUNT(*) FROM stations)
+    FROM schedules
+"""
+
+def fold(text):
+    """Lowercase text without accents, for matching station names"""
+    decomposed = unicodedata.normalize('NFKD', text)
+    return ''.join(c for c in decomposed if not unicodedata.combining(c)).casefold().strip()
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """Vectorized haversine distance in km (inputs in radians)"""
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(a))
+
+class DayConnections:
+    """One day's connections as parallel arrays sorted by departure"""
+
+    def __init__(self, rows):
+        rows = sorted(rows)
+        columns = list(zip(*rows)) if rows else [()] * 5
+        self.departure = np.array(columns[0], dtype=np.int64)
+        self.arrival = np.array(columns[1], dtype=np.int64)
+        self.origin = np.array(columns[2], dtype=np.int64)
+        self.destination = np.array(columns[3], dtype=np.int64)
+        self.schedule_id = np.array(columns[4], dtype=np.int64)
+        # The scans run in Python, where list indexing beats numpy scalars
+        self.rows = [tuple(row[:4]) for row in rows]
+        self.departures = self.departure.tolist()
+
+    def __len__(self):
+        return len(self.rows)
+
+class JourneyPlanner:
+    """Connection arrays for each day of the week plus the station walk links"""
+
+    def __init__(self, db_path=DB_PATH):
+        self.db_path = db_path
+        self.version = None
+        self.checked_at = 0.0
+        self.stations = []
+        self.days = {}
+        self.trains = {}
+        self.walks = []
+        self.transfer = []
+
+    def build(self):
+        """Load the stations and the timetable"""
+        conn = sqlite3.connect(self.db_path)
+        try:
+            version = conn.execute(TIMETABLE_VERSION_QUERY).fetchone()
+            stations = conn.execute(PLANNER_STATIONS_QUERY).fetchall()
+            connections = conn.execute(CONNECTIONS_QUERY).fetchall()
+        finally:
+            conn.close()
+
+        index = {station[0]: i for i, station in enumerate(stations)}
+        rows = {day: [] for day in DAYS_OF_WEEK}
+        trains = {}
+        for schedule_id, day, departure, arrival, origin, destination, number, train_type in connections:
+            if arrival < departure:
+                arrival += MINUTES_PER_DAY  # arrives after midnight
+            rows[day].append((departure, arrival, index[origin], index[destination], schedule_id))
+            trains[schedule_id] = (number, train_type)
+
+        self.stations = [{'station_id': s[0], 'name': s[1], 'city': s[2]} for s in stations]
+        self.transfer = [MAJOR_TRANSFER_MINUTES if s[5] else MIN_TRANSFER_MINUTES for s in stations]
+        self.walks = self._walk_links(stations)
+        self.days = {day: DayConnections(day_rows) for day, day_rows in rows.items()}
+        self.trains = trains
+        self.version = version
+        self.checked_at = time.monotonic()
+        return self
+
+    def refresh(self):
+        """Rebuild if the timetable changed; returns True when it did"""
+        conn = sqlite3.connect(self.db_path)
+        try:
+            version = conn.execute(TIMETABLE_VERSION_QUERY).fetchone()
+        finally:
+            conn.close()
+        self.checked_at = time.monotonic()
+        if version == self.version:
+            return False
+        self.build()
+        return True
+
+    @staticmethod
+    def _walk_links(stations):
+        """Per station, (station, minutes) pairs reachable on foot"""
+        walks = [[] for _ in stations]
+        cities = {}
+        for i, station in enumerate(stations):
+            cities.setdefault(fold(station[2]), []).append(i)
+        for members in cities.values():
+            if len(members) < 2:
+                continue
+            points = np.radians([[stations[i][3], stations[i][4]] for i in members])
+            distances = haversine_km(points[:, 0, None], points[:, 1, None], points[:, 0], points[:, 1])
+            for a, b in zip(*np.nonzero(distances <= MAX_WALK_KM)):
+                if a != b:
+                    minutes = math.ceil(distances[a, b] / WALK_SPEED_KMH * 60)
+                    walks[members[a]].append((members[b], minutes))
+        return walks
+
+    def resolve(self, query):
+        """Station indices matching a station id, a station name or a city
+
+        A city stands for all of its stations. Matching ignores case and
+        accents. Raises KeyError when nothing matches.
+        """
+        query = str(query).strip()
+        if query.isdigit():
+            matches = [i for i, s in enumerate(self.stations) if s['station_id'] == int(query)]
+        else:
+            folded = fold(query)
+            matches = [i for i, s in enumerate(self.stations) if fold(s['name']) == folded]
+            if not matches:
+                matches = [i for i, s in enumerate(self.stations) if fold(s['city']) == folded]
+        if not matches:
+            raise KeyError(query)
+        return matches
+
+    def earliest_arrival(self, day, sources, targets):
+        """Earliest journey from `sources` ({station: ready minute}) to any of `targets`
+
+        Returns (arrival minute, target station, legs) or None.
+        """
+        connections = self.days[day]
+        n = len(self.stations)
+        targets = set(targets)
+        arrival = [math.inf] * n
+        ready = [math.inf] * n
+        parent = [None] * n
+
+        for station, minute in sources.items():
+            if minute < arrival[station]:
+                arrival[station] = ready[station] = minute
+        for station, minute in sources.items():
+            for other, walk in self.walks[station]:
+                if minute + walk < arrival[other]:
+                    arrival[other] = ready[other] = minute + walk
+                    parent[other] = ('walk', station, walk)
+
+        best = min(arrival[t] for t in targets)
+        rows = connections.rows
+        for c in range(bisect_left(connections.departures, min(sources.values())), len(rows)):
+            departure, arr, origin, destination = rows[c]
+            if departure >= best:
+                break
+            if ready[origin] > departure or arr >= arrival[destination]:
+                continue
+            arrival[destination] = arr
+            ready[destination] = arr + self.transfer[destination]
+            parent[destination] = ('train', c)
+            for other, walk in self.walks[destination]:
+                if arr + walk < arrival[other]:
+                    arrival[other] = ready[other] = arr + walk
+                    parent[other] = ('walk', destination, walk)
+            if destination in targets or any(o in targets for o, _ in self.walks[destination]):
+                best = min(arrival[t] for t in targets)
+
+        if best == math.inf:
+            return None
+        target = min(targets, key=lambda t: arrival[t])
+
+        legs, station = [], target
+        while parent[station] is not None:
+            kind, *link = parent[station]
+            if kind == 'train':
+                c = link[0]
+                legs.append(('train', c))
+                station = rows[c][2]
+            else:
+                origin, walk = link
+                legs.append(('walk', origin, station, arrival[station] - walk, walk))
+                station = origin
+        legs.reverse()
+        return best, target, legs
+
+    def profile(self, day, sources, targets, start, end):
+        """Pareto-optimal (departure, arrival, legs) in the departure window [start, end]
+
+        Each journey arrives strictly earlier than every journey departing
+        before it in the window, and no later departure arrives earlier.
+        """
+        connections = self.days[day]
+        n = len(self.stations)
+        targets = set(targets)
+        walks = self.walks
+        # Per station, departures decrease along the list; the negated
+        # departures are kept sorted for bisect
+        keys = [[] for _ in range(n)]
+        entries = [[] for _ in range(n)]
+
+        def evaluate(station, minute):
+            """Best entry boarding at station no earlier than minute"""
+            i = bisect_right(keys[station], -minute) - 1
+            return entries[station][i] if i >= 0 else None
+
+        # Stations a journey can board at: the sources, and stations a walk
+        # away from them
+        boarding = {}
+        for station in sources:
+            boarding.setdefault(station, []).append(None)
+            for other, walk in walks[station]:
+                boarding.setdefault(other, []).append((station, other, walk))
+
+        rows = connections.rows
+        options = []
+        for c in range(len(rows) - 1, bisect_left(connections.departures, start) - 1, -1):
+            departure, arr, origin, destination = rows[c]
+            best, link = math.inf, None
+            if destination in targets:
+                best, link = arr, (None, None)
+            for other, walk in walks[destination]:
+                if other in targets and arr + walk < best:
+                    best, link = arr + walk, ((destination, other, walk), None)
+            entry = evaluate(destination, arr + self.transfer[destination])
+            if entry and entry[1] < best:
+                best, link = entry[1], (None, entry)
+            for other, walk in walks[destination]:
+                entry = evaluate(other, arr + walk)
+                if entry and entry[1] < best:
+                    best, link = entry[1], ((destination, other, walk), entry)
+            if best == math.inf:
+                continue
+
+            entry = (departure, best, c, link)
+            # Collected before the pruning below, which may drop this
+            # departure for a better one after the window
+            for first_walk in boarding.get(origin, ()):
+                leave = departure - first_walk[2] if first_walk else departure
+                if leave >= start:
+                    options.append((leave, best, first_walk, entry))
+
+            profile = entries[origin]
+            if profile and profile[-1][1] <= best:
+                continue  # dominated by a journey departing later
+            if profile and profile[-1][0] == departure:
+                keys[origin].pop()
+                profile.pop()
+            keys[origin].append(-departure)
+            profile.append(entry)
+
+        # Walking straight to the target, leaving at the start of the window;
+        # trains arriving no earlier than a walk leaving with them are dropped
+        direct = {}
+        for station in sources:
+            for other, walk in walks[station]:
+                if other in targets and walk < direct.get(station, (math.inf,))[0]:
+                    direct[station] = (walk, other)
+        if direct:
+            shortest = min(walk for walk, _ in direct.values())
+            options = [option for option in options if option[1] < option[0] + shortest]
+            for station, (walk, other) in direct.items():
+                options.append((start, start + walk, (station, other, walk), None))
+        options.sort(key=lambda option: (option[0], -option[1]))
+
+        # Options after the window only rule out the ones inside it that
+        # they beat outright: waiting for them would arrive earlier
+        journeys, best, after = [], math.inf, math.inf
+        for departure, arr, first_walk, entry in reversed(options):
+            if departure > end:
+                after = min(after, arr)
+            elif arr < best and arr <= after:
+                best = arr
+                journeys.append((departure, arr,
+                                 self._profile_legs(rows, departure, first_walk, entry)))
+        journeys.reverse()
+        return journeys
+
+    @staticmethod
+    def _profile_legs(rows, departure, first_walk, entry):
+        """Legs of a profile journey by following its chain of entries"""
+        legs = []
+        if first_walk:
+            origin, other, walk = first_walk
+            legs.append(('walk', origin, other, departure, walk))
+        while entry:
+            _, _, c, (walk, entry) = entry
+            legs.append(('train', c))
+            if walk:
+                origin, other, minutes = walk
+                legs.append(('walk', origin, other, rows[c][1], minutes))
+        return legs
+
+    def journey(self, day, sources, targets, depart_after, via=()):
+        """Earliest-arrival legs from any source after depart_after, or None
+
+        `via` lists station groups; the journey then changes at (or passes
+        through) one of them, whichever arrives first.
+        """
+        if not via:
+            found = self.earliest_arrival(day, {s: depart_after for s in sources}, targets)
+            return found and found[2]
+
+        best = None
+        for group in via:
+            first = self.earliest_arrival(day, {s: depart_after for s in sources}, group)
+            if first is None:
+                continue
+            arrival, station, legs = first
+            if legs and legs[-1][0] == 'train':
+                arrival += self.transfer[station]
+            second = self.earliest_arrival(day, {station: arrival}, targets)
+            if second and (best is None or second[0] < best[0]):
+                best = (second[0], legs + second[2])
+        return best and best[1]
+
+    def describe(self, day, legs):
+        """JSON-ready journey from a list of legs"""
+        rows = self.days[day].rows
+        described = []
+        for leg in legs:
+            if leg[0] == 'train':
+                departure, arrival, origin, destination = rows[leg[1]]
+                schedule_id = int(self.days[day].schedule_id[leg[1]])
+                number, train_type = self.trains[schedule_id]
+                described.append({
+                    'type': 'train',
+                    'schedule_id': schedule_id,
+                    'train_number': number,
+                    'train_type': train_type,
+                    'from': self.stations[origin]['name'],
+                    'to': self.stations[destination]['name'],
+                    'departure': format_minute(departure),
+                    'arrival': format_minute(arrival),
+                    'duration_minutes': arrival - departure
+                })
+            else:
+                _, origin, destination, departure, minutes = leg
+                described.append({
+                    'type': 'walk',
+                    'from': self.stations[origin]['name'],
+                    'to': self.stations[destination]['name'],
+                    'departure': format_minute(departure),
+                    'arrival': format_minute(departure + minutes),
+                    'duration_minutes': minutes
+                })
+
+        departure = rows[legs[0][1]][0] if legs[0][0] == 'train' else legs[0][3]
+        last = legs[-1]
+        arrival = rows[last[1]][1] if last[0] == 'train' else last[3] + last[4]
+        return {
+            'day': day,
+            'departure': format_minute(departure),
+            'arrival': format_minute(arrival),
+            'arrival_day_offset': arrival // MINUTES_PER_DAY,
+            'duration_minutes': arrival - departure,
+            'transfers': max(0, sum(1 for leg in legs if leg[0] == 'train') - 1),
+            'legs': described
+        }
+
+_planner = None
+_planner_lock = threading.Lock()
+
+def get_journey_planner(db_path=DB_PATH, max_age=REFRESH_INTERVAL):
+    """The process-wide planner, built on first use and rebuilt when the timetable changes"""
+    global _planner
+    with _planner_lock:
+        if _planner is None or _planner.db_path != db_path:
+            _planner = JourneyPlanner(db_path).build()
+        elif time.monotonic() - _planner.checked_at > max_age:
+            _planner.refresh()
+        return _planner
@@ -0,0 +1,236 @@
+"""
+Server-sent-events feed of dashboard changes
+
+One producer thread per process watches the database and publishes only
+what changed. It sends new delays (by delay_id), overview KPIs whose value
+moved, and schedule status changes (from the trigger-fed
+schedule_status_changes log). The producer wakes when PRAGMA data_version
+reports a commit from any connection, or straight away when this process's
+delay writer commits. Each event is encoded once and the same bytes are
+queued to every subscriber, so an extra open dashboard costs a queue put
+per event rather than any database work. Each open stream also holds a
+server thread, so at most MAX_STREAMS are served per process and the rest
+of the thread pool stays free for API requests.
+"""
+import json
+import os
+import queue
+import sqlite3
+import sys
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scripts.delay_ingest import add_commit_listener
+
+DB_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'database', 'marocrail.db')
+
+POLL_INTERVAL = 0.5         # seconds between data_version checks
+KEEPALIVE_SECONDS = 15      # comment line sent to idle streams
+SUBSCRIBER_QUEUE = 256      # events buffered per client before it is dropped
+MAX_ROWS = 500              # rows per delta event
+RETRY_MS = 3000             # client reconnect delay
+MAX_STREAMS = int(os.environ.get('MAX_STREAMS', 32))  # open streams per process
+
+# CROSS JOIN keeps delays as the outer loop, read by delay_id range
+NEW_DELAYS_QUERY = """
+    SELECT
+        d.delay_id,
+        d.delay_minutes,
+        d.delay_reason,
+        d.weather_condition,
+        d.timestamp,
+        s.schedule_id,
+        t.train_number,
+        st1.name as origin_station,
+        st2.name as destination_station
+    FROM delays d
+    CROSS JOIN schedules s ON d.schedule_id = s.schedule_id
+    JOIN trains t ON s.train_id = t.train_id
+    JOIN routes r ON s.route_id = r.route_id
+    JOIN stations st1 ON r.origin_station_id = st1.station_id
+    JOIN stations st2 ON r.destination_station_id = st2.station_id
+    WHERE d.delay_id > ?
+    ORDER BY d.delay_id
+    LIMIT ?
+"""
+
+STATUS_CHANGES_QUERY = """
+    SELECT change_id, schedule_id, old_status, new_status, changed_at
+    FROM schedule_status_changes
+    WHERE change_id > ?
+    ORDER BY change_id
+    LIMIT ?
+"""
+
+# Overview KPIs from the trigger-kept route totals (see schema.sql)
+KPIS_QUERY = """
+    SELECT SUM(schedule_count), SUM(delay_count), SUM(total_delay_minutes)
+    FROM route_kpis
+"""
+
+HIGH_WATER_QUERY = """
+    SELECT (SELECT MAX(delay_id) FROM delays), (SELECT MAX(change_id) FROM schedule_status_changes)
+"""
+
+def encode_event(event, data, event_id=None):
+    """SSE wire format of one event"""
+    lines = [f"id: {event_id}"] if event_id is not None else []
+    lines += [f"event: {event}", f"data: {json.dumps(data, ensure_ascii=False)}"]
+    return ('\n'.join(lines) + '\n\n').encode('utf-8')
+
+def overview_kpis(conn):
+    """Delay totals and on-time rate, as in /api/analytics/overview"""
+    schedules, delays, minutes = conn.execute(KPIS_QUERY).fetchone()
+    schedules, delays, minutes = schedules or 0, delays or 0, minutes or 0
+    return {
+        'total_schedules': schedules,
+        'total_delays': delays,
+        'avg_delay_minutes': round(minutes / delays, 2) if delays else 0,
+        'on_time_rate': round((schedules * 7 - delays) / (schedules * 7) * 100, 2) if schedules else None
+    }
+
+class Subscriber:
+    """One connected client: a bounded queue of encoded events"""
+
+    def __init__(self):
+        self.queue = queue.Queue(maxsize=SUBSCRIBER_QUEUE)
+        self.closed = False
+
+    def messages(self, first=b''):
+        """Encoded events for the response body, with keepalives while idle"""
+        yield b"retry: %d\n\n" % RETRY_MS + first
+        while not self.closed:
+            try:
+                yield self.queue.get(timeout=KEEPALIVE_SECONDS)
+            except queue.Empty:
+                yield b": keepalive\n\n"
+
+class LiveFeed:
+    """Single producer publishing dashboard deltas to every subscriber"""
+
+    def __init__(self, db_path=DB_PATH, poll_interval=POLL_INTERVAL):
+        self.db_path = db_path
+        self.poll_interval = poll_interval
+        self.subscribers = set()
+        self.lock = threading.Lock()
+        self.wake = threading.Event()
+        self.ready = threading.Event()
+        self.thread = None
+        self.sequence = 0
+        self.last_delay_id = 0
+        self.last_change_id = 0
+        self.kpis = {}
+        self.stats = {'events': 0, 'dropped': 0}
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run, name='live-feed', daemon=True)
+        self.thread.start()
+        return self
+
+    def subscribe(self):
+        """Register a client; returns it and a first event with the current KPIs
+
+        Raises queue.Full when MAX_STREAMS clients are already connected.
+        """
+        self.ready.wait(5)
+        subscriber = Subscriber()
+        with self.lock:
+            if len(self.subscribers) >= MAX_STREAMS:
+                raise queue.Full
+            self.subscribers.add(subscriber)
+            first = encode_event('kpis', self.kpis, self.sequence)
+        return subscriber, first
+
+    def unsubscribe(self, subscriber):
+        subscriber.closed = True
+        with self.lock:
+            self.subscribers.discard(subscriber)
+
+    def publish(self, event, data):
+        """Queue one event to every subscriber, dropping those that fell behind"""
+        with self.lock:
+            self.sequence += 1
+            message = encode_event(event, data, self.sequence)
+            for subscriber in list(self.subscribers):
+                try:
+                    subscriber.queue.put_nowait(message)
+                except queue.Full:
+                    # The client reconnects and reloads the dashboard
+                    subscriber.closed = True
+                    self.subscribers.discard(subscriber)
+                    self.stats['dropped'] += 1
+            self.stats['events'] += 1
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def _run(self):
+        """Publish changes until the process exits; after an error the
+        connection is reopened and the feed catches up from its high-water marks"""
+        conn, version, woken = None, None, False
+        while True:
+            try:
+                if conn is None:
+                    conn = self._connect()
+                    if not self.ready.is_set():
+                        self.last_delay_id, self.last_change_id = [
+                            v or 0 for v in conn.execute(HIGH_WATER_QUERY).fetchone()]
+                        self.kpis = overview_kpis(conn)
+                        self.ready.set()
+                    version = None
+                current = conn.execute("PRAGMA data_version").fetchone()[0]
+                if current != version or woken:
+                    version = current
+                    self._publish_changes(conn)
+            except Exception as e:
+                print(f"[WARNING] Live feed update failed: {e}")
+                if conn is not None:
+                    conn.close()
+                    conn = None
+            woken = self.wake.wait(self.poll_interval)
+            self.wake.clear()
+
+    def _publish_changes(self, conn):
+        """Read everything new in one snapshot and publish the deltas"""
+        conn.execute("BEGIN")
+        try:
+            delays = [dict(row) for row in conn.execute(NEW_DELAYS_QUERY, [self.last_delay_id, MAX_ROWS])]
+            changes = [dict(row) for row in conn.execute(STATUS_CHANGES_QUERY, [self.last_change_id, MAX_ROWS])]
+            kpis = overview_kpis(conn)
+        finally:
+            conn.execute("COMMIT")
+
+        if delays:
+            self.last_delay_id = delays[-1]['delay_id']
+            self.publish('delays', delays)
+        if changes:
+            self.last_change_id = changes[-1]['change_id']
+            self.publish('schedules', changes)
+        changed = {key: value for key, value in kpis.items() if self.kpis.get(key) != value}
+        if changed:
+            self.kpis = kpis
+            self.publish('kpis', changed)
+        # A full page of rows means more are waiting
+        if len(delays) == MAX_ROWS or len(changes) == MAX_ROWS:
+            self.wake.set()
+
+_feed = None
+_feed_lock = threading.Lock()
+
+def _wake_feed():
+    if _feed is not None:
+        _feed.wake.set()
+
+# Registered once: restarted feeds are woken through _feed
+add_commit_listener(_wake_feed)
+
+def get_live_feed(db_path=DB_PATH):
+    """The process-wide feed, started on first use (after any fork, like the writer)"""
+    global _feed
+    with _feed_lock:
+        if _feed is None or not _feed.thread.is_alive():
+            _feed = LiveFeed(db_path).start()
+        return _feed
@@ -0,0 +1,57 @@
+"""
+Process-wide cache of trained model artifacts
+
+Artifacts are saved uncompressed by joblib, so `joblib.load(mmap_mode='r')`
+maps every plain numpy array (e.g. the quantile table) read-only from the
+page cache instead of copying it. Forest trees copy their node arrays into
+their own buffers on load; those are shared between gunicorn workers by
+loading once in the master before forking (see `preload_models`).
+"""
+import gc
+import os
+
+import joblib
+
+MODEL_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'models')
+
+# Artifact name -> (filename, required)
+MODEL_FILES = {
+    'classifier': ('delay_classifier.pkl', True),
+    'regressor': ('delay_regressor.pkl', True),
+    'quantiles': ('delay_quantiles.pkl', False),
+    'route_stats': ('route_stats.pkl', False),
+}
+
+_loaded = {}
+
+def load_models(model_dir=MODEL_DIR, mmap_mode='r'):
+    """Load all artifacts once per process; optional ones are None if missing"""
+    key = (os.path.abspath(model_dir), mmap_mode)
+    if key in _loaded:
+        return _loaded[key]
+
+    models = {}
+    for name, (filename, required) in MODEL_FILES.items():
+        path = os.path.join(model_dir, filename)
+        if not required and not os.path.exists(path):
+            models[name] = None
+            continue
+        models[name] = joblib.load(path, mmap_mode=mmap_mode)
+
+    _loaded[key] = models
+    return models
+
+def preload_models(model_dir=MODEL_DIR):
+    """Load models before workers fork so they share one physical copy
+
+    gc.freeze() moves everything allocated so far out of the collector's
+    reach, so garbage collection in the workers does not write to (and
+    thereby un-share) the pages holding the models.
+    """
+    models = load_models(model_dir)
+    gc.freeze()
+    return models
+
+def clear_models():
+    """Drop cached artifacts (e.g. after retraining)"""
+    _loaded.clear()
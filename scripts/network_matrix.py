@@ -0,0 +1,180 @@
+"""
+All-pairs shortest distance and travel time over the route graph
+
+Each route is a directed edge weighted by distance_km and, separately, by
+typical_duration_minutes. For every weight the compiled matrices hold the
+shortest value from each station to each other station and the next hop on
+that path, so any path is rebuilt by following next hops. Small networks
+use Floyd-Warshall vectorized over numpy (one broadcast minimum per
+intermediate station). Above FLOYD_WARSHALL_MAX_STATIONS they use Dijkstra
+from every station on the sparse graph. Dijkstra runs on the reversed graph,
+so each station's predecessor there is its next hop towards the source.
+The matrices are rebuilt only when the version of routes or stations in
+table_versions (bumped by triggers in schema.sql) changes.
+"""
+import os
+import sqlite3
+import sys
+import threading
+import time
+
+import numpy as np
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import dijkstra
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+DB_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'database', 'marocrail.db')
+
+FLOYD_WARSHALL_MAX_STATIONS = 200
+VERSION_CHECK_INTERVAL = 1.0  # seconds between table_versions lookups
+
+# Matrix metric -> (routes column, unit)
+METRICS = {
+    'distance': ('distance_km', 'km'),
+    'duration': ('typical_duration_minutes', 'minutes'),
+}
+
+MATRIX_STATIONS_QUERY = "SELECT station_id, name FROM stations ORDER BY station_id"
+
+GRAPH_QUERY = """
+    SELECT origin_station_id, destination_station_id, distance_km, typical_duration_minutes
+    FROM routes
+"""
+
+VERSIONS_QUERY = """
+    SELECT table_name, version, changed_at
+    FROM table_versions
+    WHERE table_name IN ('routes', 'stations')
+    ORDER BY table_name
+"""
+
+def floyd_warshall(weights):
+    """Shortest values and next hops from a dense weight matrix (inf = no edge)"""
+    n = len(weights)
+    dist = weights.copy()
+    np.fill_diagonal(dist, 0)
+    next_hop = np.where(np.isfinite(weights), np.arange(n), -1).astype(np.int32)
+    np.fill_diagonal(next_hop, np.arange(n))
+
+    for k in range(n):
+        through = dist[:, k, None] + dist[None, k, :]
+        shorter = through < dist
+        dist = np.where(shorter, through, dist)
+        # The first hop towards j is now the first hop towards k
+        next_hop = np.where(shorter, next_hop[:, k, None], next_hop)
+    return dist, next_hop
+
+def repeated_dijkstra(weights):
+    """Same result as floyd_warshall from a sparse weight matrix"""
+    n = weights.shape[0]
+    # Reversed edges: the predecessor of i on a shortest path from j is i's
+    # next hop towards j in the original graph
+    dist, predecessors = dijkstra(weights.T.tocsr(), directed=True, return_predecessors=True)
+    next_hop = predecessors.T.astype(np.int32)
+    next_hop[next_hop < 0] = -1
+    np.fill_diagonal(next_hop, np.arange(n))
+    return dist.T, next_hop
+
+class NetworkMatrix:
+    """Shortest-path and next-hop matrices per metric, indexed by station order"""
+
+    def __init__(self, db_path=DB_PATH):
+        self.db_path = db_path
+        self.version = None
+        self.checked_at = 0.0
+        self.built_at = None
+        self.method = None
+        self.station_ids = np.zeros(0, dtype=np.int64)
+        self.names = []
+        self.index = {}
+        self.dist = {}
+        self.next_hop = {}
+        self.payloads = {}
+
+    def build(self):
+        """Load the route graph and compute the matrices of every metric"""
+        conn = sqlite3.connect(self.db_path)
+        conn.row_factory = sqlite3.Row
+        try:
+            version = [tuple(row) for row in conn.execute(VERSIONS_QUERY)]
+            stations = conn.execute(MATRIX_STATIONS_QUERY).fetchall()
+            edges = conn.execute(GRAPH_QUERY).fetchall()
+        finally:
+            conn.close()
+
+        station_ids = np.array([s['station_id'] for s in stations], dtype=np.int64)
+        index = {station_id: i for i, station_id in enumerate(station_ids.tolist())}
+        n = len(stations)
+        origin = np.array([index[e['origin_station_id']] for e in edges], dtype=np.int64)
+        destination = np.array([index[e['destination_station_id']] for e in edges], dtype=np.int64)
+        method = 'floyd-warshall' if n <= FLOYD_WARSHALL_MAX_STATIONS else 'dijkstra'
+
+        dist, next_hop = {}, {}
+        for metric, (column, _) in METRICS.items():
+            values = np.array([e[column] for e in edges], dtype=np.float64)
+            if method == 'floyd-warshall':
+                weights = np.full((n, n), np.inf)
+                np.minimum.at(weights, (origin, destination), values)
+                dist[metric], next_hop[metric] = floyd_warshall(weights)
+            else:
+                weights = csr_matrix((values, (origin, destination)), shape=(n, n))
+                dist[metric], next_hop[metric] = repeated_dijkstra(weights)
+
+        self.station_ids, self.index = station_ids, index
+        self.names = [s['name'] for s in stations]
+        self.dist, self.next_hop = dist, next_hop
+        self.payloads = {}
+        self.method = method
+        self.version = version
+        self.built_at = time.strftime('%Y-%m-%dT%H:%M:%S')
+        self.checked_at = time.monotonic()
+        return self
+
+    def stale(self):
+        """True when routes or stations changed since the build"""
+        conn = sqlite3.connect(self.db_path)
+        try:
+            version = conn.execute(VERSIONS_QUERY).fetchall()
+        finally:
+            conn.close()
+        self.checked_at = time.monotonic()
+        return version != self.version
+
+    def positions(self, station_ids):
+        """Matrix rows of station ids; raises KeyError on an unknown one"""
+        return [self.index[station_id] for station_id in station_ids]
+
+    def submatrix(self, metric, rows=None, columns=None):
+        """Shortest values as nested lists, None where unreachable"""
+        values = self.dist[metric]
+        if rows is not None or columns is not None:
+            rows = np.arange(len(self.names)) if rows is None else np.asarray(rows)
+            columns = np.arange(len(self.names)) if columns is None else np.asarray(columns)
+            values = values[np.ix_(rows, columns)]
+        values = np.round(values, 2)
+        return [[float(v) if np.isfinite(v) else None for v in row] for row in values.tolist()]
+
+    def path(self, metric, origin, destination):
+        """Matrix rows of the stations on the shortest path, or None"""
+        next_hop = self.next_hop[metric]
+        if next_hop[origin, destination] < 0:
+            return None
+        path = [origin]
+        while path[-1] != destination:
+            path.append(int(next_hop[path[-1], destination]))
+        return path
+
+_matrix = None
+_matrix_lock = threading.Lock()
+
+def get_network_matrix(db_path=DB_PATH, max_age=VERSION_CHECK_INTERVAL):
+    """The process-wide matrices, built on first use and rebuilt when routes change"""
+    global _matrix
+    with _matrix_lock:
+        if _matrix is None or _matrix.db_path != db_path:
+            _matrix = NetworkMatrix(db_path).build()
+        elif time.monotonic() - _matrix.checked_at > max_age and _matrix.stale():
+            # A new object, so requests holding the old one read consistent matrices
+            _matrix = NetworkMatrix(db_path).build()
+        return _matrix
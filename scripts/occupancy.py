@@ -0,0 +1,228 @@
+"""
+Dense in-memory occupancy cube for passenger-flow analytics
+
+Passenger records are summed into numpy arrays indexed by route x departure
+hour x day of week (Sunday=0) x month of travel, holding passengers, trips
+and seats offered. One streaming scan over the passengers table and its
+monthly partitions fills the cube. After that, refresh() adds the records
+inserted since from the same tables (record_id only grows, and rows moved
+into partitions keep their ids, so a record archived between two refreshes
+is still counted once). A slice or rollup is a sum over a few axes of
+arrays in memory, so requests never run GROUP BY over the passenger history.
+"""
+import os
+import sqlite3
+import sys
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scripts.partitions import partition_tables
+from scripts.timecodes import EPOCH_DAY_OF_WEEK
+
+DB_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'database', 'marocrail.db')
+
+DIMENSIONS = ('route', 'hour', 'day_of_week', 'month')
+MEASURES = ('passengers', 'trips', 'capacity')
+
+FETCH_SIZE = 100000
+REFRESH_INTERVAL = 30  # seconds between checks for new passenger records
+
+# One trip's passengers with the cube coordinates; {source} is the passengers
+# table or one of its monthly partitions. CROSS JOIN keeps passengers as the
+# outer loop, so a refresh only reads the record_id range it needs.
+CUBE_QUERY = """
+    SELECT
+        p.record_id,
+        s.route_id,
+        s.departure_minute,
+        p.travel_date,
+        p.passenger_count,
+        t.capacity
+    FROM {source} p
+    CROSS JOIN schedules s ON p.schedule_id = s.schedule_id
+    CROSS JOIN trains t ON s.train_id = t.train_id
+    WHERE p.record_id > ?
+"""
+
+ROUTE_IDS_QUERY = "SELECT route_id FROM routes ORDER BY route_id"
+SEQUENCE_QUERY = "SELECT seq FROM sqlite_sequence WHERE name = 'passengers'"
+
+class OccupancyCube:
+    """Passenger, trip and seat sums per route, hour, day of week and month"""
+
+    def __init__(self, db_path=DB_PATH):
+        self.db_path = db_path
+        self.lock = threading.Lock()
+        self.high_water = 0
+        self.records = 0
+        self.updated_at = None
+        self.checked_at = 0.0
+        self.route_ids = np.zeros(0, dtype=np.int64)
+        self.route_index = np.zeros(0, dtype=np.int64)
+        self.cells = {}
+
+    @property
+    def shape(self):
+        return (len(self.route_ids), 24, 7, 12)
+
+    def build(self):
+        """Fill the cube from every passenger record"""
+        conn = sqlite3.connect(self.db_path)
+        try:
+            route_ids = np.array([row[0] for row in conn.execute(ROUTE_IDS_QUERY)], dtype=np.int64)
+            route_index = np.full(int(route_ids.max(initial=0)) + 1, -1, dtype=np.int64)
+            route_index[route_ids] = np.arange(len(route_ids))
+
+            size = len(route_ids) * 24 * 7 * 12
+            cells = {'passengers': np.zeros(size, dtype=np.int64),
+                     'trips': np.zeros(size, dtype=np.int64),
+                     'capacity': np.zeros(size, dtype=np.int64)}
+
+            with self.lock:
+                self.route_ids, self.route_index, self.cells = route_ids, route_index, cells
+                self.high_water = self.records = 0
+                self._scan_all(conn, 0)
+                self._mark_updated()
+        finally:
+            conn.close()
+        return self
+
+    def refresh(self):
+        """Add records inserted since the last scan and return how many were added
+
+        Rebuilds instead (returning every record) when the database was
+        recreated behind the cube or a record belongs to a route the cube
+        does not know. updated_at only moves when records were added.
+        """
+        conn = sqlite3.connect(self.db_path)
+        try:
+            sequence = conn.execute(SEQUENCE_QUERY).fetchone()
+            if (sequence[0] if sequence else 0) >= self.high_water:
+                with self.lock:
+                    before = self.records
+                    if self._scan_all(conn, self.high_water):
+                        self.checked_at = time.monotonic()
+                        if self.records > before:
+                            self._mark_updated()
+                        return self.records - before
+        finally:
+            conn.close()
+
+        self.build()
+        return self.records
+
+    def _mark_updated(self):
+        self.updated_at = datetime.now().isoformat(timespec='seconds')
+        self.checked_at = time.monotonic()
+
+    def _scan_all(self, conn, after):
+        """Scan the hot table and every partition in one read transaction
+
+        The snapshot keeps a concurrent archive from moving a record between
+        tables mid-scan, where it would be counted twice or not at all.
+        """
+        conn.execute("BEGIN")
+        try:
+            return all(self._scan(conn, table, after) for table in partition_tables(conn, 'passengers'))
+        finally:
+            conn.commit()
+
+    def _scan(self, conn, table, after):
+        """Stream one table's records with record_id > after into the cube
+
+        Returns False (and adds nothing more) on a record of an unknown route.
+        """
+        cursor = conn.execute(CUBE_QUERY.format(source=table), [after])
+        while True:
+            rows = cursor.fetchmany(FETCH_SIZE)
+            if not rows:
+                return True
+            record_id, route_id, departure_minute, travel_date, passengers, capacity = zip(*rows)
+
+            route_id = np.array(route_id, dtype=np.int64)
+            if route_id.max() >= len(self.route_index) or (self.route_index[route_id] < 0).any():
+                return False
+
+            days = np.array(travel_date, dtype='datetime64[D]')
+            flat = np.ravel_multi_index((
+                self.route_index[route_id],
+                np.array(departure_minute, dtype=np.int64) // 60,
+                (days.astype(np.int64) + EPOCH_DAY_OF_WEEK) % 7,
+                days.astype('datetime64[M]').astype(np.int64) % 12,
+            ), self.shape)
+
+            np.add.at(self.cells['trips'], flat, 1)
+            np.add.at(self.cells['passengers'], flat, np.array(passengers, dtype=np.int64))
+            np.add.at(self.cells['capacity'], flat, np.array(capacity, dtype=np.int64))
+
+            self.records += len(rows)
+            self.high_water = max(self.high_water, max(record_id))
+
+    def query(self, group_by=(), filters=None):
+        """Rows of the measures summed over every dimension not in group_by
+
+        `filters` maps dimensions to the values to keep (route ids, hours
+        0-23, days 0-6 with Sunday=0, months 1-12). Cells without trips are
+        left out. Raises ValueError on an unknown dimension.
+        """
+        filters = filters or {}
+        for dimension in [*group_by, *filters]:
+            if dimension not in DIMENSIONS:
+                raise ValueError(f"unknown dimension: {dimension}")
+        if len(set(group_by)) != len(group_by):
+            raise ValueError("group_by lists a dimension twice")
+
+        with self.lock:
+            labels = [self.route_ids, np.arange(24), np.arange(7), np.arange(1, 13)]
+            sums = {name: values.reshape(self.shape) for name, values in self.cells.items()}
+
+            for axis, dimension in enumerate(DIMENSIONS):
+                if dimension not in filters:
+                    continue
+                keep = np.flatnonzero(np.isin(labels[axis], np.asarray(filters[dimension], dtype=np.int64)))
+                labels[axis] = labels[axis][keep]
+                sums = {name: values.take(keep, axis=axis) for name, values in sums.items()}
+
+            grouped = [DIMENSIONS.index(dimension) for dimension in group_by]
+            summed = tuple(axis for axis in range(len(DIMENSIONS)) if axis not in grouped)
+            sums = {name: values.sum(axis=summed) for name, values in sums.items()}
+            # Axes left after summing are in DIMENSIONS order; put them in group_by order
+            order = np.argsort(np.argsort(grouped)) if grouped else []
+            sums = {name: np.transpose(values, order) if grouped else values
+                    for name, values in sums.items()}
+
+        cells = np.argwhere(sums['trips'] > 0) if grouped else ([()] if sums['trips'] else [])
+        result = []
+        for cell in cells:
+            cell = tuple(cell)
+            trips = int(sums['trips'][cell])
+            passengers = int(sums['passengers'][cell])
+            capacity = int(sums['capacity'][cell])
+            row = {dimension: int(labels[DIMENSIONS.index(dimension)][i])
+                   for dimension, i in zip(group_by, cell)}
+            row.update({
+                'passengers': passengers,
+                'trips': trips,
+                'avg_passengers': round(passengers / trips, 2),
+                'load_factor': round(passengers / capacity, 4) if capacity else None
+            })
+            result.append(row)
+        return result
+
+_cube = None
+_cube_lock = threading.Lock()
+
+def get_occupancy_cube(db_path=DB_PATH, max_age=REFRESH_INTERVAL):
+    """The process-wide cube, built on first use and refreshed when stale"""
+    global _cube
+    with _cube_lock:
+        if _cube is None or _cube.db_path != db_path:
+            _cube = OccupancyCube(db_path).build()
+        elif time.monotonic() - _cube.checked_at > max_age:
+            _cube.refresh()
+        return _cube
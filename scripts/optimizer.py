@@ -4,132 +4,154 @@ Simplified schedule optimization using heuristic rules
 import sqlite3
 import pandas as pd
 import numpy as np
-import joblib
 import os
+import sys
 from datetime import datetime, timedelta
 
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scripts.features import (DAY_NUMBERS, TYPICAL_WEATHER, season_for_month,
+                              transform_batch, train_type_codes, route_stats_columns)
+from scripts.delay_quantiles import predict_quantiles, quantile_labels
+from scripts.model_store import load_models
+
+# Buffer added to high-risk trains when no quantile model is available
+DEFAULT_BUFFER_MINUTES = 10
+
 DB_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'database', 'marocrail.db')
 MODEL_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'models')
 
+# Day load, served by idx_schedules_day_departure (see scripts/check_query_plans.py)
+DAY_SCHEDULES_QUERY = """
+    SELECT 
+        s.schedule_id,
+        s.train_id,
+        t.train_number,
+        t.train_type,
+        t.capacity,
+        s.route_id,
+        r.origin_station_id,
+        r.destination_station_id,
+        r.distance_km,
+        r.typical_duration_minutes,
+        s.departure_time,
+        s.arrival_time,
+        s.departure_minute,
+        s.arrival_minute,
+        s.platform,
+        s.day_of_week
+    FROM schedules s
+    JOIN trains t ON s.train_id = t.train_id
+    JOIN routes r ON s.route_id = r.route_id
+    WHERE s.day_of_week = ?
+    ORDER BY s.departure_minute
+"""
+
 class ScheduleOptimizer:
-    def __init__(self):
-        self.classifier = joblib.load(os.path.join(MODEL_DIR, 'delay_classifier.pkl'))
-        self.regressor = joblib.load(os.path.join(MODEL_DIR, 'delay_regressor.pkl'))
-        self.feature_cols = joblib.load(os.path.join(MODEL_DIR, 'feature_columns.pkl'))
+    def __init__(self, models=None):
+        if models is None:
+            models = load_models(MODEL_DIR)
+        self.classifier = models['classifier']
+        self.regressor = models['regressor']
+        self.route_stats = models['route_stats']
+        self.quantile_model = models['quantiles']
         self.conn = sqlite3.connect(DB_PATH)
     
     def load_schedules(self, day_of_week='Monday'):
         """Load schedules for optimization"""
-        query = """
-        SELECT 
-            s.schedule_id,
-            s.train_id,
-            t.train_number,
-            t.train_type,
-            t.capacity,
-            s.route_id,
-            r.origin_station_id,
-            r.destination_station_id,
-            r.distance_km,
-            r.typical_duration_minutes,
-            s.departure_time,
-            s.arrival_time,
-            s.platform,
-            s.day_of_week
-        FROM schedules s
-        JOIN trains t ON s.train_id = t.train_id
-        JOIN routes r ON s.route_id = r.route_id
-        WHERE s.day_of_week = ?
-        ORDER BY s.departure_time
-        """
-        return pd.read_sql_query(query, self.conn, params=(day_of_week,))
+        return pd.read_sql_query(DAY_SCHEDULES_QUERY, self.conn, params=(day_of_week,))
     
-    def predict_delays(self, schedules):
-        """Predict delay probability for each schedule"""
-        features = self._prepare_features(schedules)
+    def predict_delays(self, schedules, month=None, weather=None):
+        """Predict delay probability for each schedule
+        
+        month defaults to the current month and weather to the most common
+        condition for that month's season.
+        """
+        features = self._prepare_features(schedules, month, weather)
         delay_prob = self.classifier.predict_proba(features)[:, 1]
         schedules['delay_probability'] = delay_prob
         schedules['high_risk'] = delay_prob > 0.7
+        
+        if self.quantile_model is not None:
+            values = predict_quantiles(self.regressor, self.quantile_model, features)
+            for j, label in enumerate(quantile_labels(self.quantile_model)):
+                schedules[f'delay_{label}'] = values[:, j + 1]
+        
         return schedules
     
-    def _prepare_features(self, schedules):
+    def _prepare_features(self, schedules, month=None, weather=None):
         """Prepare features for ML model"""
-        df = schedules.copy()
-        
-        df['hour'] = pd.to_datetime(df['departure_time'], format='%H:%M').dt.hour
-        df['day_of_week'] = pd.to_datetime('2024-01-01').dayofweek
-        df['month'] = 6
-        df['is_peak_hour'] = ((df['hour'] >= 6) & (df['hour'] <= 9)) | ((df['hour'] >= 17) & (df['hour'] <= 20))
-        df['is_weekend'] = False
-        
-        for weather in ['cloudy', 'foggy', 'hot', 'rainy', 'sunny']:
-            df[f'weather_{weather}'] = 1 if weather == 'sunny' else 0
+        if month is None:
+            month = datetime.now().month
+        if weather is None:
+            weather = TYPICAL_WEATHER[season_for_month(month)]
         
-        train_type_map = {'Al Boraq': 3, 'TNR': 2, 'Regular': 1}
-        df['train_type_code'] = df['train_type'].map(train_type_map)
+        route_avg_delay, route_std_delay = route_stats_columns(self.route_stats, schedules['route_id'])
         
-        df['route_avg_delay'] = 15.0
-        df['route_std_delay'] = 5.0
-        
-        for season in ['autumn', 'spring', 'summer', 'winter']:
-            df[f'season_{season}'] = 1 if season == 'summer' else 0
-        
-        return df[self.feature_cols].fillna(0)
+        return transform_batch({
+            'hour': schedules['departure_minute'].to_numpy() // 60,
+            'day_of_week': schedules['day_of_week'].map(DAY_NUMBERS).to_numpy(),
+            'month': int(month),
+            'weather_condition': weather,
+            'train_type_code': train_type_codes(schedules['train_type']),
+            'capacity': schedules['capacity'].to_numpy(),
+            'distance_km': schedules['distance_km'].to_numpy(),
+            'typical_duration_minutes': schedules['typical_duration_minutes'].to_numpy(),
+            'route_avg_delay': route_avg_delay,
+            'route_std_delay': route_std_delay
+        })
     
     def detect_conflicts(self, schedules):
         """Find scheduling conflicts"""
         conflicts = []
         
-        schedules['dep_minutes'] = pd.to_datetime(schedules['departure_time'], format='%H:%M').dt.hour * 60 + \
-                                   pd.to_datetime(schedules['departure_time'], format='%H:%M').dt.minute
-        
         # Platform conflicts
         for station_id in schedules['origin_station_id'].unique():
             station_schedules = schedules[schedules['origin_station_id'] == station_id].copy()
             
             for platform in station_schedules['platform'].unique():
-                platform_trains = station_schedules[station_schedules['platform'] == platform].sort_values('dep_minutes')
+                platform_trains = station_schedules[station_schedules['platform'] == platform].sort_values('departure_minute')
                 
                 for i in range(len(platform_trains) - 1):
                     current = platform_trains.iloc[i]
                     next_train = platform_trains.iloc[i + 1]
                     
-                    time_diff = next_train['dep_minutes'] - current['dep_minutes']
+                    time_diff = next_train['departure_minute'] - current['departure_minute']
                     
                     if time_diff < 10:
                         conflicts.append({
                             'type': 'platform_conflict',
-                            'station_id': station_id,
-                            'platform': platform,
+                            'station_id': int(station_id),
+                            'platform': int(platform),
                             'train_1': current['train_number'],
                             'train_2': next_train['train_number'],
-                            'time_gap': time_diff,
-                            'schedule_ids': [current['schedule_id'], next_train['schedule_id']]
+                            'time_gap': int(time_diff),
+                            'schedule_ids': [int(current['schedule_id']), int(next_train['schedule_id'])]
                         })
         
         # Train conflicts
         train_usage = schedules.groupby('train_id').agg({
             'schedule_id': 'count',
-            'dep_minutes': ['min', 'max']
+            'departure_minute': ['min', 'max']
         }).reset_index()
         train_usage.columns = ['train_id', 'trip_count', 'first_dep', 'last_dep']
         
         for _, train in train_usage.iterrows():
-            train_schedules = schedules[schedules['train_id'] == train['train_id']].sort_values('dep_minutes')
+            train_schedules = schedules[schedules['train_id'] == train['train_id']].sort_values('departure_minute')
             
             for i in range(len(train_schedules) - 1):
                 current = train_schedules.iloc[i]
                 next_trip = train_schedules.iloc[i + 1]
                 
-                turnaround_time = next_trip['dep_minutes'] - (current['dep_minutes'] + current['typical_duration_minutes'])
+                turnaround_time = next_trip['departure_minute'] - (current['departure_minute'] + current['typical_duration_minutes'])
                 
                 if turnaround_time < 30:
                     conflicts.append({
                         'type': 'turnaround_conflict',
-                        'train_id': train['train_id'],
+                        'train_id': int(train['train_id']),
                         'train_number': current['train_number'],
-                        'turnaround_time': turnaround_time,
-                        'schedule_ids': [current['schedule_id'], next_trip['schedule_id']]
+                        'turnaround_time': int(turnaround_time),
+                        'schedule_ids': [int(current['schedule_id']), int(next_trip['schedule_id'])]
                     })
         
         return conflicts
@@ -139,15 +161,20 @@ class ScheduleOptimizer:
         optimized = schedules.copy()
         changes = []
         
-        # Rule 1: Adjust high-risk trains (add buffer time)
+        # Rule 1: Adjust high-risk trains (add buffer time sized to the p90 delay)
         high_risk = optimized[optimized['high_risk'] == True]
         for idx, train in high_risk.iterrows():
             if train['delay_probability'] > 0.8:
+                if 'delay_p90' in train:
+                    buffer = int(np.ceil(train['delay_p90']))
+                else:
+                    buffer = DEFAULT_BUFFER_MINUTES
                 changes.append({
-                    'schedule_id': train['schedule_id'],
+                    'schedule_id': int(train['schedule_id']),
                     'action': 'add_buffer',
                     'reason': f"High delay risk ({train['delay_probability']:.0%})",
-                    'details': 'Add 10 min buffer'
+                    'details': f'Add {buffer} min buffer',
+                    'buffer_minutes': buffer
                 })
         
         # Rule 2: Resolve platform conflicts
@@ -183,7 +210,7 @@ class ScheduleOptimizer:
             
             max_platform = station_schedules['platform'].max()
             if max_platform < 8:
-                new_platform = max_platform + 1
+                new_platform = int(max_platform) + 1
                 changes.append({
                     'schedule_id': schedule_id,
                     'action': 'reassign_platform',
@@ -202,7 +229,7 @@ class ScheduleOptimizer:
             'total_schedules': len(original_schedules),
             'high_risk_trains': int(original_risk),
             'changes_applied': len(changes),
-            'estimated_risk_reduction': max(0, original_risk - optimized_risk),
+            'estimated_risk_reduction': int(max(0, original_risk - optimized_risk)),
             'conflicts_detected': len(changes),
             'platform_reassignments': len([c for c in changes if c['action'] == 'reassign_platform']),
             'time_adjustments': len([c for c in changes if c['action'] == 'delay_departure'])
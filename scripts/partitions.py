@@ -0,0 +1,279 @@
+"""
+Monthly partitioning and retention for the delays and passengers tables
+
+Recent rows stay in the regular `delays` / `passengers` tables (the hot
+partition, where new data is inserted). Older months are moved into one
+table per month, e.g. `delays_2026_04`, so queries on recent data only
+touch a small table. Partitions older than the retention window are
+rolled up into `delay_monthly_stats` / `passenger_monthly_stats` and
+dropped.
+
+Partitions live in the main database file rather than in one attached file
+per month: SQLite allows only 10 attached databases by default, and a
+single file keeps the atomic swap of create_database.py working.
+"""
+import argparse
+import os
+import re
+import sqlite3
+from datetime import datetime
+
+DB_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'database', 'marocrail.db')
+
+# Months kept in the hot table, including the current one
+HOT_MONTHS = 3
+# Months of row-level history kept before rolling up into monthly stats
+RETENTION_MONTHS = 24
+
+# Partitioned table -> column holding the ISO date/timestamp it is split on
+PARTITIONED = {
+    'delays': 'timestamp',
+    'passengers': 'travel_date',
+}
+
+# Rows of one month of a partition, aggregated for the monthly stats tables
+# ('WHERE true' avoids SQLite's parsing ambiguity between a join ON and upsert)
+ROLLUP_SQL = {
+    'delays': """
+        INSERT INTO delay_monthly_stats (month, route_id, delay_reason, weather_condition,
+                                         delay_count, total_delay_minutes, max_delay_minutes)
+        SELECT ?, s.route_id, d.delay_reason, d.weather_condition,
+               COUNT(*), SUM(d.delay_minutes), MAX(d.delay_minutes)
+        FROM {partition} d
+        JOIN schedules s ON d.schedule_id = s.schedule_id
+        WHERE true
+        GROUP BY s.route_id, d.delay_reason, d.weather_condition
+        ON CONFLICT (month, route_id, delay_reason, weather_condition) DO UPDATE SET
+            delay_count = delay_count + excluded.delay_count,
+            total_delay_minutes = total_delay_minutes + excluded.total_delay_minutes,
+            max_delay_minutes = MAX(max_delay_minutes, excluded.max_delay_minutes)
+    """,
+    'passengers': """
+        INSERT INTO passenger_monthly_stats (month, route_id, trip_count,
+                                             total_passengers, max_passengers)
+        SELECT ?, s.route_id, COUNT(*), SUM(p.passenger_count), MAX(p.passenger_count)
+        FROM {partition} p
+        JOIN schedules s ON p.schedule_id = s.schedule_id
+        WHERE true
+        GROUP BY s.route_id
+        ON CONFLICT (month, route_id) DO UPDATE SET
+            trip_count = trip_count + excluded.trip_count,
+            total_passengers = total_passengers + excluded.total_passengers,
+            max_passengers = MAX(max_passengers, excluded.max_passengers)
+    """,
+}
+
+def month_of(value):
+    """'YYYY-MM' month of a date, datetime or ISO string"""
+    if isinstance(value, str):
+        return value[:7]
+    return value.strftime('%Y-%m')
+
+def add_months(month, count):
+    """Shift a 'YYYY-MM' month by count months"""
+    year, mon = int(month[:4]), int(month[5:7])
+    index = year * 12 + (mon - 1) + count
+    return f"{index // 12:04d}-{index % 12 + 1:02d}"
+
+def month_bounds(month):
+    """[start, end) ISO date strings covering a month"""
+    return f"{month}-01", f"{add_months(month, 1)}-01"
+
+def partition_name(table, month):
+    """Partition table name for a month, e.g. delays_2026_04"""
+    return f"{table}_{month.replace('-', '_')}"
+
+def list_partitions(conn, table):
+    """Sorted (month, partition table) pairs for a partitioned table"""
+    pattern = re.compile(rf'^{table}_(\d{{4}})_(\d{{2}})$')
+    rows = conn.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'table' AND name LIKE ?",
+        (f"{table}_%",)
+    ).fetchall()
+
+    partitions = []
+    for (name,) in rows:
+        match = pattern.match(name)
+        if match:
+            partitions.append((f"{match.group(1)}-{match.group(2)}", name))
+    return sorted(partitions)
+
+# Open-ended bounds, so range filters can always be written as col >= ? AND col < ?
+MIN_TIME = '0000'
+MAX_TIME = '9999'
+
+def time_bounds(start=None, end=None):
+    """(start, end) range parameters with open ends filled in"""
+    return start or MIN_TIME, end or MAX_TIME
+
+def partition_tables(conn, table, start=None, end=None):
+    """Hot table and the partitions overlapping [start, end), newest first"""
+    tables = [table]
+    for month, name in reversed(list_partitions(conn, table)):
+        month_start, month_end = month_bounds(month)
+        if (end and month_start >= end) or (start and month_end <= start):
+            continue
+        tables.append(name)
+    return tables
+
+def partition_union(conn, table, template, start=None, end=None):
+    """UNION ALL of a per-partition query over the partitions in [start, end)
+
+    `template` is a SELECT with a {source} placeholder for the table name
+    and exactly two parameters, the lower and upper bound of the range
+    (e.g. `WHERE timestamp >= ? AND timestamp < ?`). Returns (sql, params).
+    """
+    tables = partition_tables(conn, table, start, end)
+    sql = " UNION ALL ".join(template.format(source=name) for name in tables)
+    return sql, list(time_bounds(start, end)) * len(tables)
+
+def fetch_newest(conn, table, template, filter_params, limit, start=None, end=None):
+    """Newest-first rows from the partitions in [start, end), up to limit
+
+    `template` is a per-partition query with a {source} placeholder whose
+    parameters are the range bounds, then `filter_params`, then the LIMIT.
+    Older partitions are only read while fewer than `limit` rows were found.
+    """
+    rows = []
+    for name in partition_tables(conn, table, start, end):
+        params = [*time_bounds(start, end), *filter_params, limit - len(rows)]
+        rows += conn.execute(template.format(source=name), params).fetchall()
+        if len(rows) >= limit:
+            break
+    return rows
+
+def partition_source(conn, table, start=None, end=None):
+    """FROM-clause source for a partitioned table, pruned to [start, end)
+
+    Returns (sql, params). Partitions whose month lies entirely outside the
+    range are left out; without bounds every retained partition is included.
+    """
+    column = PARTITIONED[table]
+    template = f"SELECT * FROM {{source}} WHERE {column} >= ? AND {column} < ?"
+    sql, params = partition_union(conn, table, template, start, end)
+    return f"({sql})", params
+
+def months_before(conn, table, month):
+    """Distinct months in the hot table older than the given month"""
+    column = PARTITIONED[table]
+    rows = conn.execute(
+        f"SELECT DISTINCT substr({column}, 1, 7) FROM {table} WHERE {column} < ? ORDER BY 1",
+        (month_bounds(month)[0],)
+    ).fetchall()
+    return [row[0] for row in rows]
+
+def partition_indexes(conn, table, partition):
+    """CREATE INDEX statements giving a partition the same indexes as its hot table"""
+    rows = conn.execute(
+        "SELECT name, sql FROM sqlite_master WHERE type = 'index' AND tbl_name = ? AND sql IS NOT NULL",
+        (table,)
+    ).fetchall()
+
+    statements = []
+    for index_name, sql in rows:
+        columns = sql[sql.index('('):]
+        statements.append(
+            f"CREATE INDEX IF NOT EXISTS {index_name}_{partition} ON {partition} {columns}"
+        )
+
+    # CREATE TABLE ... AS SELECT drops the primary key; an index on its
+    # columns keeps id-range reads (e.g. new records since a high-water mark)
+    # from scanning whole partitions
+    key = [row[1] for row in sorted(conn.execute(f"PRAGMA table_info({table})"), key=lambda row: row[5])
+           if row[5]]
+    if key:
+        statements.append(
+            f"CREATE INDEX IF NOT EXISTS idx_{partition}_{'_'.join(key)} ON {partition} ({', '.join(key)})"
+        )
+    return statements
+
+def archive_month(conn, table, month):
+    """Move one month of rows from the hot table into its partition"""
+    column = PARTITIONED[table]
+    name = partition_name(table, month)
+    start, end = month_bounds(month)
+
+    conn.execute("BEGIN")
+    try:
+        conn.execute(f"CREATE TABLE IF NOT EXISTS {name} AS SELECT * FROM {table} WHERE 0")
+        for statement in partition_indexes(conn, table, name):
+            conn.execute(statement)
+        moved = conn.execute(
+            f"INSERT INTO {name} SELECT * FROM {table} WHERE {column} >= ? AND {column} < ?",
+            (start, end)
+        ).rowcount
+        conn.execute(f"DELETE FROM {table} WHERE {column} >= ? AND {column} < ?", (start, end))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+    return moved
+
+def rollup_partition(conn, table, month):
+    """Aggregate a partition into the monthly stats table and drop it"""
+    name = partition_name(table, month)
+
+    conn.execute("BEGIN")
+    try:
+        conn.execute(ROLLUP_SQL[table].format(partition=name), (month,))
+        conn.execute(f"DROP TABLE {name}")
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+def maintain_partitions(conn, now=None, hot_months=HOT_MONTHS, retention_months=RETENTION_MONTHS):
+    """Archive months that left the hot window and roll up expired partitions"""
+    current = month_of(now or datetime.now())
+    hot_start = add_months(current, -(hot_months - 1))
+    retention_start = add_months(current, -(retention_months - 1))
+
+    archived, rolled_up = [], []
+
+    for table in PARTITIONED:
+        for month in months_before(conn, table, hot_start):
+            moved = archive_month(conn, table, month)
+            archived.append((partition_name(table, month), moved))
+
+        for month, name in list_partitions(conn, table):
+            if month < retention_start:
+                rollup_partition(conn, table, month)
+                rolled_up.append(name)
+
+    return {'archived': archived, 'rolled_up': rolled_up}
+
+def print_summary(summary):
+    """Print what maintain_partitions did"""
+    for name, moved in summary['archived']:
+        print(f"[OK] Archived {moved} rows into {name}")
+    for name in summary['rolled_up']:
+        print(f"[OK] Rolled up and dropped {name}")
+    if not summary['archived'] and not summary['rolled_up']:
+        print("[INFO] Partitions already up to date")
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Partition and expire delay and passenger history")
+    parser.add_argument('--hot-months', type=int, default=HOT_MONTHS,
+                        help="months kept in the hot tables, including the current one")
+    parser.add_argument('--retention-months', type=int, default=RETENTION_MONTHS,
+                        help="months of row-level history kept before rolling up")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    print("="*60)
+    print("  MarocRail-Optimizer - Partition Maintenance")
+    print("="*60)
+
+    conn = sqlite3.connect(DB_PATH, isolation_level=None)
+    try:
+        summary = maintain_partitions(conn, hot_months=args.hot_months,
+                                      retention_months=args.retention_months)
+        print_summary(summary)
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,393 @@
+"""
+Replay historical delay events as a timed stream to stress-test ingestion
+
+Events are read from the `delays` table (all partitions) or from the
+generator output in data/delays.json and re-emitted in timestamp order,
+compressed by a speed factor (1x = real time, 1000x = a day in ~90 s).
+Batches go to a sink: the HTTP endpoint (POST /api/delays), the
+in-process batched writer the API uses, or direct SQLite inserts.
+
+Per speed step it reports acknowledgement latency, ingest-to-visible
+latency (until a separate reader sees the rows), backlog (batches due but
+not yet sent) and how late dispatches ran. Running several speeds shows
+where ingestion stops keeping up. The replayed rows are really inserted,
+so point --db / --url at a scratch copy of the database.
+"""
+import argparse
+import heapq
+import json
+import os
+import queue
+import sqlite3
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from datetime import datetime
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scripts.create_database import iter_json_array
+from scripts.delay_ingest import INSERT_DELAY_SQL, parse_event, get_writer
+from scripts.partitions import partition_source
+
+DB_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'database', 'marocrail.db')
+DEFAULT_URL = 'http://localhost:5000/api/delays'
+
+EVENT_FIELDS = ['schedule_id', 'delay_minutes', 'delay_reason', 'weather_condition',
+                'timestamp', 'resolved']
+
+MAX_BATCH = 500             # events per sink call
+MIN_SPEED, MAX_SPEED = 1, 1000  # accepted --speed factors
+POLL_INTERVAL = 0.005       # seconds between visibility polls
+FALLING_BEHIND_SECONDS = 1.0  # dispatch lag beyond which a step is reported as not keeping up
+
+class SinkRejected(Exception):
+    """The sink refused a batch because it is saturated or failed transiently;
+    retry after `retry_after` seconds"""
+
+    def __init__(self, retry_after=0.1):
+        super().__init__(f"rejected, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+def load_events(source='db', start=None, end=None, limit=None, db_path=DB_PATH):
+    """Delay events in timestamp order from the database or data/delays.json"""
+    if source == 'db':
+        conn = sqlite3.connect(db_path)
+        try:
+            table, params = partition_source(conn, 'delays', start, end)
+            sql = f"SELECT {', '.join(EVENT_FIELDS)} FROM {table} ORDER BY timestamp, delay_id"
+            if limit:
+                sql += " LIMIT ?"
+                params.append(limit)
+            rows = conn.execute(sql, params).fetchall()
+        finally:
+            conn.close()
+        return [dict(zip(EVENT_FIELDS, row)) for row in rows]
+
+    events = []
+    for record in iter_json_array('delays.json'):
+        if (start and record['timestamp'] < start) or (end and record['timestamp'] >= end):
+            continue
+        events.append({field: record[field] for field in EVENT_FIELDS})
+    events.sort(key=lambda event: event['timestamp'])
+    return events[:limit] if limit else events
+
+def plan_batches(events, speed, max_batch=MAX_BATCH):
+    """(seconds after start, events) batches: events sharing a timestamp go together
+
+    Raises ValueError unless speed is positive.
+    """
+    if speed <= 0:
+        raise ValueError("speed must be positive")
+    if not events:
+        return []
+    first = datetime.fromisoformat(events[0]['timestamp'])
+    batches = []
+    for event in events:
+        due = (datetime.fromisoformat(event['timestamp']) - first).total_seconds() / speed
+        if batches and batches[-1][0] == due and len(batches[-1][1]) < max_batch:
+            batches[-1][1].append(event)
+        else:
+            batches.append((due, [event]))
+    return batches
+
+class HttpSink:
+    """POST batches as JSON to the ingestion endpoint"""
+
+    def __init__(self, url=DEFAULT_URL, timeout=30):
+        self.url = url
+        self.timeout = timeout
+
+    def send(self, events):
+        request = urllib.request.Request(self.url, data=json.dumps(events).encode('utf-8'),
+                                         headers={'Content-Type': 'application/json'})
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                body = json.loads(response.read())
+        except urllib.error.HTTPError as e:
+            if e.code == 503:
+                raise SinkRejected(float(e.headers.get('Retry-After') or 1))
+            raise RuntimeError(f"HTTP {e.code}: {e.read()[:200]!r}")
+        # 202 Accepted carries no ids: acknowledged, but visibility is not tracked
+        return body.get('delay_ids')
+
+class CallableSink:
+    """Hand batches to an in-process function returning the new delay ids (or None)"""
+
+    def __init__(self, function):
+        self.function = function
+
+    def send(self, events):
+        return self.function(events)
+
+def writer_sink(db_path=DB_PATH, timeout=30):
+    """CallableSink feeding the batched writer behind POST /api/delays"""
+    writer = get_writer(db_path)
+
+    def submit(events):
+        try:
+            submission = writer.submit([parse_event(event) for event in events])
+        except queue.Full:
+            raise SinkRejected(0.05)
+        if not submission.wait(timeout):
+            return None
+        if submission.write_failed:
+            raise SinkRejected(1.0)
+        if submission.error:
+            raise RuntimeError(submission.error)
+        return submission.delay_ids
+
+    return CallableSink(submit)
+
+class SqliteSink:
+    """Insert batches directly, one connection and transaction per sender thread"""
+
+    def __init__(self, db_path=DB_PATH):
+        self.db_path = db_path
+        self.local = threading.local()
+
+    def send(self, events):
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            conn = self.local.conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode = WAL")
+        rows = [parse_event(event) for event in events]
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany(INSERT_DELAY_SQL, rows)
+            last_id = conn.execute("SELECT last_insert_rowid()").fetchone()[0]
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return list(range(last_id - len(rows) + 1, last_id + 1))
+
+class VisibilityPoller(threading.Thread):
+    """Watch MAX(delay_id) from a separate connection and time when batches become visible"""
+
+    def __init__(self, db_path, interval=POLL_INTERVAL):
+        super().__init__(name='visibility-poller', daemon=True)
+        self.db_path = db_path
+        self.interval = interval
+        self.pending = []       # heap of (max delay_id, sent at)
+        self.latencies = []
+        self.lock = threading.Lock()
+        self.stopping = threading.Event()
+
+    def expect(self, delay_ids, sent_at):
+        with self.lock:
+            heapq.heappush(self.pending, (max(delay_ids), sent_at))
+
+    def run(self):
+        conn = sqlite3.connect(self.db_path)
+        try:
+            while not self.stopping.is_set():
+                visible = conn.execute("SELECT MAX(delay_id) FROM delays").fetchone()[0] or 0
+                now = time.perf_counter()
+                with self.lock:
+                    while self.pending and self.pending[0][0] <= visible:
+                        self.latencies.append(now - heapq.heappop(self.pending)[1])
+                time.sleep(self.interval)
+        finally:
+            conn.close()
+
+    def stop(self, drain_timeout=5.0):
+        deadline = time.perf_counter() + drain_timeout
+        while self.pending and time.perf_counter() < deadline:
+            time.sleep(self.interval)
+        self.stopping.set()
+        self.join()
+
+def percentiles(values):
+    """p50/p95/p99/max in milliseconds"""
+    if not values:
+        return None
+    values = np.asarray(values) * 1000
+    return {'p50_ms': round(float(np.percentile(values, 50)), 2),
+            'p95_ms': round(float(np.percentile(values, 95)), 2),
+            'p99_ms': round(float(np.percentile(values, 99)), 2),
+            'max_ms': round(float(values.max()), 2)}
+
+def replay(events, sink, speed=1.0, concurrency=4, max_batch=MAX_BATCH, duration=None,
+           db_path=DB_PATH, retime=False):
+    """Replay events into a sink at a speed factor and return the measurements
+
+    `duration` caps the wall time spent dispatching. With `retime`, events
+    are stamped with the time they are sent instead of their original time.
+    """
+    batches = plan_batches(events, speed, max_batch)
+    pending = queue.Queue()
+    poller = VisibilityPoller(db_path)
+    lock = threading.Lock()
+    stats = {'events_sent': 0, 'events_acked': 0, 'rejections': 0, 'errors': 0,
+             'max_backlog': 0, 'error_samples': []}
+    ack_latencies, dispatch_lags = [], []
+
+    def sender():
+        while True:
+            item = pending.get()
+            if item is None:
+                return
+            due_at, batch = item
+            dispatch_lags.append(max(0.0, time.perf_counter() - due_at))
+            if retime:
+                now = datetime.now().isoformat(timespec='seconds')
+                batch = [dict(event, timestamp=now) for event in batch]
+            while True:
+                sent_at = time.perf_counter()
+                try:
+                    delay_ids = sink.send(batch)
+                except SinkRejected as e:
+                    with lock:
+                        stats['rejections'] += 1
+                    time.sleep(e.retry_after)
+                    continue
+                except Exception as e:
+                    with lock:
+                        stats['errors'] += 1
+                        if len(stats['error_samples']) < 5:
+                            stats['error_samples'].append(str(e))
+                    break
+                ack_latencies.append(time.perf_counter() - sent_at)
+                with lock:
+                    stats['events_acked'] += len(batch)
+                if delay_ids:
+                    poller.expect(delay_ids, sent_at)
+                break
+
+    poller.start()
+    threads = [threading.Thread(target=sender, name=f'replay-sender-{i}', daemon=True)
+               for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+
+    start = time.perf_counter()
+    for due, batch in batches:
+        due_at = start + due
+        if duration is not None and due > duration:
+            break
+        wait = due_at - time.perf_counter()
+        if wait > 0:
+            time.sleep(wait)
+        pending.put((due_at, batch))
+        stats['events_sent'] += len(batch)
+        stats['max_backlog'] = max(stats['max_backlog'], pending.qsize())
+    dispatched = time.perf_counter() - start
+
+    for _ in threads:
+        pending.put(None)
+    for thread in threads:
+        thread.join()
+    poller.stop()
+    elapsed = time.perf_counter() - start
+
+    lag = percentiles(dispatch_lags)
+    return {
+        'speed': speed,
+        'concurrency': concurrency,
+        'events_sent': stats['events_sent'],
+        'events_acked': stats['events_acked'],
+        'rejections': stats['rejections'],
+        'errors': stats['errors'],
+        'error_samples': stats['error_samples'],
+        'dispatch_seconds': round(dispatched, 3),
+        'elapsed_seconds': round(elapsed, 3),
+        'throughput_eps': round(stats['events_acked'] / elapsed, 1) if elapsed else None,
+        'offered_eps': round(stats['events_sent'] / dispatched, 1) if dispatched else None,
+        'max_backlog_batches': stats['max_backlog'],
+        'dispatch_lag': lag,
+        'ack_latency': percentiles(ack_latencies),
+        'visible_latency': percentiles(poller.latencies),
+        'keeping_up': bool(stats['errors'] == 0 and lag is not None
+                           and lag['p95_ms'] < FALLING_BEHIND_SECONDS * 1000),
+    }
+
+def print_step(result):
+    """Print the measurements of one speed step"""
+    status = "[OK]" if result['keeping_up'] else "[WARNING]"
+    print(f"\n{status} {result['speed']:g}x: {result['events_acked']}/{result['events_sent']} events acked "
+          f"in {result['elapsed_seconds']}s ({result['throughput_eps']} ev/s, "
+          f"offered {result['offered_eps']} ev/s)")
+    print(f"  Backlog: max {result['max_backlog_batches']} batches, "
+          f"rejections: {result['rejections']}, errors: {result['errors']}")
+    for name in ('dispatch_lag', 'ack_latency', 'visible_latency'):
+        values = result[name]
+        if values:
+            print(f"  {name.replace('_', ' ').capitalize()}: p50 {values['p50_ms']} ms, "
+                  f"p95 {values['p95_ms']} ms, p99 {values['p99_ms']} ms, max {values['max_ms']} ms")
+    for sample in result['error_samples']:
+        print(f"  [FAIL] {sample}")
+
+def make_sink(args):
+    if args.sink == 'http':
+        return HttpSink(args.url)
+    if args.sink == 'writer':
+        return writer_sink(args.db)
+    return SqliteSink(args.db)
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Replay delay events at a speed factor to stress-test ingestion")
+    parser.add_argument('--source', choices=['db', 'file'], default='db',
+                        help="read events from the delays table or data/delays.json")
+    parser.add_argument('--start', metavar='YYYY-MM-DD', help="first event date")
+    parser.add_argument('--end', metavar='YYYY-MM-DD', help="end date (exclusive)")
+    parser.add_argument('--limit', type=int, help="replay at most this many events")
+    parser.add_argument('--speed', type=float, nargs='+', default=[100.0],
+                        help=f"speed factors ({MIN_SPEED}-{MAX_SPEED}), run one after the other")
+    parser.add_argument('--duration', type=float, help="seconds of replay per speed step")
+    parser.add_argument('--sink', choices=['http', 'writer', 'sqlite'], default='writer',
+                        help="POST to --url, the in-process batched writer, or direct inserts")
+    parser.add_argument('--url', default=DEFAULT_URL, help="ingestion endpoint for --sink http")
+    parser.add_argument('--db', default=DB_PATH,
+                        help="database written by the sink and polled for visibility")
+    parser.add_argument('--concurrency', type=int, default=4, help="concurrent sender threads")
+    parser.add_argument('--batch', type=int, default=MAX_BATCH, help="max events per sink call")
+    parser.add_argument('--retime', action='store_true',
+                        help="stamp events with the time they are sent")
+    parser.add_argument('--output', help="write the measurements to this JSON file")
+    args = parser.parse_args(argv)
+    if not all(MIN_SPEED <= speed <= MAX_SPEED for speed in args.speed):
+        parser.error(f"--speed must be between {MIN_SPEED} and {MAX_SPEED}")
+    return args
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    print("="*60)
+    print("  MarocRail-Optimizer - Delay Event Replay")
+    print("="*60)
+
+    events = load_events(args.source, args.start, args.end, args.limit, args.db)
+    if not events:
+        print("[FAIL] No events to replay")
+        return 1
+    print(f"[OK] Loaded {len(events)} events ({events[0]['timestamp']} .. {events[-1]['timestamp']})")
+    print(f"[INFO] Sink: {args.sink}, concurrency {args.concurrency}, batch {args.batch}")
+
+    sink = make_sink(args)
+    results = []
+    for speed in args.speed:
+        result = replay(events, sink, speed, args.concurrency, args.batch, args.duration,
+                        args.db, args.retime)
+        print_step(result)
+        results.append(result)
+
+    falling = [r['speed'] for r in results if not r['keeping_up']]
+    print()
+    if falling:
+        print(f"[WARNING] Ingestion falls behind from {min(falling):g}x")
+    else:
+        print("[OK] Ingestion kept up at every speed")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+        print(f"[OK] Results saved to: {args.output}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,244 @@
+"""
+In-memory search index for autocomplete over stations, cities, trains and routes
+
+Labels are folded (lowercase, accents removed, so 'meknes' finds Meknès)
+and split into tokens. A sorted array of (key, entry) pairs works as a trie:
+bisect finds the run of keys starting with a prefix. A query matches an
+entry when each of its tokens prefixes one of the entry's keys. Results are
+ranked as exact label, label prefix, then token prefixes. When too few
+entries match, a trigram index fills in misspellings ('marakesh'), scored
+by the Dice overlap of their trigrams. Each source (stations and cities,
+trains, routes) is re-indexed on its own when table_versions shows that one
+of its tables changed.
+"""
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter
+from heapq import nsmallest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scripts.journey_planner import fold
+
+DB_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'database', 'marocrail.db')
+
+DEFAULT_LIMIT = 10
+MAX_LIMIT = 50
+FUZZY_THRESHOLD = 0.3       # minimum trigram Dice similarity
+RESULT_CACHE_SIZE = 10000   # answers kept until the next re-index
+VERSION_CHECK_INTERVAL = 1.0  # seconds between table_versions lookups
+
+TYPES = ('station', 'city', 'route', 'train')
+
+SEARCH_STATIONS_QUERY = "SELECT station_id, name, city FROM stations ORDER BY station_id"
+SEARCH_TRAINS_QUERY = "SELECT train_id, train_number, train_type FROM trains ORDER BY train_id"
+SEARCH_ROUTES_QUERY = """
+    SELECT r.route_id, s1.name, s1.city, s2.name, s2.city
+    FROM routes r
+    JOIN stations s1 ON r.origin_station_id = s1.station_id
+    JOIN stations s2 ON r.destination_station_id = s2.station_id
+    ORDER BY r.route_id
+"""
+
+SEARCH_VERSIONS_QUERY = """
+    SELECT table_name, version, changed_at
+    FROM table_versions
+    WHERE table_name IN ('routes', 'stations', 'trains')
+    ORDER BY table_name
+"""
+
+# Index source -> tables its entries are read from
+SOURCES = {
+    'stations': ('stations',),
+    'trains': ('trains',),
+    'routes': ('routes', 'stations'),
+}
+
+_TOKEN = re.compile(r'[a-z0-9]+')
+
+def tokens(text):
+    """Folded alphanumeric tokens of a text"""
+    return _TOKEN.findall(fold(text))
+
+def trigrams(words):
+    """Trigrams of words padded so that short words and word starts count"""
+    grams = set()
+    for word in words:
+        padded = f"  {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+def station_entries(conn):
+    """Stations, plus cities whose name is not just one station's name"""
+    entries, cities = [], {}
+    for station_id, name, city in conn.execute(SEARCH_STATIONS_QUERY):
+        entries.append(({'type': 'station', 'label': name, 'station_id': station_id, 'city': city},
+                        [name, city]))
+        cities.setdefault(city, []).append((station_id, name))
+    for city, stations in cities.items():
+        if len(stations) > 1 or fold(stations[0][1]) != fold(city):
+            entries.append(({'type': 'city', 'label': city,
+                             'station_ids': [station_id for station_id, _ in stations]}, [city]))
+    return entries
+
+def train_entries(conn):
+    return [({'type': 'train', 'label': number, 'train_id': train_id, 'train_type': train_type}, [number])
+            for train_id, number, train_type in conn.execute(SEARCH_TRAINS_QUERY)]
+
+def route_entries(conn):
+    return [({'type': 'route', 'label': f"{origin} → {destination}", 'route_id': route_id},
+             [origin, origin_city, destination, destination_city])
+            for route_id, origin, origin_city, destination, destination_city in conn.execute(SEARCH_ROUTES_QUERY)]
+
+LOADERS = {
+    'stations': station_entries,
+    'trains': train_entries,
+    'routes': route_entries,
+}
+
+class SearchIndex:
+    """Prefix keys and trigram postings over every searchable entry"""
+
+    def __init__(self, db_path=DB_PATH):
+        self.db_path = db_path
+        self.lock = threading.Lock()
+        self.versions = {}
+        self.checked_at = 0.0
+        self.next_id = 0
+        self.entries = {}       # entry id -> public fields
+        self.order = {}         # entry id -> (type index, label length, folded label)
+        self.grams = {}         # entry id -> trigram set
+        self.by_source = {source: [] for source in SOURCES}
+        self.keys = []          # sorted (key, entry id)
+        self.key_text = []      # the keys alone, for bisect
+        self.key_ids = []
+        self.postings = {}      # trigram -> entry ids
+        self.cache = {}
+
+    def build(self):
+        """Index every source"""
+        self.refresh(force=True)
+        return self
+
+    def refresh(self, force=False):
+        """Re-index the sources whose tables changed; returns their names"""
+        conn = sqlite3.connect(self.db_path)
+        try:
+            versions = {row[0]: tuple(row[1:]) for row in conn.execute(SEARCH_VERSIONS_QUERY)}
+            changed = [source for source, tables in SOURCES.items()
+                       if force or any(versions.get(t) != self.versions.get(t) for t in tables)]
+            loaded = {source: LOADERS[source](conn) for source in changed}
+        finally:
+            conn.close()
+
+        with self.lock:
+            for source, entries in loaded.items():
+                self._drop(source)
+                for entry, texts in entries:
+                    self._add(source, entry, texts)
+            if loaded:
+                self.keys.sort()
+                self.key_text = [key for key, _ in self.keys]
+                self.key_ids = [entry_id for _, entry_id in self.keys]
+                self.cache = {}
+            self.versions = versions
+            self.checked_at = time.monotonic()
+        return changed
+
+    def _add(self, source, entry, texts):
+        entry_id = self.next_id
+        self.next_id += 1
+        words = [word for text in texts for word in tokens(text)]
+        compact = ''.join(tokens(entry['label']))
+
+        self.entries[entry_id] = entry
+        self.order[entry_id] = (TYPES.index(entry['type']), len(compact), compact)
+        self.grams[entry_id] = trigrams(words)
+        self.by_source[source].append(entry_id)
+        self.keys.extend((key, entry_id) for key in set(words) | {compact})
+        for gram in self.grams[entry_id]:
+            self.postings.setdefault(gram, set()).add(entry_id)
+
+    def _drop(self, source):
+        dropped = set(self.by_source[source])
+        if not dropped:
+            return
+        self.keys = [key for key in self.keys if key[1] not in dropped]
+        for entry_id in dropped:
+            for gram in self.grams.pop(entry_id):
+                self.postings[gram].discard(entry_id)
+            del self.entries[entry_id]
+            del self.order[entry_id]
+        self.by_source[source] = []
+
+    def _prefixed(self, prefix):
+        """Entry ids with a key starting with prefix"""
+        start = bisect_left(self.key_text, prefix)
+        end = bisect_left(self.key_text, prefix + '\uffff', start)
+        return set(self.key_ids[start:end])
+
+    def search(self, query, limit=DEFAULT_LIMIT, types=TYPES):
+        """Best entries for a partial query, each with how it matched"""
+        words = tuple(tokens(query))
+        if not words:
+            return []
+        compact = ''.join(words)
+        allowed = {TYPES.index(t) for t in types}
+
+        with self.lock:
+            key = (words, limit, tuple(sorted(allowed)))
+            if key in self.cache:
+                return self.cache[key]
+
+            matched = None
+            for word in words:
+                found = self._prefixed(word)
+                matched = found if matched is None else matched & found
+            matched |= self._prefixed(compact)
+
+            ranked = []
+            for entry_id in matched:
+                type_index, length, label = self.order[entry_id]
+                if type_index in allowed:
+                    rank = 0 if label == compact else 1 if label.startswith(compact) else 2
+                    ranked.append((rank, 0.0, type_index, length, label, entry_id))
+
+            if len(ranked) < limit:
+                grams = trigrams(words)
+                shared = Counter()
+                for gram in grams:
+                    shared.update(self.postings.get(gram, ()))
+                # Dice >= FUZZY_THRESHOLD needs at least this many shared trigrams
+                minimum = FUZZY_THRESHOLD * len(grams) / (2 - FUZZY_THRESHOLD)
+                for entry_id, count in shared.items():
+                    if count < minimum or entry_id in matched:
+                        continue
+                    type_index, length, label = self.order[entry_id]
+                    similarity = 2 * count / (len(grams) + len(self.grams[entry_id]))
+                    if type_index in allowed and similarity >= FUZZY_THRESHOLD:
+                        ranked.append((3, -similarity, type_index, length, label, entry_id))
+
+            result = [dict(self.entries[row[-1]], match=('exact', 'prefix', 'prefix', 'fuzzy')[row[0]])
+                      for row in nsmallest(limit, ranked)]
+            if len(self.cache) >= RESULT_CACHE_SIZE:
+                self.cache = {}
+            self.cache[key] = result
+            return result
+
+_index = None
+_index_lock = threading.Lock()
+
+def get_search_index(db_path=DB_PATH, max_age=VERSION_CHECK_INTERVAL):
+    """The process-wide index, built on first use and re-indexed where tables changed"""
+    global _index
+    with _index_lock:
+        if _index is None or _index.db_path != db_path:
+            _index = SearchIndex(db_path).build()
+        elif time.monotonic() - _index.checked_at > max_age:
+            _index.refresh()
+        return _index
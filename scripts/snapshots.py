@@ -0,0 +1,375 @@
+"""
+Columnar snapshots of schedules, delays and passengers
+
+Each dataset is exported denormalized (joined with trains, routes and
+stations) to `data/snapshots/<name>/`: one `.npy` file per column and
+chunk, plus a `manifest.json`. Strings are dictionary-encoded as int32
+codes with the dictionary kept in the manifest. Readers memory-map the
+column files, so a scan touches only the columns it needs and skips SQL.
+
+Delays and passengers are append-only, so a refresh only exports rows past
+the high-water mark of the key column as a new chunk. Changes to rows
+that were already exported need `--full`. Schedules are small and mutable
+and are rewritten on every export.
+"""
+import argparse
+import json
+import os
+import shutil
+import sqlite3
+import sys
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scripts.partitions import partition_source
+from scripts.timecodes import HOUR_SQL, DAY_OF_WEEK_SQL, epoch_month
+
+DB_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'database', 'marocrail.db')
+SNAPSHOT_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data', 'snapshots')
+
+FETCH_SIZE = 100000
+MAX_CHUNKS = 8  # incremental chunks before a refresh compacts them into one
+
+# Dataset -> key column (None: always rewritten), SQL, column dtypes ('dict' = dictionary-encoded)
+# and columns derived in numpy from another column
+DATASETS = {
+    'schedules': {
+        'key': None,
+        'sql': """
+            SELECT s.schedule_id, s.train_id, s.route_id, t.train_number, t.train_type,
+                   t.capacity, r.origin_station_id, r.destination_station_id,
+                   st1.name as origin_station, st2.name as destination_station,
+                   r.distance_km, r.typical_duration_minutes, s.departure_time,
+                   s.arrival_time, s.departure_minute, s.arrival_minute, s.platform,
+                   s.day_of_week, s.status
+            FROM schedules s
+            JOIN trains t ON s.train_id = t.train_id
+            JOIN routes r ON s.route_id = r.route_id
+            JOIN stations st1 ON r.origin_station_id = st1.station_id
+            JOIN stations st2 ON r.destination_station_id = st2.station_id
+            ORDER BY s.schedule_id
+        """,
+        'columns': {
+            'schedule_id': 'int32', 'train_id': 'int32', 'route_id': 'int32',
+            'train_number': 'dict', 'train_type': 'dict', 'capacity': 'int32',
+            'origin_station_id': 'int32', 'destination_station_id': 'int32',
+            'origin_station': 'dict', 'destination_station': 'dict',
+            'distance_km': 'float64', 'typical_duration_minutes': 'int32',
+            'departure_time': 'dict', 'arrival_time': 'dict', 'departure_minute': 'int16',
+            'arrival_minute': 'int16', 'platform': 'int16', 'day_of_week': 'dict',
+            'status': 'dict',
+        },
+    },
+    'delays': {
+        'key': 'delay_id',
+        'sql': f"""
+            SELECT d.delay_id, d.schedule_id, s.route_id, s.train_id, t.train_type,
+                   t.capacity, r.distance_km, r.typical_duration_minutes,
+                   r.origin_station_id, r.destination_station_id,
+                   s.departure_time, s.departure_minute, s.platform, d.delay_minutes,
+                   d.delay_reason, d.weather_condition, d.timestamp_epoch as timestamp,
+                   {HOUR_SQL} as hour, {DAY_OF_WEEK_SQL} as day_of_week,
+                   d.resolved
+            FROM {{source}} d
+            JOIN schedules s ON d.schedule_id = s.schedule_id
+            JOIN trains t ON s.train_id = t.train_id
+            JOIN routes r ON s.route_id = r.route_id
+            WHERE d.delay_id > ?
+            ORDER BY d.delay_id
+        """,
+        'columns': {
+            'delay_id': 'int64', 'schedule_id': 'int32', 'route_id': 'int32',
+            'train_id': 'int32', 'train_type': 'dict', 'capacity': 'int32',
+            'distance_km': 'float64', 'typical_duration_minutes': 'int32',
+            'origin_station_id': 'int32', 'destination_station_id': 'int32',
+            'departure_time': 'dict', 'departure_minute': 'int16', 'platform': 'int16',
+            'delay_minutes': 'int32', 'delay_reason': 'dict', 'weather_condition': 'dict',
+            'timestamp': 'datetime64[s]', 'hour': 'int8', 'day_of_week': 'int8',
+            'resolved': 'int8', 'month': 'int8',
+        },
+        'derived': {'month': ('timestamp', epoch_month)},
+    },
+    'passengers': {
+        'key': 'record_id',
+        'sql': """
+            SELECT p.record_id, p.schedule_id, s.route_id, t.capacity, s.departure_time,
+                   p.passenger_count, p.booking_date, p.travel_date
+            FROM {source} p
+            JOIN schedules s ON p.schedule_id = s.schedule_id
+            JOIN trains t ON s.train_id = t.train_id
+            WHERE p.record_id > ?
+            ORDER BY p.record_id
+        """,
+        'columns': {
+            'record_id': 'int64', 'schedule_id': 'int32', 'route_id': 'int32',
+            'capacity': 'int32', 'departure_time': 'dict', 'passenger_count': 'int32',
+            'booking_date': 'datetime64[D]', 'travel_date': 'datetime64[D]',
+        },
+    },
+}
+
+def snapshot_path(name, snapshot_dir=SNAPSHOT_DIR):
+    return os.path.join(snapshot_dir, name)
+
+def read_manifest(name, snapshot_dir=SNAPSHOT_DIR):
+    """Manifest of a snapshot, or None if it was never exported"""
+    path = os.path.join(snapshot_path(name, snapshot_dir), 'manifest.json')
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def write_manifest(name, manifest, snapshot_dir=SNAPSHOT_DIR):
+    """Replace the manifest atomically (readers see the old or the new one)"""
+    path = os.path.join(snapshot_path(name, snapshot_dir), 'manifest.json')
+    with open(path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, ensure_ascii=False)
+    os.replace(path + '.tmp', path)
+
+def encode_strings(values, dictionary):
+    """int32 codes for values, appending unseen values to dictionary"""
+    uniques, inverse = np.unique(np.asarray(values, dtype=object), return_inverse=True)
+    index = {value: code for code, value in enumerate(dictionary)}
+    for value in uniques:
+        if value not in index:
+            index[value] = len(dictionary)
+            dictionary.append(value)
+    mapping = np.array([index[value] for value in uniques], dtype=np.int32)
+    return mapping[inverse] if len(uniques) else np.empty(0, dtype=np.int32)
+
+def fetch_columns(conn, sql, params, column_types, dictionaries):
+    """Run a query and return its result as a dict of typed numpy columns"""
+    cursor = conn.execute(sql, params)
+    names = [d[0] for d in cursor.description]
+    parts = {name: [] for name in names}
+
+    while True:
+        rows = cursor.fetchmany(FETCH_SIZE)
+        if not rows:
+            break
+        for name, values in zip(names, zip(*rows)):
+            dtype = column_types[name]
+            if dtype == 'dict':
+                parts[name].append(encode_strings(values, dictionaries.setdefault(name, [])))
+            else:
+                parts[name].append(np.array(values, dtype=dtype))
+
+    columns = {}
+    for name in names:
+        dtype = np.int32 if column_types[name] == 'dict' else column_types[name]
+        columns[name] = np.concatenate(parts[name]) if parts[name] else np.empty(0, dtype=dtype)
+    return columns
+
+def write_chunk(directory, chunk_name, columns):
+    """Write one .npy file per column into a new chunk directory"""
+    chunk_dir = os.path.join(directory, chunk_name)
+    os.makedirs(chunk_dir, exist_ok=True)
+    for name, values in columns.items():
+        np.save(os.path.join(chunk_dir, f"{name}.npy"), values)
+
+def export_snapshot(conn, name, full=False, snapshot_dir=SNAPSHOT_DIR):
+    """Export or incrementally refresh one dataset, return the number of new rows"""
+    spec = DATASETS[name]
+    directory = snapshot_path(name, snapshot_dir)
+    manifest = None if full or spec['key'] is None else read_manifest(name, snapshot_dir)
+    high_water_mark = manifest['high_water_mark'] if manifest else 0
+
+    sql = spec['sql']
+    if spec['key'] is not None:
+        source, params = partition_source(conn, name)
+        sql = sql.format(source=source)
+        # A rebuilt database with fewer rows than exported: start over
+        max_key = conn.execute(f"SELECT MAX({spec['key']}) FROM {source}", params).fetchone()[0] or 0
+        if max_key < high_water_mark:
+            manifest, high_water_mark = None, 0
+        params = params + [high_water_mark]
+    else:
+        params = []
+
+    dictionaries = {col: list(info.get('dictionary', []))
+                    for col, info in (manifest or {}).get('columns', {}).items()}
+    columns = fetch_columns(conn, sql, params, spec['columns'], dictionaries)
+    for col, (source_col, derive) in spec.get('derived', {}).items():
+        columns[col] = derive(columns[source_col].astype(np.int64)).astype(spec['columns'][col])
+    new_rows = len(next(iter(columns.values())))
+
+    if manifest is None:
+        # Fresh export: write into a new directory and swap it in
+        staging = directory + '.new'
+        shutil.rmtree(staging, ignore_errors=True)
+        os.makedirs(staging)
+        write_chunk(staging, 'chunk-0000', columns)
+        chunks = [{'name': 'chunk-0000', 'rows': new_rows}]
+        old = directory + '.old'
+        if os.path.exists(directory):
+            os.replace(directory, old)
+        os.replace(staging, directory)
+        shutil.rmtree(old, ignore_errors=True)
+        created_at = datetime.now().isoformat(timespec='seconds')
+    else:
+        if new_rows == 0:
+            return 0
+        chunks = list(manifest['chunks'])
+        chunk_name = f"chunk-{int(chunks[-1]['name'].split('-')[1]) + 1:04d}"
+        write_chunk(directory, chunk_name, columns)
+        chunks.append({'name': chunk_name, 'rows': new_rows})
+        created_at = manifest['created_at']
+
+    key = spec['key']
+    if key and new_rows:
+        high_water_mark = int(columns[key][-1])
+
+    column_info = {}
+    for col, dtype in spec['columns'].items():
+        if dtype == 'dict':
+            column_info[col] = {'dtype': 'int32', 'dictionary': dictionaries.get(col, [])}
+        else:
+            column_info[col] = {'dtype': dtype}
+
+    write_manifest(name, {
+        'name': name,
+        'key': key,
+        'high_water_mark': high_water_mark,
+        'rows': sum(chunk['rows'] for chunk in chunks),
+        'created_at': created_at,
+        'updated_at': datetime.now().isoformat(timespec='seconds'),
+        'columns': column_info,
+        'chunks': chunks,
+    }, snapshot_dir)
+
+    if len(chunks) > MAX_CHUNKS:
+        compact_snapshot(name, snapshot_dir)
+
+    return new_rows
+
+def compact_snapshot(name, snapshot_dir=SNAPSHOT_DIR):
+    """Merge all chunks of a snapshot into a single chunk"""
+    manifest = read_manifest(name, snapshot_dir)
+    directory = snapshot_path(name, snapshot_dir)
+    columns = load_snapshot(name, snapshot_dir=snapshot_dir, mmap=False)
+
+    chunk_name = f"chunk-{int(manifest['chunks'][-1]['name'].split('-')[1]) + 1:04d}"
+    write_chunk(directory, chunk_name, columns)
+    old_chunks = manifest['chunks']
+    manifest['chunks'] = [{'name': chunk_name, 'rows': manifest['rows']}]
+    write_manifest(name, manifest, snapshot_dir)
+
+    # Open memory maps of the old files stay valid after unlinking
+    for chunk in old_chunks:
+        shutil.rmtree(os.path.join(directory, chunk['name']), ignore_errors=True)
+
+def load_snapshot(name, columns=None, snapshot_dir=SNAPSHOT_DIR, mmap=True):
+    """Dict of column -> numpy array (strings as int32 codes)
+
+    With a single chunk the arrays are read-only memory maps of the files;
+    multiple chunks are concatenated into memory.
+    """
+    manifest = read_manifest(name, snapshot_dir)
+    if manifest is None:
+        raise FileNotFoundError(f"No {name} snapshot, run scripts/snapshots.py first")
+
+    directory = snapshot_path(name, snapshot_dir)
+    mmap_mode = 'r' if mmap else None
+    result = {}
+    for col in columns or manifest['columns']:
+        parts = [np.load(os.path.join(directory, chunk['name'], f"{col}.npy"), mmap_mode=mmap_mode)
+                 for chunk in manifest['chunks']]
+        result[col] = parts[0] if len(parts) == 1 else np.concatenate(parts)
+    return result
+
+def snapshot_frame(name, columns=None, snapshot_dir=SNAPSHOT_DIR):
+    """Snapshot as a DataFrame, dictionary columns as pandas Categoricals"""
+    manifest = read_manifest(name, snapshot_dir)
+    arrays = load_snapshot(name, columns, snapshot_dir)
+
+    data = {}
+    for col, values in arrays.items():
+        dictionary = manifest['columns'][col].get('dictionary')
+        if dictionary is not None:
+            data[col] = pd.Categorical.from_codes(values, categories=dictionary)
+        else:
+            data[col] = values
+    return pd.DataFrame(data, copy=False)
+
+def group_stats(codes, minutes, labels):
+    """count / avg_delay / max_delay per code, as rows sorted like the SQL groups"""
+    size = len(labels)
+    counts = np.bincount(codes, minlength=size)
+    totals = np.bincount(codes, weights=minutes, minlength=size)
+    maxima = np.zeros(size, dtype=np.int64)
+    np.maximum.at(maxima, codes, minutes)
+
+    return [{'count': int(counts[i]), 'avg_delay': float(totals[i] / counts[i]),
+             'max_delay': int(maxima[i]), 'label': labels[i]}
+            for i in range(size) if counts[i]]
+
+def delay_breakdowns(start=None, end=None, snapshot_dir=SNAPSHOT_DIR):
+    """By reason / hour / weather delay statistics scanned from the delays snapshot
+
+    Same shape as the SQL analytics of app.py. Returns (data, updated_at).
+    """
+    manifest = read_manifest('delays', snapshot_dir)
+    if manifest is None:
+        raise FileNotFoundError("No delays snapshot, run scripts/snapshots.py first")
+    arrays = load_snapshot('delays', ['timestamp', 'delay_minutes', 'delay_reason',
+                                      'weather_condition', 'hour'], snapshot_dir)
+
+    mask = np.ones(len(arrays['timestamp']), dtype=bool)
+    if start:
+        mask &= arrays['timestamp'] >= np.datetime64(start)
+    if end:
+        mask &= arrays['timestamp'] < np.datetime64(end)
+    minutes = arrays['delay_minutes'][mask]
+
+    data = {}
+    for group, column, labels in [
+        ('by_reason', 'delay_reason', manifest['columns']['delay_reason']['dictionary']),
+        ('by_hour', 'hour', list(range(24))),
+        ('by_weather', 'weather_condition', manifest['columns']['weather_condition']['dictionary']),
+    ]:
+        rows = group_stats(arrays[column][mask].astype(np.intp), minutes, labels)
+        for row in rows:
+            row[column] = row.pop('label')
+        if group == 'by_hour':
+            rows.sort(key=lambda row: row['hour'])
+        else:
+            rows.sort(key=lambda row: -row['count'])
+        data[group] = rows
+
+    return data, manifest['updated_at']
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Export columnar snapshots for analytics and training")
+    parser.add_argument('--full', action='store_true', help="rewrite snapshots instead of appending new rows")
+    parser.add_argument('--datasets', nargs='+', choices=list(DATASETS), default=list(DATASETS),
+                        help="datasets to export")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    print("="*60)
+    print("  MarocRail-Optimizer - Snapshot Export")
+    print("="*60)
+
+    conn = sqlite3.connect(DB_PATH)
+    try:
+        for name in args.datasets:
+            # One read transaction per dataset so the export is consistent
+            conn.execute("BEGIN")
+            new_rows = export_snapshot(conn, name, full=args.full)
+            conn.rollback()
+            manifest = read_manifest(name)
+            print(f"[OK] {name}: +{new_rows} rows ({manifest['rows']} total, "
+                  f"{len(manifest['chunks'])} chunks)")
+    finally:
+        conn.close()
+
+    print(f"\n[OK] Snapshots written to: {SNAPSHOT_DIR}")
+
+if __name__ == "__main__":
+    main()
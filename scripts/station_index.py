@@ -0,0 +1,113 @@
+"""
+In-memory spatial index of stations for nearest-station lookups
+
+Stations are stored as points on the unit sphere in a KD-tree. The straight
+(chord) distance between two such points grows with their great-circle
+distance, so the tree's k nearest points are exactly the k nearest stations
+and a radius in km maps to a chord length. Hits are re-ranked by haversine
+distance in km. The index is rebuilt only when the stations version in
+table_versions (bumped by triggers in schema.sql) changes.
+"""
+import os
+import sqlite3
+import sys
+import threading
+import time
+
+import numpy as np
+from sklearn.neighbors import KDTree
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scripts.journey_planner import EARTH_RADIUS_KM, haversine_km
+
+DB_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'database', 'marocrail.db')
+
+DEFAULT_K = 5
+MAX_K = 50
+VERSION_CHECK_INTERVAL = 1.0  # seconds between table_versions lookups
+
+INDEX_STATIONS_QUERY = """
+    SELECT station_id, name, city, latitude, longitude, is_major
+    FROM stations
+    ORDER BY station_id
+"""
+
+STATIONS_VERSION_QUERY = """
+    SELECT version, changed_at FROM table_versions WHERE table_name = 'stations'
+"""
+
+def unit_vectors(latitude, longitude):
+    """Points on the unit sphere of coordinates in degrees"""
+    lat, lon = np.radians(latitude), np.radians(longitude)
+    return np.column_stack([np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)])
+
+class StationIndex:
+    """KD-tree over station positions plus the station rows it points to"""
+
+    def __init__(self, db_path=DB_PATH):
+        self.db_path = db_path
+        self.version = None
+        self.checked_at = 0.0
+        self.stations = []
+        self.points = np.zeros((0, 2))
+        self.tree = None
+
+    def build(self):
+        """Load the stations and build the tree"""
+        conn = sqlite3.connect(self.db_path)
+        conn.row_factory = sqlite3.Row
+        try:
+            version = conn.execute(STATIONS_VERSION_QUERY).fetchone()
+            stations = [dict(row) for row in conn.execute(INDEX_STATIONS_QUERY)]
+        finally:
+            conn.close()
+
+        points = np.array([[s['latitude'], s['longitude']] for s in stations], dtype=np.float64).reshape(-1, 2)
+        self.tree = KDTree(unit_vectors(points[:, 0], points[:, 1])) if stations else None
+        self.stations, self.points = stations, points
+        self.version = tuple(version) if version else None
+        self.checked_at = time.monotonic()
+        return self
+
+    def stale(self):
+        """True when stations changed since the build"""
+        conn = sqlite3.connect(self.db_path)
+        try:
+            version = conn.execute(STATIONS_VERSION_QUERY).fetchone()
+        finally:
+            conn.close()
+        self.checked_at = time.monotonic()
+        return version != self.version
+
+    def nearest(self, latitude, longitude, k=DEFAULT_K, radius_km=None):
+        """Up to k stations nearest to a point, closest first, with distance_km"""
+        if self.tree is None:
+            return []
+        point = unit_vectors([latitude], [longitude])
+        if radius_km is None:
+            _, indices = self.tree.query(point, k=min(k, len(self.stations)))
+            indices = indices[0]
+        else:
+            # Chord length of an arc of radius_km on the unit sphere
+            chord = 2 * np.sin(min(radius_km / EARTH_RADIUS_KM, np.pi) / 2)
+            indices = self.tree.query_radius(point, r=chord)[0]
+
+        lat, lon = np.radians(self.points[indices, 0]), np.radians(self.points[indices, 1])
+        distances = haversine_km(np.radians(latitude), np.radians(longitude), lat, lon)
+        order = np.argsort(distances, kind='stable')[:k]
+        return [dict(self.stations[indices[i]], distance_km=round(float(distances[i]), 3)) for i in order]
+
+_index = None
+_index_lock = threading.Lock()
+
+def get_station_index(db_path=DB_PATH, max_age=VERSION_CHECK_INTERVAL):
+    """The process-wide index, built on first use and rebuilt when stations change"""
+    global _index
+    with _index_lock:
+        if _index is None or _index.db_path != db_path:
+            _index = StationIndex(db_path).build()
+        elif time.monotonic() - _index.checked_at > max_age and _index.stale():
+            # A new object, so requests holding the old one stay consistent
+            _index = StationIndex(db_path).build()
+        return _index
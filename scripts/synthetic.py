@@ -0,0 +1,118 @@
+"""
+Shared machinery for the vectorized delay and passenger history generators
+
+Every calendar day draws from its own RNG stream, derived from the seed,
+the generator's stream number and the day's ordinal. A day's records
+therefore do not depend on the other days or on the process that
+generated them, so the output is bit-identical for any number of workers
+(and a given date gets the same records whatever the start date).
+"""
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+
+import numpy as np
+
+DEFAULT_SEED = 42
+BASE_DAYS = 180  # history length at --scale 1
+
+DAYS_OF_WEEK = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+
+def day_rng(seed, stream, day):
+    """Independent generator for one stream and calendar day"""
+    return np.random.default_rng(np.random.SeedSequence(seed, spawn_key=(stream, day.toordinal())))
+
+def history_days(scale=1.0):
+    """Days of history for a scale factor"""
+    return max(1, int(round(BASE_DAYS * scale)))
+
+def history_dates(start_date, days):
+    """Dates of a history period starting at start_date (a date or datetime)"""
+    if isinstance(start_date, datetime):
+        start_date = start_date.date()
+    return [start_date + timedelta(days=offset) for offset in range(days)]
+
+def schedule_table(schedules):
+    """Columns of the weekly timetable, plus schedule indices per weekday
+
+    `by_day[d]` lists the schedules of weekday d (Monday=0) in file order;
+    `by_departure[d]` lists the same schedules in departure order.
+    """
+    departure_time = [s['departure_time'] for s in schedules]
+    table = {
+        'schedule_id': np.array([s['schedule_id'] for s in schedules], dtype=np.int64),
+        'route_id': np.array([s['route_id'] for s in schedules], dtype=np.int64),
+        'origin_station_id': np.array([s['origin_station_id'] for s in schedules], dtype=np.int64),
+        'destination_station_id': np.array([s['destination_station_id'] for s in schedules], dtype=np.int64),
+        'departure_minute': np.array([int(t[:2]) * 60 + int(t[3:5]) for t in departure_time], dtype=np.int64),
+        'capacity': np.array([s['capacity'] for s in schedules], dtype=np.int64),
+        'is_boraq': np.array([s['train_type'] == 'Al Boraq' for s in schedules]),
+        'departure_time': departure_time,
+        'train_type': [s['train_type'] for s in schedules],
+        # JSON of the per-schedule fields repeated in every record
+        'trip_json': [
+            f'"schedule_id": {s["schedule_id"]}, "train_number": {json.dumps(s["train_number"], ensure_ascii=False)}, '
+            f'"route_id": {s["route_id"]}, "origin_name": {json.dumps(s["origin_name"], ensure_ascii=False)}, '
+            f'"destination_name": {json.dumps(s["destination_name"], ensure_ascii=False)}'
+            for s in schedules
+        ],
+    }
+
+    weekday = np.array([DAYS_OF_WEEK.index(s['day_of_week']) for s in schedules], dtype=np.int64)
+    table['by_day'] = [np.flatnonzero(weekday == d) for d in range(7)]
+    table['by_departure'] = [idx[np.argsort(table['departure_minute'][idx], kind='stable')]
+                             for idx in table['by_day']]
+    return table
+
+_table = None
+
+def _init_worker(table):
+    global _table
+    _table = table
+
+def _run_day(task):
+    generate_day, seed, stream, day = task
+    return generate_day(_table, day, day_rng(seed, stream, day))
+
+def run_days(generate_day, stream, table, dates, seed=DEFAULT_SEED, workers=1):
+    """Results of generate_day(table, day, rng) for every date, in date order
+
+    `generate_day` must be a module-level function so worker processes can
+    import it. Days are split across `workers` processes (1 runs inline).
+    """
+    tasks = [(generate_day, seed, stream, day) for day in dates]
+
+    if workers <= 1:
+        _init_worker(table)
+        return [_run_day(task) for task in tasks]
+
+    chunksize = max(1, len(tasks) // (workers * 4))
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(table,)) as executor:
+        return list(executor.map(_run_day, tasks, chunksize=chunksize))
+
+def write_records(filename, id_field, day_rows):
+    """Stream per-day lists of record bodies into a JSON array, numbering them
+
+    Each body is the JSON of a record without its leading '{' and id field,
+    which is added here so ids run consecutively across days. Returns the
+    output path and the number of records.
+    """
+    output_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data')
+    os.makedirs(output_dir, exist_ok=True)
+    output_file = os.path.join(output_dir, filename)
+
+    record_id = 0
+    with open(output_file, 'w', encoding='utf-8') as f:
+        f.write('[')
+        for rows in day_rows:
+            if not rows:
+                continue
+            first = record_id + 1
+            f.write(''.join(f'{"," if i > 1 else ""}\n  {{"{id_field}": {i}, {body}'
+                            for i, body in enumerate(rows, start=first)))
+            record_id += len(rows)
+        f.write('\n]\n')
+
+    return output_file, record_id
@@ -0,0 +1,97 @@
+"""
+Test journey planner profiles against earliest-arrival queries
+"""
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+from scripts.journey_planner import JourneyPlanner
+from scripts.synthetic import DAYS_OF_WEEK
+
+# Departure windows (minutes since midnight), including narrow ones whose
+# best journeys are beaten by departures after the window
+WINDOWS = [(0, 1439), (440, 598), (480, 540), (720, 900), (1080, 1200)]
+
+def latest_departure(planner, day, origin, target, minute, arrival):
+    """Latest departure from minute on that still arrives by arrival
+
+    Earliest arrivals never decrease with the departure time, so this is a
+    binary search over earliest_arrival.
+    """
+    low, high = minute, 1439
+    while low < high:
+        middle = (low + high + 1) // 2
+        found = planner.earliest_arrival(day, {origin: middle}, [target])
+        if found is not None and found[0] <= arrival:
+            low = middle
+        else:
+            high = middle - 1
+    return low
+
+def test_profiles():
+    planner = JourneyPlanner().build()
+    n = len(planner.stations)
+
+    print("="*60)
+    print("  Testing Journey Profiles")
+    print("="*60)
+
+    checked = 0
+    errors = []
+    for day in DAYS_OF_WEEK:
+        for origin in range(n):
+            for target in range(n):
+                if origin == target:
+                    continue
+                for start, end in WINDOWS:
+                    journeys = planner.profile(day, [origin], [target], start, end)
+                    # Each journey must be the earliest arrival from its own departure
+                    for departure, arrival, legs in journeys:
+                        found = planner.earliest_arrival(day, {origin: departure}, [target])
+                        checked += 1
+                        if not start <= departure <= end or found is None or found[0] != arrival:
+                            errors.append((day, origin, target, start, end, departure, arrival,
+                                           found and found[0]))
+                        if planner.describe(day, legs)['transfers'] < 0:
+                            errors.append((day, origin, target, 'negative transfers'))
+                    # ...and every departure in the window must be covered by the
+                    # latest journey reaching its earliest arrival, when that
+                    # journey leaves in the window
+                    for minute in range(start, end + 1, 15):
+                        found = planner.earliest_arrival(day, {origin: minute}, [target])
+                        if found is None:
+                            continue
+                        checked += 1
+                        if len(found[2]) == 1 and found[2][0][0] == 'walk':
+                            # A walk-only journey can leave at any minute
+                            expected = (start, start + found[0] - minute)
+                        else:
+                            expected = (latest_departure(planner, day, origin, target, minute, found[0]),
+                                        found[0])
+                            if expected[0] > end:
+                                continue
+                        if expected not in [(departure, arrival) for departure, arrival, _ in journeys]:
+                            errors.append((day, origin, target, start, end, minute, expected))
+
+    # A window whose best journey ties with one leaving after it
+    ids = {station['name']: i for i, station in enumerate(planner.stations)}
+    origin, target = ids['Rabat-Ville'], ids['Marrakech']
+    journeys = planner.profile('Sunday', [origin], [target], 440, 598)
+    found = planner.earliest_arrival('Sunday', {origin: 440}, [target])
+    checked += 1
+    if not journeys or journeys[0][1] != found[0]:
+        errors.append(('Sunday', origin, target, 440, 598, journeys, found[0]))
+
+    status = "[OK]" if not errors else "[FAIL]"
+    print(f"{status} {checked} profile checks, {len(errors)} mismatches")
+    for error in errors[:10]:
+        print(f"  - {error}")
+    assert not errors
+
+    print("\n" + "="*60)
+    print("  [SUCCESS] Journey profiles match earliest arrivals!")
+    print("="*60)
+    print()
+
+if __name__ == "__main__":
+    test_profiles()
@@ -0,0 +1,41 @@
+"""
+Integer time encodings shared by the schema, SQL queries and numpy code
+
+Schedules carry `departure_minute` / `arrival_minute` (minutes since
+midnight) and delays carry `timestamp_epoch` (seconds since 1970-01-01,
+reading the naive ISO timestamp as UTC). All are generated columns in
+schema.sql, so they always match the text columns they come from.
+"""
+import numpy as np
+
+MINUTES_PER_DAY = 24 * 60
+SECONDS_PER_DAY = 24 * 3600
+
+# 1970-01-01 was a Thursday; day numbers follow strftime('%w') (Sunday=0)
+EPOCH_DAY_OF_WEEK = 4
+
+# SQL expressions over delays.timestamp_epoch
+HOUR_SQL = "timestamp_epoch / 3600 % 24"
+DAY_OF_WEEK_SQL = f"(timestamp_epoch / {SECONDS_PER_DAY} + {EPOCH_DAY_OF_WEEK}) % 7"
+
+def minute_of_day(hhmm):
+    """Minutes since midnight of an 'HH:MM' time"""
+    return int(hhmm[:2]) * 60 + int(hhmm[3:5])
+
+def format_minute(minute):
+    """'HH:MM' of minutes since midnight (wrapping past midnight)"""
+    minute = int(minute) % MINUTES_PER_DAY
+    return f"{minute // 60:02d}:{minute % 60:02d}"
+
+def epoch_hour(epoch):
+    """Hour of day (0-23) of epoch seconds"""
+    return np.asarray(epoch, dtype=np.int64) // 3600 % 24
+
+def epoch_day_of_week(epoch):
+    """Day of week (Sunday=0) of epoch seconds"""
+    return (np.asarray(epoch, dtype=np.int64) // SECONDS_PER_DAY + EPOCH_DAY_OF_WEEK) % 7
+
+def epoch_month(epoch):
+    """Month number (1-12) of epoch seconds"""
+    months = np.asarray(epoch, dtype=np.int64).astype('datetime64[s]').astype('datetime64[M]')
+    return months.astype(np.int64) % 12 + 1
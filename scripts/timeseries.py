@@ -0,0 +1,61 @@
+"""
+Bucketing and downsampling of the daily delay aggregates for charts
+
+The API reads per-day totals from delay_daily_stats (kept current by a
+trigger) and this module folds them into day, week (starting Monday) or
+month buckets. When a range holds more buckets than a chart can use,
+consecutive buckets are merged so at most `max_points` remain; counts and
+minutes are summed, so merged points stay exact totals.
+"""
+from datetime import date
+
+BUCKETS = ('day', 'week', 'month')
+DEFAULT_MAX_POINTS = 500
+MAX_POINTS_LIMIT = 5000
+
+def bucket_ordinal(day, bucket):
+    """Consecutive bucket number of an ISO date"""
+    d = date.fromisoformat(day)
+    if bucket == 'day':
+        return d.toordinal()
+    if bucket == 'week':
+        return (d.toordinal() - 1) // 7   # ordinal 1 (0001-01-01) was a Monday
+    return d.year * 12 + d.month - 1
+
+def bucket_start(ordinal, bucket):
+    """ISO date a bucket number starts on"""
+    if bucket == 'day':
+        return date.fromordinal(ordinal).isoformat()
+    if bucket == 'week':
+        return date.fromordinal(ordinal * 7 + 1).isoformat()
+    return date(ordinal // 12, ordinal % 12 + 1, 1).isoformat()
+
+def delay_timeseries(rows, bucket='day', max_points=DEFAULT_MAX_POINTS):
+    """Chart points from (day, delay_count, total_minutes, max_delay) rows in day order
+
+    Returns (points, span) where span is the number of buckets merged into
+    each point.
+    """
+    if not rows:
+        return [], 1
+
+    ordinals = [bucket_ordinal(row[0], bucket) for row in rows]
+    first = ordinals[0]
+    span = max(1, -(-(ordinals[-1] - first + 1) // max_points))
+
+    points = []
+    for ordinal, (_, count, total, longest) in zip(ordinals, rows):
+        period = first + (ordinal - first) // span * span
+        if points and points[-1]['ordinal'] == period:
+            point = points[-1]
+            point['delay_count'] += count
+            point['total_delay_minutes'] += total
+            point['max_delay'] = max(point['max_delay'], longest)
+        else:
+            points.append({'ordinal': period, 'delay_count': count,
+                           'total_delay_minutes': total, 'max_delay': longest})
+
+    for point in points:
+        point['period'] = bucket_start(point.pop('ordinal'), bucket)
+        point['avg_delay'] = round(point['total_delay_minutes'] / point['delay_count'], 2)
+    return points, span
@@ -9,53 +9,93 @@ from sklearn.model_selection import train_test_split, cross_val_score
 from sklearn.preprocessing import LabelEncoder
 from sklearn.metrics import accuracy_score, classification_report, mean_absolute_error
 import joblib
+import argparse
+import hashlib
+import inspect
 import os
+import sys
 from datetime import datetime
 
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scripts.benchmark_models import run_benchmark
+from scripts.features import FEATURE_COLUMNS, transform_batch, train_type_codes
+from scripts.delay_quantiles import fit_leaf_quantiles, predict_quantiles, quantile_labels
+from scripts.partitions import partition_source
+from scripts.snapshots import SNAPSHOT_DIR, snapshot_frame
+from scripts.timecodes import epoch_hour, epoch_day_of_week, epoch_month
+
 DB_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'database', 'marocrail.db')
 MODEL_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'models')
+CACHE_DIR = os.path.join(MODEL_DIR, 'feature_cache')
+
+# Columns kept in the cached feature matrix (features + route + training target)
+CACHED_COLUMNS = FEATURE_COLUMNS + ['route_id', 'delay_minutes']
 
-def load_training_data():
-    """Load and join data from database"""
+# Columns of the delays snapshot matching the load_training_data query
+SNAPSHOT_COLUMNS = ['delay_id', 'delay_minutes', 'delay_reason', 'weather_condition', 'hour',
+                    'day_of_week', 'month', 'departure_time', 'platform', 'train_type',
+                    'capacity', 'route_id', 'distance_km', 'typical_duration_minutes',
+                    'origin_station_id', 'destination_station_id']
+
+def load_training_data(since=None):
+    """Load and join data from database, optionally only delays since a date"""
     conn = sqlite3.connect(DB_PATH)
     
-    query = """
+    # Monthly partitions before `since` are not read at all
+    source, params = partition_source(conn, 'delays', start=since)
+    
+    query = f"""
     SELECT 
         d.delay_id,
         d.delay_minutes,
         d.delay_reason,
         d.weather_condition,
-        strftime('%H', d.timestamp) as hour,
-        strftime('%w', d.timestamp) as day_of_week,
-        strftime('%m', d.timestamp) as month,
+        d.timestamp_epoch,
         s.departure_time,
         s.platform,
         t.train_type,
         t.capacity,
+        r.route_id,
         r.distance_km,
         r.typical_duration_minutes,
         r.origin_station_id,
         r.destination_station_id
-    FROM delays d
+    FROM {source} d
     JOIN schedules s ON d.schedule_id = s.schedule_id
     JOIN trains t ON s.train_id = t.train_id
     JOIN routes r ON s.route_id = r.route_id
     """
     
-    df = pd.read_sql_query(query, conn)
+    df = pd.read_sql_query(query, conn, params=params)
     conn.close()
     
+    # Calendar fields by integer arithmetic on epoch seconds
+    epoch = df.pop('timestamp_epoch').to_numpy()
+    df['hour'] = epoch_hour(epoch)
+    df['day_of_week'] = epoch_day_of_week(epoch)
+    df['month'] = epoch_month(epoch)
+    
     print(f"[OK] Loaded {len(df)} delay records for training")
     return df
 
+def load_snapshot_data(since=None):
+    """Same rows as load_training_data, read from the memory-mapped delays snapshot"""
+    df = snapshot_frame('delays', SNAPSHOT_COLUMNS + ['timestamp'])
+    if since:
+        df = df[df['timestamp'] >= np.datetime64(since)]
+    df = df.drop(columns='timestamp').reset_index(drop=True)
+    
+    print(f"[OK] Loaded {len(df)} delay records from the snapshot")
+    return df
+
 def calculate_route_delay_stats(df):
     """Calculate historical delay stats per route"""
-    route_stats = df.groupby(['origin_station_id', 'destination_station_id']).agg({
+    route_stats = df.groupby('route_id').agg({
         'delay_minutes': ['mean', 'std', 'count']
     }).reset_index()
     
-    route_stats.columns = ['origin_station_id', 'destination_station_id', 
-                           'route_avg_delay', 'route_std_delay', 'route_delay_count']
+    route_stats.columns = ['route_id', 'route_avg_delay', 'route_std_delay', 'route_delay_count']
     
     return route_stats
 
@@ -65,65 +105,120 @@ def engineer_features(df):
     
     # Time features
     df['hour'] = df['hour'].astype(int)
-    df['day_of_week'] = df['day_of_week'].astype(int)
+    df['day_of_week'] = df['day_of_week'].astype(int)  # Sunday=0, Saturday=6
     df['month'] = df['month'].astype(int)
-    df['is_peak_hour'] = ((df['hour'] >= 6) & (df['hour'] <= 9)) | ((df['hour'] >= 17) & (df['hour'] <= 20))
-    df['is_weekend'] = df['day_of_week'].isin([0, 6])  # Sunday=0, Saturday=6
-    
-    # Weather binary flags
-    for weather in ['cloudy', 'foggy', 'hot', 'rainy', 'sunny']:
-        df[f'weather_{weather}'] = (df['weather_condition'] == weather).astype(int)
     
     # Train type encoding
-    train_type_map = {'Al Boraq': 3, 'TNR': 2, 'Regular': 1}
-    df['train_type_code'] = df['train_type'].map(train_type_map)
+    df['train_type_code'] = train_type_codes(df['train_type'])
     
     # Route stats
     route_stats = calculate_route_delay_stats(df)
-    df = df.merge(route_stats, on=['origin_station_id', 'destination_station_id'], how='left')
+    df = df.merge(route_stats, on='route_id', how='left')
     df['route_avg_delay'] = df['route_avg_delay'].fillna(df['delay_minutes'].mean())
     df['route_std_delay'] = df['route_std_delay'].fillna(0)
     
-    # Season
-    df['season'] = df['month'].apply(lambda m: 
-        'winter' if m in [12, 1, 2] else
-        'spring' if m in [3, 4, 5] else
-        'summer' if m in [6, 7, 8] else 'autumn'
-    )
-    for season in ['autumn', 'spring', 'summer', 'winter']:
-        df[f'season_{season}'] = (df['season'] == season).astype(int)
+    # Flags, weather and season via the shared transformer
+    features = pd.DataFrame(transform_batch(df), columns=FEATURE_COLUMNS)
+    features['route_id'] = df['route_id'].to_numpy()
+    features['delay_minutes'] = df['delay_minutes'].to_numpy()
     
-    return df
+    return features
+
+def route_stats_from_features(df):
+    """Per-route delay stats in the form used at prediction time"""
+    stats = df.groupby('route_id')[['route_avg_delay', 'route_std_delay']].first()
+    
+    return {
+        'routes': {int(route_id): (float(row['route_avg_delay']), float(row['route_std_delay']))
+                   for route_id, row in stats.iterrows()},
+        'default': (float(df['delay_minutes'].mean()), 0.0)
+    }
+
+def database_fingerprint(db_path=DB_PATH):
+    """Identify the current database contents by file size and mtime"""
+    parts = []
+    for path in [db_path, db_path + '-wal']:
+        if os.path.exists(path):
+            stat = os.stat(path)
+            parts.append(f"{os.path.basename(path)}:{stat.st_size}:{stat.st_mtime_ns}")
+    return '|'.join(parts)
+
+def snapshot_fingerprint(snapshot_dir=SNAPSHOT_DIR):
+    """Identify the current delays snapshot by its manifest"""
+    stat = os.stat(os.path.join(snapshot_dir, 'delays', 'manifest.json'))
+    return f"snapshot:{stat.st_size}:{stat.st_mtime_ns}"
+
+def feature_code_hash():
+    """Hash of the feature pipeline source code"""
+    sources = [inspect.getsource(fn) for fn in
+               (load_training_data, load_snapshot_data, calculate_route_delay_stats,
+                engineer_features)]
+    sources.append(inspect.getsource(sys.modules[transform_batch.__module__]))
+    sources.append(repr(CACHED_COLUMNS))
+    return hashlib.sha256('\n'.join(sources).encode('utf-8')).hexdigest()
+
+def feature_cache_key(db_path=DB_PATH, since=None, snapshot=False):
+    """Cache key combining data version, date range and feature code version"""
+    data_version = snapshot_fingerprint() if snapshot else database_fingerprint(db_path)
+    key = f"{data_version}|{since}|{feature_code_hash()}"
+    return hashlib.sha256(key.encode('utf-8')).hexdigest()[:16]
+
+def load_feature_matrix(use_cache=True, since=None, snapshot=False):
+    """Load engineered features, reusing a memory-mapped cache when valid"""
+    cache_key = feature_cache_key(since=since, snapshot=snapshot)
+    cache_file = os.path.join(CACHE_DIR, f"features-{cache_key}.npy")
+    
+    if use_cache and os.path.exists(cache_file):
+        matrix = np.load(cache_file, mmap_mode='r')
+        print(f"[OK] Reusing cached features ({matrix.shape[0]} rows): {cache_file}")
+        return pd.DataFrame(matrix, columns=CACHED_COLUMNS, copy=False)
+    
+    df = load_snapshot_data(since) if snapshot else load_training_data(since)
+    
+    print("\n[INFO] Engineering features...")
+    df = engineer_features(df)
+    print(f"[OK] Created {len(FEATURE_COLUMNS)} features")
+    
+    matrix = df[CACHED_COLUMNS].to_numpy(dtype=np.float64)
+    
+    if use_cache:
+        save_feature_cache(matrix, cache_file)
+        matrix = np.load(cache_file, mmap_mode='r')
+    
+    return pd.DataFrame(matrix, columns=CACHED_COLUMNS, copy=False)
+
+def save_feature_cache(matrix, cache_file):
+    """Write the feature matrix atomically and drop stale cache entries"""
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    
+    tmp_file = cache_file + '.tmp.npy'
+    np.save(tmp_file, matrix)
+    os.replace(tmp_file, cache_file)
+    
+    for filename in os.listdir(CACHE_DIR):
+        path = os.path.join(CACHE_DIR, filename)
+        if filename.startswith('features-') and path != cache_file:
+            os.remove(path)
+    
+    print(f"[OK] Cached features: {cache_file}")
 
 def prepare_classification_data(df):
     """Prepare data for delay classification (will it delay?)"""
-    feature_cols = [
-        'hour', 'day_of_week', 'month', 'is_peak_hour', 'is_weekend',
-        'weather_cloudy', 'weather_foggy', 'weather_hot', 'weather_rainy', 'weather_sunny',
-        'train_type_code', 'capacity', 'distance_km', 'typical_duration_minutes',
-        'route_avg_delay', 'route_std_delay',
-        'season_autumn', 'season_spring', 'season_summer', 'season_winter'
-    ]
+    feature_cols = FEATURE_COLUMNS
     
-    X = df[feature_cols].fillna(0)
-    y = (df['delay_minutes'] > 5).astype(int)  # Delay if >5 minutes
+    X = df[feature_cols].to_numpy()
+    y = (df['delay_minutes'] > 5).astype(int).to_numpy()  # Delay if >5 minutes
     
     return X, y, feature_cols
 
 def prepare_regression_data(df):
     """Prepare data for delay duration prediction"""
-    delayed_df = df[df['delay_minutes'] > 5].copy()
+    delayed_df = df[df['delay_minutes'] > 5]
     
-    feature_cols = [
-        'hour', 'day_of_week', 'month', 'is_peak_hour', 'is_weekend',
-        'weather_cloudy', 'weather_foggy', 'weather_hot', 'weather_rainy', 'weather_sunny',
-        'train_type_code', 'capacity', 'distance_km', 'typical_duration_minutes',
-        'route_avg_delay', 'route_std_delay',
-        'season_autumn', 'season_spring', 'season_summer', 'season_winter'
-    ]
+    feature_cols = FEATURE_COLUMNS
     
-    X = delayed_df[feature_cols].fillna(0)
-    y = delayed_df['delay_minutes']
+    X = delayed_df[feature_cols].to_numpy()
+    y = delayed_df['delay_minutes'].to_numpy()
     
     return X, y, feature_cols
 
@@ -169,7 +264,16 @@ def train_regressor(X, y):
     
     print(f"[OK] Regressor trained - MAE: {mae:.2f} minutes")
     
-    return reg, X_test, y_test, y_pred
+    # Per-leaf delay distributions for quantile predictions
+    quantile_model = fit_leaf_quantiles(reg, X_train, y_train)
+    predicted = predict_quantiles(reg, quantile_model, X_test)
+    coverage = ', '.join(
+        f"{label} {np.mean(y_test <= predicted[:, j + 1]):.0%}"
+        for j, label in enumerate(quantile_labels(quantile_model))
+    )
+    print(f"[OK] Quantile model built - Coverage: {coverage}")
+    
+    return reg, quantile_model, X_test, y_test, y_pred
 
 def evaluate_model(clf, X_test, y_test, y_pred):
     """Print detailed evaluation"""
@@ -191,26 +295,36 @@ def feature_importance(model, feature_names):
     for idx, row in importance.head(10).iterrows():
         print(f"  {row['feature']:30s} {row['importance']:.4f}")
 
-def save_models(clf, reg, feature_cols):
+def save_models(clf, reg, quantile_model, feature_cols, route_stats):
     """Save trained models"""
     os.makedirs(MODEL_DIR, exist_ok=True)
     
     joblib.dump(clf, os.path.join(MODEL_DIR, 'delay_classifier.pkl'))
     joblib.dump(reg, os.path.join(MODEL_DIR, 'delay_regressor.pkl'))
+    joblib.dump(quantile_model, os.path.join(MODEL_DIR, 'delay_quantiles.pkl'))
     joblib.dump(feature_cols, os.path.join(MODEL_DIR, 'feature_columns.pkl'))
+    joblib.dump(route_stats, os.path.join(MODEL_DIR, 'route_stats.pkl'))
     
     print(f"\n[OK] Models saved to {MODEL_DIR}")
 
-def main():
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Train the MarocRail delay models")
+    parser.add_argument('--no-cache', dest='use_cache', action='store_false',
+                        help="rebuild the engineered features instead of reusing the cache")
+    parser.add_argument('--since', metavar='YYYY-MM-DD',
+                        help="only train on delays from this date on")
+    parser.add_argument('--snapshot', action='store_true',
+                        help="read delays from the columnar snapshot (scripts/snapshots.py)")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    
     print("="*60)
     print("  MarocRail-Optimizer - ML Model Training")
     print("="*60)
     
-    df = load_training_data()
-    
-    print("\n[INFO] Engineering features...")
-    df = engineer_features(df)
-    print(f"[OK] Created {len(df.columns)} features")
+    df = load_feature_matrix(use_cache=args.use_cache, since=args.since, snapshot=args.snapshot)
     
     # Classification model
     print("\n[STEP 1/2] Training delay classifier...")
@@ -222,9 +336,13 @@ def main():
     # Regression model
     print("\n[STEP 2/2] Training delay duration predictor...")
     X_reg, y_reg, _ = prepare_regression_data(df)
-    reg, X_test_reg, y_test_reg, y_pred_reg = train_regressor(X_reg, y_reg)
+    reg, quantile_model, X_test_reg, y_test_reg, y_pred_reg = train_regressor(X_reg, y_reg)
+    
+    save_models(clf, reg, quantile_model, feature_cols, route_stats_from_features(df))
     
-    save_models(clf, reg, feature_cols)
+    # Serving cost of the freshly saved models
+    print("\n[INFO] Benchmarking saved models...")
+    run_benchmark(sample=X_test_clf)
     
     print("\n" + "="*60)
     print("  [SUCCESS] Model training complete!")
@@ -40,6 +40,7 @@ const translations = {
         delaysByReason: "Delays by Reason",
         delaysByHour: "Delays by Hour of Day",
         delaysByWeather: "Delays by Weather Condition",
+        delaysOverTime: "Delays over Time",
         
         // Predict
         delayPrediction: "Delay Prediction",
@@ -135,6 +136,7 @@ const translations = {
         delaysByReason: "Retards par raison",
         delaysByHour: "Retards par heure de la journée",
         delaysByWeather: "Retards par condition météorologique",
+        delaysOverTime: "Évolution des retards",
         
         // Predict
         delayPrediction: "Prédiction de retard",